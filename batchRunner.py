@@ -0,0 +1,184 @@
+import sys
+import time
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from evacSim import loadRoadNetwork, Simulation, NUM_SIMULATIONS
+from networkCache import loadCompiledNetwork
+
+# Road network of the worker process; set once per worker by initWorker
+workerNetwork = None
+
+"""
+Method to create independent, reproducible seeds for a batch of replications.
+Replication i always gets the same seed for a given base seed, no matter how
+many workers run the batch or in which order they pick replications up.
+baseSeed        - seed for the whole batch
+numReplications - number of seeds to create
+return          - list of integer seeds
+"""
+def replicationSeeds(baseSeed, numReplications):
+    children = np.random.SeedSequence(baseSeed).spawn(numReplications)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+"""
+Method to give what a worker needs to get the road network: the directory of a
+compiled network, which every worker maps in without copying, or the network
+itself when it was not loaded from one.
+network - compiled RoadNetwork
+return  - compiled network directory or RoadNetwork
+"""
+def workerNetworkHandle(network):
+    return network.compiledPath or network
+
+"""
+Method run once in every worker process to keep a reference to the shared road
+network, so it is handed over once per worker instead of once per replication.
+network - compiled network directory or RoadNetwork (see workerNetworkHandle)
+return  - None
+"""
+def initWorker(network):
+    global workerNetwork
+    if isinstance(network, str):
+        network = loadCompiledNetwork(network)
+    workerNetwork = network
+
+"""
+Method to summarize one finished replication into the small record that is
+sent back to the parent process.
+seed    - seed the replication was run with
+results - SimulationResults of the replication
+return  - dictionary summary of the replication
+"""
+def replicationSummary(seed, results):
+    cars = results.cars.asNumpy()
+    exited = ~np.isnan(cars['exitTime'])
+    return {'seed': seed,
+            'simulationTime': results.simulationTime,
+            'meanEvacuationTime': float(np.mean(
+                cars['exitTime'][exited] - cars['departureTime'][exited]))
+                if exited.any() else float('nan'),
+            'eventCount': results.eventCount,
+            'carsExited': results.carsExited(),
+            'exitCount': dict(results.exitCount),
+            'remainingEvents': results.remainingEvents,
+            'waitingCars': results.waitingCars,
+            'stopReason': results.livelock['stopReason']
+                          if results.livelock else None,
+            'stuckCars': results.livelock['stuckCars']
+                         if results.livelock else None}
+
+"""
+Method run in a worker to simulate one replication on the worker's network.
+job    - (runMethod, parkingCapacity, numSimulations, seed, options) where
+         options is a dictionary of extra Simulation keyword arguments
+return - dictionary summary of the replication
+"""
+def runReplication(job):
+    runMethod, parkingCapacity, numSimulations, seed, options = job
+    simulation = Simulation(workerNetwork, runMethod, parkingCapacity,
+                            numSimulations, seed=seed, **options)
+    return replicationSummary(seed, simulation.run())
+
+"""
+Method to aggregate replication summaries into batch statistics.
+summaries - list of replication summaries from runReplication
+return    - dictionary of mean, standard deviation, min, max and 95% confidence
+            half width for each measure, plus mean cars per exit
+"""
+def summarizeReplications(summaries):
+    statistics = {'replications': len(summaries)}
+    for measure in ['simulationTime', 'meanEvacuationTime', 'eventCount',
+                    'carsExited', 'remainingEvents', 'waitingCars']:
+        values = np.array([summary[measure] for summary in summaries],
+                          dtype=float)
+        deviation = values.std(ddof=1) if len(values) > 1 else 0.0
+        statistics[measure] = {
+            'mean': float(values.mean()),
+            'std': float(deviation),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'ci95': float(1.96 * deviation / np.sqrt(len(values)))}
+    exits = summaries[0]['exitCount'] if summaries else {}
+    statistics['meanExitCount'] = dict(
+        (exitPoint, float(np.mean([summary['exitCount'][exitPoint]
+                                   for summary in summaries])))
+        for exitPoint in exits)
+    return statistics
+
+"""
+Method to run a batch of replications of one scenario across a process pool.
+The road network is compiled once in the calling process and shared with the
+workers.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+numReplications - number of replications to run
+numSimulations  - maximum number of events per replication
+baseSeed        - seed the replication seeds are derived from
+workers         - number of worker processes; None for one per core
+options         - dictionary of extra Simulation keyword arguments
+                  (e.g. {'waitMode': 'wakeup'})
+return          - list of replication summaries in replication order
+"""
+def runBatch(network, runMethod, parkingCapacity, numReplications,
+             numSimulations=NUM_SIMULATIONS, baseSeed=0, workers=None,
+             options=None):
+    seeds = replicationSeeds(baseSeed, numReplications)
+    jobs = [(runMethod, parkingCapacity, numSimulations, seed, options or {})
+            for seed in seeds]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # Run in process when there is nothing to fan out
+    if workers == 1:
+        initWorker(network)
+        return [runReplication(job) for job in jobs]
+
+    chunkSize = max(1, numReplications // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                             initargs=(workerNetworkHandle(network),)) \
+            as executor:
+        return list(executor.map(runReplication, jobs, chunksize=chunkSize))
+
+
+def main():
+    args = sys.argv
+    if len(args) < 6 or len(args) > 9:
+        print("Incorrect number of arguments - Format-> python batchRunner.py "
+              "world2.csv [police, noWest, random] [0.005-1.00] "
+              "[# of simulations] [# of replications] [# of workers] [seed] "
+              "[report, terminate, or steer (optional)]")
+        exit(0)
+
+    mapFile = args[1]
+    runMethod = args[2]
+    parkingCapacity = float(args[3])
+    numSimulations = int(args[4])
+    numReplications = int(args[5])
+    workers = int(args[6]) if len(args) > 6 else None
+    baseSeed = int(args[7]) if len(args) > 7 else 0
+    options = {'livelockPolicy': args[8]} if len(args) > 8 else None
+
+    network = loadRoadNetwork(mapFile)
+    start = time.time()
+    summaries = runBatch(network, runMethod, parkingCapacity, numReplications,
+                         numSimulations, baseSeed, workers, options)
+    wallTime = time.time() - start
+    statistics = summarizeReplications(summaries)
+
+    print("Replications:", statistics['replications'])
+    print("Wall Time:", wallTime)
+    for measure in ['simulationTime', 'eventCount', 'carsExited']:
+        print(measure + ":", "mean %g +/- %g (min %g, max %g)" % (
+            statistics[measure]['mean'], statistics[measure]['ci95'],
+            statistics[measure]['min'], statistics[measure]['max']))
+    print("Mean exit car counts:", statistics['meanExitCount'])
+    if options:
+        stopReasons = [summary['stopReason'] for summary in summaries]
+        print("Stop reasons:", dict((reason, stopReasons.count(reason))
+                                    for reason in set(stopReasons)))
+        print("Stuck cars:", sum(summary['stuckCars'] for summary in summaries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import sys
+import time
+from evacSim import loadRoadNetwork, Simulation
+
+# Event list set ups compared: (name, eventList, lazyRelease, bucket seconds)
+BENCHMARK_EVENT_LISTS = [('heap', 'heap', False, None),
+                         ('heap+lazy', 'heap', True, None),
+                         ('calendar0.1+lazy', 'calendar', True, 0.1),
+                         ('calendar0.25', 'calendar', False, 0.25),
+                         ('calendar0.25+lazy', 'calendar', True, 0.25),
+                         ('calendar1+lazy', 'calendar', True, 1.0)]
+BENCHMARK_REPEATS = 3
+BENCHMARK_SEED = 0 # every set up and repeat runs this seed
+
+"""
+Method to time the simulation with every event list set up on one scenario.
+Every run of every set up uses the same seed, so all of them process the same
+events (checked by their event counts and end times); the best of the repeats is kept to
+damp timer noise.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+numSimulations  - maximum number of events per run
+repeats         - number of timed runs per set up
+setups          - list of (name, eventList, lazyRelease, bucket seconds)
+seed            - seed of every run
+return          - list of (name, events, best seconds, events per second)
+"""
+def benchmarkEventLists(network, runMethod, parkingCapacity, numSimulations,
+                        repeats=BENCHMARK_REPEATS,
+                        setups=BENCHMARK_EVENT_LISTS, seed=BENCHMARK_SEED):
+    rows = []
+    expected = None
+    for name, eventList, lazyRelease, bucketSeconds in setups:
+        options = {'eventList': eventList, 'lazyRelease': lazyRelease,
+                   'pathSampleEvery': 0}
+        if bucketSeconds is not None:
+            options['eventBucketSeconds'] = bucketSeconds
+        best = None
+        for repeat in range(repeats):
+            simulation = Simulation(network, runMethod, parkingCapacity,
+                                    numSimulations, seed=seed, **options)
+            start = time.perf_counter()
+            results = simulation.run()
+            wall = time.perf_counter() - start
+            # A capped run always counts numSimulations events, so its end
+            # time is compared too
+            outcome = (results.eventCount, results.simulationTime)
+            if expected is None:
+                expected = outcome
+            if outcome != expected:
+                raise ValueError("%s processed %d events up to %g s, not the "
+                                 "%d events up to %g s of the first set up; "
+                                 "the timings would not be comparable"
+                                 % ((name,) + outcome + expected))
+            if best is None or wall < best:
+                best = wall
+        rows.append((name, expected[0], best, expected[0] / best))
+    return rows
+
+
+def main():
+    args = sys.argv
+    if len(args) < 5 or len(args) > 6:
+        print("Incorrect number of arguments - Format-> python "
+              "benchmarkEventLists.py world2.csv [police, noWest, random] "
+              "[0.005-1.00] [# of simulations] [# of repeats (optional)]")
+        exit(0)
+
+    network = loadRoadNetwork(args[1])
+    repeats = int(args[5]) if len(args) > 5 else BENCHMARK_REPEATS
+    rows = benchmarkEventLists(network, args[2], float(args[3]), int(args[4]),
+                               repeats)
+    baseline = rows[0][3]
+    print("eventList,events,seconds,eventsPerSecond,speedup")
+    for name, events, seconds, rate in rows:
+        print("%s,%d,%.3f,%.0f,%.2f" % (name, events, seconds, rate,
+                                        rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
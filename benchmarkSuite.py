@@ -0,0 +1,180 @@
+import sys
+import time
+import json
+import platform
+import tracemalloc
+import numpy as np
+from evacSim import (loadRoadNetwork, createQueuingCapacityDict, Simulation,
+                     networkExits)
+from worldGenerator import generateWorld, worldGraph
+
+# Fixed seed workloads: every scenario at every fill on every map
+BENCHMARK_SCENARIOS = ['police', 'noWest', 'random']
+BENCHMARK_FILLS = [0.005, 0.1, 0.5, 1.0]
+BENCHMARK_GRID_SIZES = [10, 20, 40] # synthetic grid maps, nodes per side
+BENCHMARK_EVENT_CAP = 200000 # random runs never end on their own
+BENCHMARK_SEED = 0
+BENCHMARK_REPEATS = 3
+BENCHMARK_WORLD = 'world2.csv'
+
+"""
+Method to list the benchmark maps: the campus world file and synthetic grids
+of growing size from worldGenerator (exits at the four corners).
+gridSizes - intersections per side of every synthetic grid
+worldFile - world file to include; None to leave it out
+return    - list of (map name, RoadNetwork, exit list)
+"""
+def benchmarkMaps(gridSizes=BENCHMARK_GRID_SIZES, worldFile=BENCHMARK_WORLD):
+    maps = []
+    if worldFile:
+        network = loadRoadNetwork(worldFile, cacheDir=None)
+        maps.append((worldFile, network, networkExits(network)))
+    for size in gridSizes:
+        world = generateWorld('grid', size * size, seed=BENCHMARK_SEED)
+        intersections, parkingLots = worldGraph(world)
+        maps.append(('grid%dx%d' % (size, size),
+                     createQueuingCapacityDict(intersections, parkingLots,
+                                               exits=world.exits),
+                     world.exits))
+    return maps
+
+"""
+Method to time one fixed seed workload.  The run is repeated and the fastest
+wall time kept, since the machine only ever adds noise; peak memory comes from
+one extra run under tracemalloc (which slows a run down, so it is never timed).
+network         - compiled RoadNetwork
+exitList        - list of (x,y) exit locations of the map
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+numSimulations  - event cap
+seed            - seed of every run
+repeats         - number of timed runs
+measureMemory   - also measure peak traced memory
+return          - dictionary of the workload's measurements
+"""
+def runWorkload(network, exitList, runMethod, parkingCapacity,
+                numSimulations=BENCHMARK_EVENT_CAP, seed=BENCHMARK_SEED,
+                repeats=BENCHMARK_REPEATS, measureMemory=True):
+    options = {'exitList': exitList, 'seed': seed, 'pathSampleEvery': 0}
+    wallTimes = []
+    for repeat in range(repeats):
+        simulation = Simulation(network, runMethod, parkingCapacity,
+                                numSimulations, **options)
+        start = time.perf_counter()
+        results = simulation.run()
+        wallTimes.append(time.perf_counter() - start)
+
+    peakMemory = None
+    if measureMemory:
+        tracemalloc.start()
+        Simulation(network, runMethod, parkingCapacity, numSimulations,
+                   **options).run()
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    wallTime = min(wallTimes)
+    return {'runMethod': runMethod,
+            'parkingCapacity': parkingCapacity,
+            'cars': results.cars.numCars,
+            'events': results.eventCount,
+            'wallTime': wallTime,
+            'wallTimes': wallTimes,
+            'eventsPerSecond': results.eventCount / wallTime,
+            'peakMemoryBytes': peakMemory,
+            'simulationTime': results.simulationTime,
+            'carsExited': results.carsExited()}
+
+"""
+Method to run the whole benchmark grid.
+maps          - list of (map name, RoadNetwork, exit list), see benchmarkMaps
+runMethods    - list of scenarios
+fills         - list of parking lot fill fractions
+repeats       - timed runs per workload
+measureMemory - also measure peak memory of every workload
+return        - benchmark report dictionary, ready to be saved as JSON
+"""
+def runBenchmarks(maps, runMethods=BENCHMARK_SCENARIOS, fills=BENCHMARK_FILLS,
+                  repeats=BENCHMARK_REPEATS, measureMemory=True):
+    workloads = []
+    for mapName, network, exits in maps:
+        for runMethod in runMethods:
+            for fill in fills:
+                workload = runWorkload(network, exits, runMethod, fill,
+                                       repeats=repeats,
+                                       measureMemory=measureMemory)
+                workload['map'] = mapName
+                workload['nodes'] = network.numNodes()
+                workload['edges'] = network.numEdges()
+                workloads.append(workload)
+                print("%-12s %-7s %5g: %8d events %9.0f events/s" % (
+                    mapName, runMethod, fill, workload['events'],
+                    workload['eventsPerSecond']))
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'processor': platform.processor(),
+            'eventCap': BENCHMARK_EVENT_CAP,
+            'seed': BENCHMARK_SEED,
+            'workloads': workloads}
+
+"""
+Method to compare a benchmark report with an earlier one, workload by
+workload.
+report   - benchmark report dictionary
+baseline - earlier benchmark report dictionary
+return   - list of (map, scenario, fill, events/s speedup, peak memory ratio)
+"""
+def compareReports(report, baseline):
+    earlier = dict(((workload['map'], workload['runMethod'],
+                     workload['parkingCapacity']), workload)
+                   for workload in baseline['workloads'])
+    rows = []
+    for workload in report['workloads']:
+        key = (workload['map'], workload['runMethod'],
+               workload['parkingCapacity'])
+        if key not in earlier:
+            continue
+        before = earlier[key]
+        memoryRatio = None
+        if workload['peakMemoryBytes'] and before['peakMemoryBytes']:
+            memoryRatio = workload['peakMemoryBytes'] / \
+                before['peakMemoryBytes']
+        rows.append(key + (workload['eventsPerSecond'] /
+                           before['eventsPerSecond'], memoryRatio))
+    return rows
+
+
+def main():
+    args = sys.argv
+    if len(args) < 2 or len(args) > 4:
+        print("Incorrect number of arguments - Format-> python "
+              "benchmarkSuite.py [output.json] [baseline.json (optional)] "
+              "[quick (optional)]")
+        exit(0)
+
+    outputFile = args[1]
+    baselineFile = args[2] if len(args) > 2 and args[2] != 'quick' else None
+    quick = args[-1] == 'quick'
+    if quick:
+        # Fewer fills, no memory pass and the two smaller grids only; still
+        # best of BENCHMARK_REPEATS, single runs are too noisy to compare
+        report = runBenchmarks(benchmarkMaps(BENCHMARK_GRID_SIZES[:2]),
+                               fills=[0.1, 1.0], measureMemory=False)
+    else:
+        report = runBenchmarks(benchmarkMaps())
+    with open(outputFile, 'w') as reportFile:
+        json.dump(report, reportFile, indent=2)
+    print("Report:", outputFile)
+
+    if baselineFile:
+        with open(baselineFile, 'r') as reportFile:
+            baseline = json.load(reportFile)
+        print("map,scenario,fill,speedup,peakMemoryRatio")
+        for row in compareReports(report, baseline):
+            print("%s,%s,%g,%.2f,%s" % (row[:4] + (
+                '' if row[4] is None else '%.2f' % row[4],)))
+
+
+if __name__ == '__main__':
+    main()
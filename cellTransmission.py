@@ -0,0 +1,230 @@
+import sys
+import numpy as np
+from evacSim import (loadRoadNetwork, SCALE, X_MEAN_PARKING,
+                     AVERAGE_CAR_SPEED_FTS, POLICE_ROUTING, networkExits)
+
+FLOW_TIME_STEP = 1.0 # seconds per flow step
+FLOW_MAX_TIME = 20000.0 # seconds before a run is cut off
+FLOW_CLEARED = 0.5 # vehicles left in the system that count as cleared
+FLOW_ROOM = 1e-9 # free room below this counts as a full segment
+FLOW_ROUNDS = 5 # move rounds per step, so room freed in a step is used in it
+
+
+"""
+Results of a cell transmission run.
+clearanceTime    - time the system dropped below FLOW_CLEARED vehicles, or the
+                   cut off time
+exitCounts       - vehicles out through each exit, in exitList order
+vehiclesRemaining - vehicles still in the lots or on the roads at the end
+steps            - number of flow steps the run took
+inSystem         - vehicles in the lots or on the roads after every step
+"""
+class CellTransmissionResults(object):
+    def __init__(self, clearanceTime, exitCounts, vehiclesRemaining, steps,
+                 inSystem):
+        self.clearanceTime = clearanceTime
+        self.exitCounts = exitCounts
+        self.vehiclesRemaining = vehiclesRemaining
+        self.steps = steps
+        self.inSystem = inSystem
+
+
+"""
+Flow based (mesoscopic) evacuation model.  Instead of following cars, the state
+is the number of vehicles on each road segment, and every step moves vehicles
+across all intersections at once:
+- a segment can hold calculateRoadCapacity vehicles and receives up to its free
+  room;
+- vehicles that get onto a segment cross it in the calcTravelTime of the
+  event engine (free room left behind them * car size / average speed) and
+  are ready to leave it from then on, so a segment's load is out within its
+  travel time unless the segments ahead are full; the flow still crossing is
+  kept in a ring of per step arrival slots, as long as the longest crossing;
+- vehicles move in up to FLOW_ROUNDS rounds per step, and flow that crosses
+  a nearly full segment in under a step is ready for the next round, so a
+  queue moves up into room freed in the same step as in the event engine
+  instead of one segment per step;
+- at the end of a segment the sending flow is split over the scenario's options
+  that still have room (police: all to the best ranked one; noWest and random:
+  evenly), and when more flow wants a segment than it can receive every
+  upstream flow into it is scaled down by the same factor;
+- parking lots release vehicles at the rate of the exponential departure times
+  and flow into an exit segment leaves the system.
+Cost per step is proportional to the number of turning movements, not to the
+number of vehicles.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+exitList        - list of (x,y) exit locations; None for the network's own
+                  exits (see networkExits)
+timeStep        - seconds per step
+policeRouting   - 'straight' or 'network' ranking for the police scenario
+"""
+class CellTransmissionModel(object):
+    def __init__(self, network, runMethod, parkingCapacity, exitList=None,
+                 timeStep=FLOW_TIME_STEP, policeRouting=POLICE_ROUTING):
+        self.network = network
+        self.runMethod = runMethod
+        self.timeStep = timeStep
+        self.exitList = list(networkExits(network) if exitList is None
+                             else exitList)
+        numEdges = network.numEdges()
+        self.maxCapacity = np.array(network.maxCapacity, dtype=np.float64)
+        self.secondsPerSlot = network.carSize / SCALE / AVERAGE_CAR_SPEED_FTS
+
+        exitOfNode = np.full(network.numNodes(), -1, dtype=np.int64)
+        for index, exitPoint in enumerate(self.exitList):
+            if exitPoint in network.nodeIds:
+                exitOfNode[network.nodeIds[exitPoint]] = index
+        self.exitOfEdge = exitOfNode[np.array(network.edgeTo, dtype=np.int64)]
+
+        # Lot edges hold released vehicles without limit and send them at once
+        self.isParkingEdge = np.zeros(numEdges, dtype=bool)
+        self.lotVehicles = np.zeros(numEdges, dtype=np.float64)
+        for lot in network.parkingLots:
+            lotEdge = network.edgeStart[network.nodeIds[lot]]
+            self.isParkingEdge[lotEdge] = True
+            self.lotVehicles[lotEdge] = int(network.parkingLots[lot] *
+                                            parkingCapacity)
+
+        # Turning movements (from edge, to edge) sorted by from edge and rank;
+        # exit segments have none, their flow leaves the system
+        pairFrom = []
+        pairTo = []
+        options = network.scenarioOptions(runMethod, self.exitList,
+                                          policeRouting)
+        for edge in range(numEdges):
+            if self.exitOfEdge[edge] >= 0:
+                continue
+            for nextEdge in options[edge]:
+                pairFrom.append(edge)
+                pairTo.append(nextEdge)
+        self.pairFrom = np.array(pairFrom, dtype=np.int64)
+        self.pairTo = np.array(pairTo, dtype=np.int64)
+        self.pairFirst = np.r_[True, self.pairFrom[1:] != self.pairFrom[:-1]] \
+            if len(pairFrom) else np.zeros(0, dtype=bool)
+        # Arrival slots: a crossing takes at most a full segment's travel time
+        self.numSlots = int(np.ceil(self.maxCapacity.max(initial=0.0) *
+                                    self.secondsPerSlot / timeStep)) + 2
+
+    """
+    Method to give the turning fraction of every movement for this step.
+    room   - free room of every edge
+    return - fraction of each from edge's sending flow per movement
+    """
+    def turningFractions(self, room):
+        hasRoom = (room[self.pairTo] > FLOW_ROOM).astype(np.float64)
+        if self.runMethod == 'police':
+            # Only the first ranked movement with room of each from edge
+            openBefore = np.cumsum(hasRoom)
+            groupStart = np.maximum.accumulate(
+                np.where(self.pairFirst, np.arange(len(hasRoom)), 0))
+            openBefore = openBefore - openBefore[groupStart] + hasRoom[groupStart]
+            return hasRoom * (openBefore == 1)
+        openCount = np.bincount(self.pairFrom, hasRoom,
+                                minlength=len(room))[self.pairFrom]
+        return np.where(openCount > 0, hasRoom / np.maximum(openCount, 1), 0.0)
+
+    """
+    Method to run the flow model until the network is cleared.
+    maxTime - simulated seconds before the run is cut off
+    return  - CellTransmissionResults of the run
+    """
+    def run(self, maxTime=FLOW_MAX_TIME):
+        numEdges = len(self.maxCapacity)
+        vehicles = np.zeros(numEdges, dtype=np.float64)
+        lotTotal = self.lotVehicles
+        exitCounts = np.zeros(len(self.exitList), dtype=np.float64)
+        exiting = self.exitOfEdge >= 0
+        inSystem = []
+
+        # Vehicles at the end of their segment, ready to leave it, and the
+        # vehicles still crossing by the step they get to the end
+        ready = np.zeros(numEdges, dtype=np.float64)
+        crossing = np.zeros((self.numSlots, numEdges), dtype=np.float64)
+        edges = np.arange(numEdges)
+
+        now = 0.0
+        steps = 0
+        released = np.zeros(numEdges, dtype=np.float64)
+        remaining = lotTotal.sum() # everyone is still in the lots
+        while now < maxTime:
+            now += self.timeStep
+            steps += 1
+            slot = steps % self.numSlots
+            ready += crossing[slot]
+            crossing[slot] = 0.0
+            # Expected departures from the lots by now; they leave at once
+            releasedNow = lotTotal * (1.0 - np.exp(-now / X_MEAN_PARKING))
+            vehicles += releasedNow - released
+            ready += releasedNow - released
+            released = releasedNow
+
+            for moveRound in range(FLOW_ROUNDS):
+                room = np.where(self.isParkingEdge, 0.0,
+                                np.maximum(self.maxCapacity - vehicles, 0.0))
+
+                # Split the ready vehicles over the movements, then scale every
+                # flow into an over subscribed segment down to its free room
+                demand = ready[self.pairFrom] * self.turningFractions(room)
+                wanted = np.bincount(self.pairTo, demand, minlength=numEdges)
+                scale = np.where(wanted > room,
+                                 room / np.maximum(wanted, FLOW_ROOM), 1.0)
+                flow = demand * scale[self.pairTo]
+
+                leaving = np.where(exiting, ready, 0.0)
+                np.add.at(exitCounts, self.exitOfEdge[exiting],
+                          leaving[exiting])
+                inflow = np.bincount(self.pairTo, flow, minlength=numEdges)
+                outflow = np.bincount(self.pairFrom, flow,
+                                      minlength=numEdges) + leaving
+                vehicles += inflow - outflow
+                ready -= outflow
+
+                # The inflow crosses in the travel time of the room left
+                # behind it, split over the two steps around that time so the
+                # mean is kept; the part due this step is ready at once
+                travelSteps = np.maximum(room - inflow, 0.0) * \
+                    self.secondsPerSlot / self.timeStep
+                whole = np.floor(travelSteps)
+                late = inflow * (travelSteps - whole)
+                onTime = inflow - late
+                whole = whole.astype(np.int64)
+                ready += np.where(whole == 0, onTime, 0.0)
+                crossing[(steps + whole) % self.numSlots, edges] += \
+                    np.where(whole == 0, 0.0, onTime)
+                crossing[(steps + whole + 1) % self.numSlots, edges] += late
+                if outflow.sum() < FLOW_ROOM:
+                    break
+
+            remaining = vehicles.sum() + (lotTotal - released).sum()
+            inSystem.append(remaining)
+            if remaining < FLOW_CLEARED:
+                break
+
+        return CellTransmissionResults(now, exitCounts, remaining, steps,
+                                       np.array(inSystem))
+
+
+def main():
+    args = sys.argv
+    if len(args) < 4 or len(args) > 5:
+        print("Incorrect number of arguments - Format-> python "
+              "cellTransmission.py world2.csv [police, noWest, random] "
+              "[0.005-1.00] [time step (optional)]")
+        exit(0)
+
+    network = loadRoadNetwork(args[1])
+    timeStep = float(args[4]) if len(args) > 4 else FLOW_TIME_STEP
+    model = CellTransmissionModel(network, args[2], float(args[3]),
+                                  timeStep=timeStep)
+    results = model.run()
+    print("Clearance Time:", results.clearanceTime)
+    print("Steps:", results.steps)
+    print("Exit vehicle counts:", dict(zip(model.exitList,
+                                           results.exitCounts.round(1))))
+    print("Vehicles remaining:", results.vehiclesRemaining)
+
+
+if __name__ == '__main__':
+    main()
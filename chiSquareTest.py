@@ -1,9 +1,22 @@
+import sys
+import json
+import time
+import random
 from math import sqrt
 from collections import Counter
-from numpy.random import exponential
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.stats import chisquare
+from scipy.stats import chi2, kstwobign
+from evacSim import X_MEAN_PARKING, perCarRouteDraw
+
+VALIDATION_SAMPLES = 10000000 # draws tested per stream
+VALIDATION_CHUNK = 1000000 # draws generated and histogrammed at a time
+VALIDATION_BINS = 50 # equal probability chi-square bins of the departure stream
+VALIDATION_KS_BITS = 20 # the streamed KS statistic uses a 2**bits cell CDF grid
+VALIDATION_KS_GRID = 1 << VALIDATION_KS_BITS
+VALIDATION_ALPHA = 0.05
+VALIDATION_SEED = 0
+ROUTE_CHOICES = [2, 3, 4] # numbers of options a route choice is drawn from
+BENCHMARK_DRAWS = 200000 # draws per draws per second measurement
 
 
 # NOTE: the code below is not being used. The following is a program to calculate the chi-square value for N positive integers less than r.
@@ -47,70 +60,239 @@ def is_random(random_nums, r: int):
     return abs(chi_square - r) <= 2 * sqrt(r)
 
 
+"""
+Method to give the SplitMix64 route draws of many (car, move) pairs at once;
+the same numbers as perCarRouteDraw, computed on uint64 arrays (NumPy integer
+arrays wrap around on overflow, which is the 64 bit mask).
+routeKey - 64 bit key drawn from the route seed
+cars     - array of car ids
+hops     - array of move numbers
+return   - uint64 array of draws
+"""
+def perCarRouteDraws(routeKey, cars, hops):
+    z = (np.uint64(routeKey) ^ (cars.astype(np.uint64) << np.uint64(32) |
+                                hops.astype(np.uint64))) + \
+        np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+"""
+Method to run the chi-square goodness of fit test on binned counts.
+counts   - array of observed counts per bin
+expected - array of expected counts per bin, same total as counts
+return   - dictionary of the statistic, degrees of freedom and p-value
+"""
+def chiSquareFit(counts, expected):
+    statistic = float(((counts - expected) ** 2 / expected).sum())
+    freedom = len(counts) - 1
+    return {'statistic': statistic, 'degreesOfFreedom': freedom,
+            'pValue': float(chi2.sf(statistic, freedom))}
+
+"""
+Method to run the Kolmogorov-Smirnov test from a histogram of probability
+integral transformed draws (every draw u = F(x) in [0,1) counted into grid
+equal cells).  The empirical CDF is exact at the cell edges, so the statistic
+is at most 1/grid below the one of the raw draws; the p-value is the large
+sample (Kolmogorov) limit, accurate for samples this large.
+counts - array of draws per grid cell
+return - dictionary of the statistic and p-value
+"""
+def ksFit(counts):
+    numDraws = counts.sum()
+    grid = len(counts)
+    empirical = np.cumsum(counts) / numDraws
+    statistic = float(np.abs(empirical -
+                             np.arange(1, grid + 1) / grid).max())
+    return {'statistic': statistic,
+            'pValue': float(kstwobign.sf(statistic * sqrt(numDraws)))}
+
+"""
+Method to validate the lot departure stream: the exponential(X_MEAN_PARKING)
+draws of a Simulation's departure generator, streamed in chunks.  Every draw
+is mapped through the exponential CDF, so the chi-square bins are equally
+likely (expected count samples / bins each) and one bincount per chunk fills
+both the chi-square bins and the KS grid.
+samples - number of draws
+seed    - seed of the departure generator
+chunk   - draws per chunk
+bins    - number of chi-square bins
+return  - dictionary with the chi-square and KS results and the sample mean
+"""
+def validateDepartures(samples=VALIDATION_SAMPLES, seed=VALIDATION_SEED,
+                       chunk=VALIDATION_CHUNK, bins=VALIDATION_BINS):
+    departureRandom = np.random.RandomState(seed)
+    gridCounts = np.zeros(VALIDATION_KS_GRID, dtype=np.int64)
+    total = 0.0
+    done = 0
+    while done < samples:
+        size = min(chunk, samples - done)
+        draws = departureRandom.exponential(X_MEAN_PARKING, size)
+        total += draws.sum()
+        uniform = -np.expm1(-draws / X_MEAN_PARKING)
+        gridCounts += np.bincount((uniform * VALIDATION_KS_GRID).astype(
+            np.int64), minlength=VALIDATION_KS_GRID)
+        done += size
+    # Chi-square bins are runs of whole KS grid cells, so a bin's probability
+    # is its share of the cells
+    binEdges = np.arange(bins + 1) * VALIDATION_KS_GRID // bins
+    binCounts = np.add.reduceat(gridCounts, binEdges[:-1])
+    expected = samples * np.diff(binEdges) / VALIDATION_KS_GRID
+    return {'stream': 'departure', 'samples': samples,
+            'mean': total / samples, 'expectedMean': X_MEAN_PARKING,
+            'chiSquare': chiSquareFit(binCounts, expected),
+            'ks': ksFit(gridCounts)}
 
-#
-#
-# def calc_chisquare_statistic (counts, probs):
-#     """
-#     Given a target distribution and empirically observed counts, compute the
-#     chi-square statistic of the observations relative to the target.
-#
-#     The input `counts[v] = y_v` is the dictionary of observations and
-#     `probs[v] = p_v` is the probability of observing `v`.
-#     """
-#     n = sum (counts)
-#     chi_sq = 0.0
-#     # @YOUSE:
-#     #assert False
-#     for v in range(0, len(counts)):
-#         y_v = counts[v]
-#         x_v = float (n) * probs[v]
-#         chi_sq += (y_v - x_v)**2 / x_v
-#         if y_v < 5: print ("*** Warning: Only", y_v, "< 5 samples of item", v, "***")
-#     return chi_sq
+"""
+Method to validate the route choice streams for every number of options in
+ROUTE_CHOICES.  'stream' draws randint(0, options - 1) from one
+random.Random, as Simulation does by default; 'perCar' takes the per car
+draws modulo the number of options (car ids and move numbers walked in
+order).  The chi-square test checks the choices are equally likely; for
+'perCar' the KS test also checks the raw 64 bit draws are uniform.
+mode    - 'stream' or 'perCar'
+samples - number of draws per number of options
+seed    - seed of the route generator
+chunk   - draws per chunk
+return  - dictionary with one chi-square result per number of options and,
+          for 'perCar', the KS result
+"""
+def validateRouteChoices(mode, samples=VALIDATION_SAMPLES,
+                         seed=VALIDATION_SEED, chunk=VALIDATION_CHUNK):
+    routeRandom = random.Random(seed)
+    routeKey = routeRandom.getrandbits(64)
+    gridCounts = np.zeros(VALIDATION_KS_GRID, dtype=np.int64)
+    report = {'stream': mode, 'samples': samples, 'choices': {}}
+    for options in ROUTE_CHOICES:
+        counts = np.zeros(options, dtype=np.int64)
+        done = 0
+        while done < samples:
+            size = min(chunk, samples - done)
+            if mode == 'stream':
+                randint = routeRandom.randint
+                choices = np.array([randint(0, options - 1)
+                                    for draw in range(size)])
+            else:
+                index = np.arange(done, done + size, dtype=np.int64)
+                draws = perCarRouteDraws(routeKey, index >> 8, index & 255)
+                choices = (draws % np.uint64(options)).astype(np.int64)
+                # The top bits of a draw are its KS grid cell
+                if options == ROUTE_CHOICES[0]:
+                    gridCounts += np.bincount(
+                        (draws >> np.uint64(64 - VALIDATION_KS_BITS)).astype(
+                            np.int64), minlength=VALIDATION_KS_GRID)
+            counts += np.bincount(choices, minlength=options)
+            done += size
+        report['choices'][options] = chiSquareFit(
+            counts, np.full(options, samples / options))
+    if mode == 'perCar':
+        report['ks'] = ksFit(gridCounts)
+    return report
 
+"""
+Method to time a draw function.
+draw     - function drawing numDraws random numbers
+numDraws - number of draws
+return   - draws per second
+"""
+def drawsPerSecond(draw, numDraws=BENCHMARK_DRAWS):
+    start = time.perf_counter()
+    draw(numDraws)
+    return numDraws / (time.perf_counter() - start)
 
+"""
+Method to measure draws per second of every stream drawn one at a time, as the
+event loop draws them, and in batches.  random.Random has no batched randint,
+so the batched route stream is NumPy's randint.
+numDraws - draws per measurement
+seed     - seed of the generators
+return   - dictionary of stream -> {'scalar': draws/s, 'batched': draws/s}
+"""
+def benchmarkDraws(numDraws=BENCHMARK_DRAWS, seed=VALIDATION_SEED):
+    departureRandom = np.random.RandomState(seed)
+    routeRandom = random.Random(seed)
+    routeKey = routeRandom.getrandbits(64)
+    exponential = departureRandom.exponential
+    randint = routeRandom.randint
+    return {
+        'departure': {
+            'scalar': drawsPerSecond(lambda size: [
+                exponential(X_MEAN_PARKING) for draw in range(size)],
+                numDraws),
+            'batched': drawsPerSecond(lambda size: exponential(
+                X_MEAN_PARKING, size), numDraws)},
+        'routeStream': {
+            'scalar': drawsPerSecond(lambda size: [
+                randint(0, 2) for draw in range(size)], numDraws),
+            'batched': drawsPerSecond(lambda size: departureRandom.randint(
+                0, 3, size), numDraws)},
+        'routePerCar': {
+            'scalar': drawsPerSecond(lambda size: [
+                perCarRouteDraw(routeKey, draw >> 8, draw & 255) % 3
+                for draw in range(size)], numDraws),
+            'batched': drawsPerSecond(lambda size: perCarRouteDraws(
+                routeKey, np.arange(size) >> 8, np.arange(size) & 255) %
+                np.uint64(3), numDraws)}}
+
+"""
+Method to run the whole validation: goodness of fit of the departure stream
+and both route choice streams, and draws per second.
+samples - draws per stream
+seed    - seed of the generators
+return  - dictionary report, ready to be saved as JSON
+"""
+def validateStreams(samples=VALIDATION_SAMPLES, seed=VALIDATION_SEED):
+    return {'alpha': VALIDATION_ALPHA,
+            'seed': seed,
+            'departure': validateDepartures(samples, seed),
+            'routeStream': validateRouteChoices('stream', samples, seed),
+            'routePerCar': validateRouteChoices('perCar', samples, seed),
+            'drawsPerSecond': benchmarkDraws(seed=seed)}
 
 
 def main():
-    bin = 50
-    s = 1000
-    #x_values = np.random.randn(s)
-    x_values = exponential(.25,s)
-    #print(x_values)
-    y,x = np.histogram(x_values, bins=bin)
-    y_norm = y/s
-    #print("Y", y)
-    n = len(x) - 1
-    # x_prime is for getting the middle point of the histogram to avoid skewednees
-    x_prime = [0] * bin
-    for i in range(0, n):
-        x_prime[i] = x[i] + ((x[i+1] - x[i])/2)
-    #print (x_prime)
-    #print(len(x_prime))
-    print ("CHI_SQUARE TEST:", chisquare (y_norm,f_exp=x_prime))
-    chiResult = chisquare(y_norm,f_exp=x_prime)
-    print()
-    print("According to the result of the Chi-Square test, we fail to reject the null hypothesis ")
-    print("that numpy’s random number generator generates exponential random numbers ")
-    print("with only 5% confidence. Since the p-value of", chiResult[1], "for the chi-square is greater than an alpha of ")
-    print(".05, we fail to reject the null hypothesis and prove that numpy's random number generator is random!")
-    print()
-    print("Please take a look at the graphs and notice how, when plotting the random exponential values (which is what we used),")
-    print("we notice that the distribution follows the exponential distributions. Thus, proving that numpy's random")
-    print("number generator for exponential values is random.")
-    plt.hist(x_values, bins = bin)
-    plt.show()
-    plt.plot(x_prime, y)
-    plt.show()
-    #q = calc_chisquare_statistic(y, y_norm)
-    import os
-    r = 256
-    sample = os.urandom(r * 11)
-    #print("SAMPLE", sample)
-    print("EXAMPLE:", is_random(sample, r))
+    args = sys.argv
+    if len(args) > 4:
+        print("Incorrect number of arguments - Format-> python chiSquareTest.py "
+              "[# of samples (optional)] [seed (optional)] "
+              "[report.json (optional)]")
+        exit(0)
+
+    samples = int(args[1]) if len(args) > 1 else VALIDATION_SAMPLES
+    seed = int(args[2]) if len(args) > 2 else VALIDATION_SEED
+    report = validateStreams(samples, seed)
+
+    verdict = lambda test: "pass" if test['pValue'] > VALIDATION_ALPHA \
+        else "REJECT"
+    departure = report['departure']
+    print("Departure stream: exponential(%g), %d draws, mean %.5f" % (
+        X_MEAN_PARKING, samples, departure['mean']))
+    print("  chi-square (%d equal probability bins): %.2f, p = %.4f, %s" % (
+        departure['chiSquare']['degreesOfFreedom'] + 1,
+        departure['chiSquare']['statistic'], departure['chiSquare']['pValue'],
+        verdict(departure['chiSquare'])))
+    print("  KS: D = %.2e, p = %.4f, %s" % (departure['ks']['statistic'],
+                                           departure['ks']['pValue'],
+                                           verdict(departure['ks'])))
+    for stream in ['routeStream', 'routePerCar']:
+        print("Route choice stream (%s), %d draws per option count" % (
+            report[stream]['stream'], samples))
+        for options, test in sorted(report[stream]['choices'].items()):
+            print("  chi-square (%d options): %.2f, p = %.4f, %s" % (
+                options, test['statistic'], test['pValue'], verdict(test)))
+        if 'ks' in report[stream]:
+            print("  KS of the raw draws: D = %.2e, p = %.4f, %s" % (
+                report[stream]['ks']['statistic'],
+                report[stream]['ks']['pValue'], verdict(report[stream]['ks'])))
+    print("Stream,scalar draws/s,batched draws/s,speedup")
+    for stream, rates in report['drawsPerSecond'].items():
+        print("%s,%.3g,%.3g,%.1fx" % (stream, rates['scalar'], rates['batched'],
+                                      rates['batched'] / rates['scalar']))
+    if len(args) > 3:
+        with open(args[3], 'w') as reportFile:
+            json.dump(report, reportFile, indent=2)
+        print("Report:", args[3])
 
 
 if __name__ == '__main__':
     main()
-
@@ -1,14 +1,19 @@
 import sys
-import simpy
-import time
+import json
 import numpy as np
 import math
-import queue
-from numpy.random import exponential
-from numpy import mean
-from heapq import heappush, heappop, heapify
-from random import randint
-import matplotlib.pyplot as plt
+import random
+from collections import deque
+from array import array
+from roadNetwork import RoadNetwork, readFileAndSetUp, readWorldExits
+from roadNetwork import calculateRoadCapacity as networkRoadCapacity
+from simRecorders import TrajectoryRecorder, CapacityMetrics, CarRecordWriter
+from simRecorders import CAPACITY_BUCKET_SECONDS
+from eventLists import createEventList, CALENDAR_BUCKET_SECONDS
+from networkCache import cachedRoadNetwork
+from simProfiler import SimulationProfiler
+from livelockMonitor import LivelockMonitor, STAGNATION_SECONDS
+from simCheckpoint import saveCheckpoint, CHECKPOINT_EVERY
 
 
 # GLOBAL
@@ -17,495 +22,982 @@ PARKING_CAPACITY = .25 # DEFAULT
 SCALE = 70/500
 CAR_SIZE_FT = 15 # DEFAULT is 15' long cars
 CAR_SIZE = CAR_SIZE_FT * SCALE # in graph units
-RUN_METHOD = 1 # DEFAULT is police option
+RUN_METHOD = 'police' # DEFAULT is police option
 NUM_SIMULATIONS = 1000 # DEFAULT
 # Event parameters
 #MEAN_TRAVEL_TIME = 5 # seconds
 MEAN_WAITING_TIME = 5 # seconds
-globalTimeList = []
-currentRoadCapacities = {}
-exit_list = [(723,32),(733,270),(760,555)] # Exit locations - 10th,5th,North Ave
-exit_count = {(723,32):0, (733,270):0, (760,555):0} # Count cars exiting
-paths = {}
-capacityTracker = []
-parkingLots = {}
+POLICE_ROUTING = 'straight' # Rank police moves by 'straight' or 'network' distance
+WAIT_MODE = 'poll' # Blocked cars 'poll' every MEAN_WAITING_TIME or 'wakeup' on a free slot
+PATH_SAMPLE_EVERY = 1 # Record the path of every n-th car; 0 records no paths
+EVENT_LIST = 'calendar' # Event list implementation, 'heap' or 'calendar'
+LAZY_LOT_RELEASE = True # Queue only the next departure of each parking lot
+ROUTE_DRAWS = 'stream' # Route choices from one 'stream' in event order or 'perCar'
+LIVELOCK_POLICY = None # Watch for loops and stagnation: None, 'report', 'terminate' or 'steer'
+# Event kinds; an event is (time, sequence #, kind, car id)
+EVENT_TOGO = 0
+EVENT_ARRIVES = 1
+EVENT_LEAVES_LOT = 2
+NOT_ON_ROAD = -1 # car edge value before a car is placed in its lot
+UINT64_MASK = (1 << 64) - 1
+# Exit locations - 10th,5th,North Ave; used for world files without Exit rows
+exit_list = [(723,32),(733,270),(760,555)]
 BEGIN_SIMULATION = 0.0 # Beginnig simulation time
-END_SIMULATION   = 0.0 # Ending simulation time
+NETWORK_CACHE_DIR = 'networkCache' # Compiled world files; None to always parse
 AVERAGE_CAR_SPEED_MPH = 25 # MPH
 AVERAGE_CAR_SPEED_FTS = AVERAGE_CAR_SPEED_MPH * 5280 / 3600 # FT PER SEC
+PLOT_DPI = 150 # resolution of plots saved to image files
 
 """
-Method to read from the world file and create a basic graph dictionary to pull
-from for creating intersection and parking lot nodes.  There are no one lane
-roads in this model except from exiting a parking lot.
-fileName - name of file to read from
-Return - return intersection dictionary of nodes and incoming queues to node
-with capacities for each queue (number of lanes) and
-parking lots dictionary of nodes with capacties of each.
-Intersection Format -  (89, 81): [((86, 129),1), ((50, 87),2)]
-Parking Lot Format  -  (86, 149): 1200
-"""
-def readFileAndSetUp(fileName):
-    worldFile = open(fileName,'r')
-    worldFile.readline() # Throw Away top line
-
-    intersections_graph = {}
-    parking_nodes = {}
-
-    for line in worldFile:
-        array = line.split(',')
-        typeNode = array[0]
-        nodeFrom = (int(array[1]),int(array[2]))
-        nodeTo = (int(array[3]),int(array[4]))
-        capacity = int(array[5])
-
-        # Street Nodes; lets process these
-        if typeNode == 'Street':
-            # Add queue for NodeTo to NodeFrom
-            if nodeFrom not in intersections_graph:
-                intersections_graph[nodeFrom] = []
-                intersections_graph[nodeFrom].append((nodeTo,capacity))
-            else:
-                intersections_graph[nodeFrom].append((nodeTo,capacity))
-            # Add queue for NodeFrom to NodeTo
-            if nodeTo not in intersections_graph:
-                intersections_graph[nodeTo] = []
-                intersections_graph[nodeTo].append((nodeFrom,capacity))
-            else:
-                intersections_graph[nodeTo].append((nodeFrom,capacity))
-
-
-        # Parking Nodes; lets process these; never allowing a queue to enter
-        # parking lot; use one as a capacity holder for roads coming from
-        # parking lot
-        elif typeNode == 'Parking':
-            if nodeFrom not in intersections_graph:
-                intersections_graph[nodeFrom] = []
-                intersections_graph[nodeFrom].append((nodeTo,1))
-            # Shouldn't ever happen, since there is only one parking lot per
-            # coordinate, but let's check anyways
-            else:
-                intersections_graph[nodeFrom].append((nodeTo, 1))
-
-            parking_nodes[nodeFrom] = (capacity) #, nodeTo)
-
-    worldFile.close()
-
-    return intersections_graph, parking_nodes
-
-"""
-Method to create dictionary of current and maximum capacities for each queuing
-road segment upto a particular intersection.  The dictionary can be accessed by
-asking from the dictionary what intersection of queues you want.
+Method to compile the intersections dictionary into the integer indexed road
+network.  The network is read-only, so one compiled network can be shared by
+any number of Simulation runs.
 intersections - dictionary of intersections for the entire map system
-Return - return intersection dictionary of upstream nodes with current and max
-queue size.
-Intersection Format - (348, 30): [((168, 30), 0, 171), ((380, 35), 0, 30)]
+parkingDicts  - parking lot dictionary for the entire map system
+carSizeFt     - length of one car in feet
+exits         - list of (x,y) exits of the map
+Return - return the compiled RoadNetwork
 """
-def createQueuingCapacityDict(intersections):
-    global currentRoadCapacities
-
-    # Go through each intersection node in the intersection dictionary
-    for intersectionNode in intersections:
-        currentRoadCapacities[intersectionNode] = []
-        # Go through each downstream node and add capacity
-        for downstreamNode, numLanes in intersections[intersectionNode]:
-            currentRoadCapacities[intersectionNode].append((downstreamNode,
-            calculateRoadCapacity(intersectionNode, downstreamNode, numLanes)))
-
-    return currentRoadCapacities
+def createQueuingCapacityDict(intersections, parkingDicts, carSizeFt=CAR_SIZE_FT,
+                              exits=()):
+    return RoadNetwork(intersections, parkingDicts, carSizeFt * SCALE, exits)
 
 """
-Method to return a tuple of x,y coordinates, which is the closest distance to
-one of the exit points - this is used for the police scenario. This is the next
-location a car should move to.
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
-return   - Next location for car to go to [(x,y)]
+Method to read a world file and compile it into a road network in one step.
+With a cache directory the compiled network is stored there as binary arrays,
+keyed by the file's contents and the car size, and later calls map it back in
+instead of parsing the file again.
+fileName  - name of file to read from
+carSizeFt - length of one car in feet
+cacheDir  - directory of compiled networks; None to always parse the file
+Return - return the compiled RoadNetwork
 """
-def provideListOfPossibleMovesPolice(fromNode, toNode):
-    availableMoves = []
-    curCapDownstreamFromToNode = currentRoadCapacities[toNode]
-    #print("curCAPDSFRMNODE:", curCapDownstreamFromToNode)
-    #print("FROMNODE (CURR):", fromNode)
-    #print("TONODE (CURR):", toNode)
-    min_distance = float('infinity')
-    min_pair = None
-    for nextMove in curCapDownstreamFromToNode:
-        if nextMove[1] > 0 and nextMove[0] != fromNode:
-            for exitPoint in exit_list:
-                temp_min_distance = math.hypot(exitPoint[0] - nextMove[0][0], exitPoint[1] - nextMove[0][1])
-                if temp_min_distance < min_distance:
-                    min_distance = temp_min_distance
-                    min_pair = [exitPoint, nextMove]
-                    #print("MIN_DISTANCE:", min_distance)
-                    #print("MIN DISTANCE PAIR:", min_pair)
-    if min_pair != None:
-        availableMoves.append(min_pair[1])
-    #print("AVAIL MOVES:", availableMoves)
-    #print("")
-    return availableMoves
+def loadRoadNetwork(fileName, carSizeFt=CAR_SIZE_FT, cacheDir=NETWORK_CACHE_DIR):
+    if cacheDir:
+        return cachedRoadNetwork(fileName, carSizeFt, carSizeFt * SCALE,
+                                 cacheDir)
+    intersections, parkingLots = readFileAndSetUp(fileName)
+    return createQueuingCapacityDict(intersections, parkingLots, carSizeFt,
+                                     readWorldExits(fileName))
 
 """
-Method to return a list of tuples of x,y coordinates, which are all the possible
-locations that a car can move to. No westward turns are allowed within a small
-factor. This is an addition to the model that we decided to include for FUN!
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
-return   - Next locations for car to go to [(x,y),(x,y),(x,y)]
+Method to give the exits of a road network: the Exit rows of its world file,
+or exit_list for a world file that lists none.
+network - compiled RoadNetwork
+Return - return list of (x,y) exit locations
 """
-def provideListOfPossibleMovesNoLeft(fromNode, toNode):
-    availableMoves = []
-
-    curCapDownstreamFromToNode = currentRoadCapacities[toNode]
-    #print("curCAPDSFRMNODE:", curCapDownstreamFromToNode)
-    #print("FROMNODE (CURR):", fromNode)
-    #print("TONODE (CURR):", toNode)
-    for nextMove in curCapDownstreamFromToNode:
-        #print("TONODE[0] (CURR) - x-coor:", toNode[0] - 10)
-        #print("NEXTMOVE", nextMove[0])
-        #print("NEXTMOVE[0][0] - x-coor:", nextMove[0][0])
-        # end of if statement to ensure no left moves are made
-        if nextMove[1] > 0 and nextMove[0][0] >= toNode[0] - 20:
-            availableMoves.append(nextMove)
-    #print("AVAIL MOVES:", availableMoves)
-    #print("")
-    return availableMoves
+def networkExits(network):
+    return network.exits or exit_list
 
 """
-Method to return a list of tuples of x,y coordinates, which are all the possible
-locations that a car can move to. This will represent the random - red flashing
-light scenario.
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
-return   - Next location for car to go to [(x,y),(x,y),(x,y)]
+Method to calculate the capacity for a road between two nodes based on two
+end points and number of lanes of road between those two nodes.
+firstNode  - firstNode to pull from
+secondNode - secondNode to pull from
+numLanes   - number of lanes between firstNode and secondNode
+Return - return capacity of road between the firstNode and secondNode
 """
-def provideListOfPossibleMovesRedLight(fromNode, toNode):
-    availableMoves = []
-
-    curCapDownstreamFromToNode = currentRoadCapacities[toNode]
-    for nextMove in curCapDownstreamFromToNode:
-        if nextMove[1] > 0:
-            availableMoves.append(nextMove)
-
-    return availableMoves
-
+def calculateRoadCapacity(firstNode, secondNode, numLanes):
+    return networkRoadCapacity(firstNode, secondNode, numLanes, CAR_SIZE)
 
 
 """
-Method to change available capacity in the master queue dictionary based on if
-car is arriving or departing from a particular segment of road.
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
-return   - None
+Method to give the random number behind a car's route choice (SplitMix64 of
+the route key, car id and move number).  It depends on nothing else, so a car
+gets the same draw for its n-th move in every run with the same route key,
+whatever the scenario did before.
+routeKey - 64 bit key drawn from the route seed
+car      - car id
+hop      - number of moves the car has made
+return   - 64 bit random integer
 """
-def changeAvailableCapacity(fromNode, ToNode, arriving=True):
-    global currentRoadCapacities
-
-    curCapDownstreamFromNode = currentRoadCapacities[fromNode]
-    for i in range(len(curCapDownstreamFromNode)):
-        if curCapDownstreamFromNode[i][0] == ToNode:
-            if arriving:
-                curCapDownstreamFromNode[i] = (ToNode, curCapDownstreamFromNode[i][1]-1)
-            else:
-                curCapDownstreamFromNode[i] = (ToNode, curCapDownstreamFromNode[i][1]+1)
-
+def perCarRouteDraw(routeKey, car, hop):
+    z = (routeKey ^ (car << 32 | hop)) + 0x9E3779B97F4A7C15 & UINT64_MASK
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & UINT64_MASK
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & UINT64_MASK
+    return z ^ (z >> 31)
 
 
 """
-Method to create global event queue with all cars inserted in at an exponential
-random time.
-parkingDicts - parking lot dictionary containing the location of each parking
-lot and the designated capacity of the parking lot
-return - None
+Per-car state of one run, kept as parallel arrays indexed by integer car id
+(cars are numbered lot by lot, in parkingLots order).  The arrays are
+array.array buffers, cheap to update one car at a time inside the event loop;
+asNumpy() gives zero copy NumPy views of them for analysis after the run.
+numCars - number of cars in the simulation
 """
-# Create the global queue of car tuples
-def globalQueue(parkingDicts):
-    global globalTimeList
-
-    for key in parkingDicts:
-        X_COUNT = int(parkingDicts[key] * PARKING_CAPACITY)
-        x_values = exponential (X_MEAN_PARKING, X_COUNT)
-        #print("X ~ Exp(%g):" % X_MEAN)
-        #for (i, x_i) in enumerate (x_values):
-            #print ("  X_%d = %g" % (i, x_i))
-        listOfTimeStamps = list(x_values)
-        count = 0
-        for time in listOfTimeStamps:
-            carTuple = (time, key, currentRoadCapacities[key][0][0], (key,count)) #timestamp, from, to, parkinglot
-            paths[(key,count)] = []
-            count += 1
-            #print("CURR RD CAP KEY[0]:", currentRoadCapacities[key][0][0])
-            globalTimeList.append((carTuple, togo))
-    heapify(globalTimeList)
+class CarState(object):
+    def __init__(self, numCars):
+        self.numCars = numCars
+        self.edge = array('l', [NOT_ON_ROAD]) * numCars # current (last) edge
+        self.lot = array('l', [0]) * numCars # lot id, index into lots
+        self.departureTime = array('d', [math.nan]) * numCars
+        self.hops = array('l', [0]) * numCars # road segments entered
+        self.exitTime = array('d', [math.nan]) * numCars # nan until it exits
+
+    """
+    Method to give NumPy views of the car arrays, sharing their memory.
+    return - dictionary of array name to NumPy array
+    """
+    def asNumpy(self):
+        return {'edge': np.frombuffer(self.edge, dtype='l'),
+                'lot': np.frombuffer(self.lot, dtype='l'),
+                'departureTime': np.frombuffer(self.departureTime),
+                'hops': np.frombuffer(self.hops, dtype='l'),
+                'exitTime': np.frombuffer(self.exitTime)}
 
 
 """
-Method to schedule an event onto the global scheduler
-car_tuple - (#timestamp, fromNode, toNode, parkinglot((50,87),car #))
-event     - what event (arrives, togo, departs)
-return    - None
+Results of one simulation run.
+eventCount     - number of events processed
+simulationTime - simulated time from start to the last processed event
+exitCount      - dictionary of exit location to number of cars that left there
+capacityMetrics - CapacityMetrics of the available road capacity over time
+trajectories   - TrajectoryRecorder of the visited nodes of the recorded cars,
+                 or None if paths were not recorded
+remainingEvents - events still in the event list, counting cars not yet released
+                  from their lots, when the run stopped
+waitingCars    - cars still on a wait list when the run stopped (wakeup mode)
+cars           - CarState of every car at the end of the run
+profile        - SimulationProfiler report of the run, or None if it was not
+                 profiled
+livelock       - LivelockMonitor report of the run, or None if it was not
+                 watched
 """
-def schedule (car_tuple, event):
-    global globalTimeList
-    heappush (globalTimeList, (car_tuple, event))
+class SimulationResults(object):
+    def __init__(self, eventCount, simulationTime, exitCount, capacityMetrics,
+                 trajectories, remainingEvents, waitingCars=0, cars=None,
+                 profile=None, livelock=None):
+        self.eventCount = eventCount
+        self.simulationTime = simulationTime
+        self.exitCount = exitCount
+        self.capacityMetrics = capacityMetrics
+        self.trajectories = trajectories
+        self.remainingEvents = remainingEvents
+        self.waitingCars = waitingCars
+        self.cars = cars
+        self.profile = profile
+        self.livelock = livelock
+
+    def carsExited(self):
+        return sum(self.exitCount.values())
+
 
 """
-Method to calculate travel time per road segment based on from node to to node
-capacity, car size, and average travel speed.
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
-return   - travel time
+One replication of the evacuation.  All mutable state (event list, current
+road capacities, car state, exit counts, trajectories, capacity metrics and
+random number generators) belongs to the Simulation, while the compiled road
+network is only read, so many Simulations can run back to back or side by side
+on one network.  Cars are integer ids into the CarState arrays and an event is
+only (time, sequence #, event kind, car id); the sequence number breaks time
+ties in scheduling order.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+numSimulations  - maximum number of events to process
+exitList        - list of (x,y) exit locations; None for the network's own
+                  exits (see networkExits)
+policeRouting   - 'straight' or 'network' ranking for the police scenario
+seed            - seed for both random streams; None for fresh entropy
+departureSeed   - seed for the lot departure stream only; None uses seed
+routeSeed       - seed for the route choice stream only; None uses seed
+routeDraws      - 'stream' draws route choices from one generator in event
+                  order; 'perCar' makes a car's n-th choice a fixed function of
+                  (route seed, car id, n) (see perCarRouteDraw), so runs of
+                  different scenarios with the same seeds share their random
+                  numbers car by car (common random numbers)
+waitMode        - 'poll' retries a blocked car every MEAN_WAITING_TIME seconds;
+                  'wakeup' parks it on the wait lists of the segments it could
+                  enter and retries it only when one of them frees a slot
+pathSampleEvery - record the path of every n-th car; 0 records none
+capacityBucketSeconds - simulated seconds per capacity metrics sample
+capacityFile    - CSV file to stream the capacity samples to; None keeps them
+                  in memory
+eventList       - 'heap' or 'calendar' event list
+lazyRelease     - queue only the next departure of each parking lot, instead of
+                  every parked car up front
+eventBucketSeconds - bucket width of the calendar event list
+carRecordFile   - CSV file to stream a record of every car to as it exits (see
+                  CarRecordWriter); None writes no records
+profile         - instrument the run with a SimulationProfiler; the report is
+                  results.profile
+livelockPolicy  - None, or watch the run for looping cars and stagnation with a
+                  LivelockMonitor: 'report', 'terminate' (also stop the run
+                  when it stagnates) or 'steer' (also route looping cars
+                  towards the exits); the report is results.livelock
+stagnationSeconds - simulated seconds without exits or capacity change that
+                  count as stagnation
+checkpointFile  - file to save the whole run state to every checkpointEvery
+                  events (see simCheckpoint); None saves none
+checkpointEvery - events between checkpoints
 """
-def calcTravelTime(fromNode, toNode):
-
-    calcTime = 0
-    listOfPossibleDownstreamNodes = currentRoadCapacities[fromNode]
-    currentCapacityToToNode = 0
+class Simulation(object):
+    def __init__(self, network, runMethod=RUN_METHOD,
+                 parkingCapacity=PARKING_CAPACITY,
+                 numSimulations=NUM_SIMULATIONS, exitList=None,
+                 policeRouting=POLICE_ROUTING, seed=None,
+                 waitMode=WAIT_MODE, pathSampleEvery=PATH_SAMPLE_EVERY,
+                 capacityBucketSeconds=CAPACITY_BUCKET_SECONDS,
+                 capacityFile=None, eventList=EVENT_LIST,
+                 lazyRelease=LAZY_LOT_RELEASE,
+                 eventBucketSeconds=CALENDAR_BUCKET_SECONDS,
+                 carRecordFile=None, profile=False, departureSeed=None,
+                 routeSeed=None, routeDraws=ROUTE_DRAWS,
+                 livelockPolicy=LIVELOCK_POLICY,
+                 stagnationSeconds=STAGNATION_SECONDS, checkpointFile=None,
+                 checkpointEvery=CHECKPOINT_EVERY):
+        self.network = network
+        self.runMethod = runMethod
+        self.parkingCapacity = parkingCapacity
+        self.numSimulations = numSimulations
+        self.exitList = list(networkExits(network) if exitList is None
+                             else exitList)
+        self.carSizeFt = network.carSize / SCALE
+        self.policeRouting = policeRouting
+        # Separate streams, so route choices never shift lot departures
+        self.departureRandom = np.random.RandomState(
+            seed if departureSeed is None else departureSeed)
+        self.routeRandom = random.Random(seed if routeSeed is None
+                                         else routeSeed)
+        if routeDraws not in ('stream', 'perCar'):
+            raise ValueError("routeDraws has to be 'stream' or 'perCar'")
+        self.routeKey = self.routeRandom.getrandbits(64) \
+            if routeDraws == 'perCar' else None
+        self.waitMode = waitMode
+        self.lots = list(network.parkingLots)
+
+        self.globalTimeList = createEventList(eventList, eventBucketSeconds)
+        self.eventHandlers = (self.togo, self.arrives, self.leavesLot)
+        self.lastSequence = 0
+        self.lazyRelease = lazyRelease
+        # Lazy release: lot id -> [departure times in order, car ids, next]
+        self.lotDepartures = {}
+        self.carsInLots = 0
+        self.currentCapacity = network.newCapacityBuffer()
+        self.exitCounts = [0] * len(self.exitList)
+        self.cars = None
+        self.pathSampleEvery = pathSampleEvery
+        self.trajectories = None
+        # Car id of the first car of each parking lot; car id = first + car #
+        self.lotFirstCar = {}
+        self.capacityMetrics = CapacityMetrics(capacityBucketSeconds,
+                                               streamFile=capacityFile)
+        self.carRecords = None
+        if carRecordFile:
+            self.carRecords = CarRecordWriter(carRecordFile, self.lots,
+                                              self.exitList)
+        # Running total of free capacity on all roads
+        self.availableCapacitySys = self.calcAvailableCapSys()
+        self.endSimulation = BEGIN_SIMULATION
+        self.now = BEGIN_SIMULATION
+        # Wakeup mode: edge id -> deque of (wait token, car id) and the
+        # current wait token of every waiting car; older entries are stale
+        self.waitLists = {}
+        self.waitTokens = {}
+        self.lastWaitToken = 0
+        self.livelock = None
+        if livelockPolicy is not None:
+            self.livelock = LivelockMonitor(self, livelockPolicy,
+                                            stagnationSeconds)
+        self.buildEdgeTables()
+        # Events processed so far and whether the cars are set up; a run
+        # restored from a checkpoint carries on from these
+        self.eventCount = 0
+        self.started = False
+        self.checkpointFile = checkpointFile
+        self.checkpointEvery = checkpointEvery
+        if profile and checkpointFile:
+            raise ValueError("a profiled run can not be checkpointed")
+        # Last, so every method and recorder it wraps already exists
+        self.profiler = SimulationProfiler(self) if profile else None
+
+    """
+    Method to build the per edge tables the event handlers look up: the
+    scenario's allowed next edges (police: ranked), the driving distance
+    ranking steered cars follow, the exit index of every edge's downstream
+    node (-1 if not an exit) and whether an edge starts at a parking lot.
+    They only depend on the network and the scenario, so a checkpoint leaves
+    them out and a restored or forked run builds them again.
+    return - None
+    """
+    def buildEdgeTables(self):
+        network = self.network
+        self.options = network.scenarioOptions(self.runMethod, self.exitList,
+                                               self.policeRouting)
+        # Steered cars follow the driving distance ranking, which always gets
+        # closer to an exit
+        self.steerOptions = None
+        if self.livelock is not None and self.livelock.policy == 'steer':
+            self.steerOptions = network.policeRoutingTable(self.exitList,
+                                                           'network')
+        exitOfNode = [-1] * network.numNodes()
+        for index, exitPoint in enumerate(self.exitList):
+            if exitPoint in network.nodeIds:
+                exitOfNode[network.nodeIds[exitPoint]] = index
+        self.exitOfEdge = [exitOfNode[toId] for toId in network.edgeTo]
+        lotNodes = set(network.nodeIds[lot] for lot in network.parkingLots)
+        self.isLotEdge = [fromId in lotNodes for fromId in network.edgeFrom]
+
+    """
+    Method to give the next edge for a car in the police scenario: the best
+    ranked option that has room.  The options are ranked ahead of time by
+    distance to the exits, so only their capacities are checked here.
+    edge   - edge id the car is at the end of
+    return - list holding the next edge id, or empty if all options are full
+    """
+    def provideListOfPossibleMovesPolice(self, edge):
+        currentCapacity = self.currentCapacity
+        for nextEdge in self.options[edge]:
+            if currentCapacity[nextEdge] > 0:
+                return [nextEdge]
+        return []
+
+    """
+    Method to give all next edges with room a car can take without heading
+    west (within a small factor). This is an addition to the model that we
+    decided to include for FUN!
+    edge   - edge id the car is at the end of
+    return - list of next edge ids
+    """
+    def provideListOfPossibleMovesNoLeft(self, edge):
+        currentCapacity = self.currentCapacity
+        return [nextEdge for nextEdge in self.options[edge]
+                if currentCapacity[nextEdge] > 0]
+
+    """
+    Method to give all next edges with room; this represents the random - red
+    flashing light scenario.
+    edge   - edge id the car is at the end of
+    return - list of next edge ids
+    """
+    def provideListOfPossibleMovesRedLight(self, edge):
+        currentCapacity = self.currentCapacity
+        return [nextEdge for nextEdge in self.options[edge]
+                if currentCapacity[nextEdge] > 0]
+
+    """
+    Method to give the next edge for a car steered out of a loop: the first
+    segment with room in the driving distance ranking to the exits.
+    edge   - edge id the car is at the end of
+    return - list holding the next edge id, or empty if all options are full
+    """
+    def provideListOfPossibleMovesSteered(self, edge):
+        currentCapacity = self.currentCapacity
+        for nextEdge in self.steerOptions[edge]:
+            if currentCapacity[nextEdge] > 0:
+                return [nextEdge]
+        return []
+
+    """
+    Method to change available capacity in the road capacity buffer based on if
+    car is arriving or departing from a particular segment of road.  The running
+    system capacity total is updated alongside so it never needs a full rescan.
+    edge     - edge id of the road segment
+    arriving - True if a car enters the segment, False if one leaves it
+    return   - None
+    """
+    def changeAvailableCapacity(self, edge, arriving=True):
+        if arriving:
+            self.currentCapacity[edge] -= 1
+            self.availableCapacitySys -= 1
+        else:
+            self.currentCapacity[edge] += 1
+            self.availableCapacitySys += 1
+
+    """
+    Method to create the car state and the event queue with all cars inserted
+    in at an exponential random time.
+    return - None
+    """
+    def globalQueue(self):
+        network = self.network
+
+        numCars = 0
+        for key in self.lots:
+            X_COUNT = int(network.parkingLots[key] * self.parkingCapacity)
+            self.lotFirstCar[key] = numCars
+            numCars += X_COUNT
+        self.cars = CarState(numCars)
+        if self.pathSampleEvery:
+            self.trajectories = TrajectoryRecorder(network.numNodes(), numCars,
+                                                   self.pathSampleEvery)
+
+        cars = self.cars
+        initialEvents = []
+        for lotId, key in enumerate(self.lots):
+            X_COUNT = int(network.parkingLots[key] * self.parkingCapacity)
+            x_values = self.departureRandom.exponential(X_MEAN_PARKING, X_COUNT)
+            firstCar = self.lotFirstCar[key]
+            lotEdge = network.edgeStart[network.nodeIds[key]]
+            for count in range(X_COUNT):
+                car = firstCar + count
+                cars.edge[car] = lotEdge
+                cars.lot[car] = lotId
+                cars.departureTime[car] = x_values[count]
+            if self.lazyRelease:
+                # Cars leave a lot in departure time order, so only the next
+                # one has to be on the event list
+                order = np.argsort(x_values, kind='stable')
+                self.lotDepartures[lotId] = [x_values[order].tolist(),
+                                             (order + firstCar).tolist(), 0]
+                self.carsInLots += X_COUNT
+                self.releaseNextCar(lotId)
+                continue
+            for count in range(X_COUNT):
+                self.lastSequence += 1
+                initialEvents.append((float(x_values[count]),
+                                      self.lastSequence, EVENT_TOGO,
+                                      firstCar + count))
+        self.globalTimeList.extend(initialEvents)
+        if self.livelock is not None:
+            self.livelock.start(numCars, self.availableCapacitySys)
+
+    """
+    Method to put the next car of a parking lot on the event list (lazy
+    release).
+    lotId  - lot id, index into lots
+    return - None
+    """
+    def releaseNextCar(self, lotId):
+        departures = self.lotDepartures[lotId]
+        times, carIds, position = departures
+        if position == len(times):
+            return
+        departures[2] = position + 1
+        self.carsInLots -= 1
+        self.schedule(times[position], EVENT_LEAVES_LOT, carIds[position])
+
+    """
+    Method to simulate a car leaving its parking lot (lazy release); the lot's
+    next car is queued before this one moves.
+    car    - car id
+    return - None
+    """
+    def leavesLot(self, car):
+        self.releaseNextCar(self.cars.lot[car])
+        self.togo(car)
+
+    """
+    Method to schedule an event onto the event list
+    time   - time the event happens
+    kind   - what event (EVENT_TOGO, EVENT_ARRIVES, EVENT_LEAVES_LOT)
+    car    - car id
+    return - None
+    """
+    def schedule(self, time, kind, car):
+        self.lastSequence += 1
+        self.globalTimeList.push((time, self.lastSequence, kind, car))
+
+    """
+    Method to calculate travel time per road segment based on the segment's
+    free capacity, car size, and average travel speed.
+    edge   - edge id of the road segment
+    return - travel time
+    """
+    def calcTravelTime(self, edge):
+        return self.currentCapacity[edge] * self.carSizeFt / AVERAGE_CAR_SPEED_FTS
+
+    """
+    Method to simulate arrival of car into road segment
+    car    - car id
+    return - None
+    """
+    def arrives(self, car):
+        edge = self.cars.edge[car]
+        self.changeAvailableCapacity(edge, True)
+        if self.livelock is not None:
+            self.livelock.arrived(car)
+        self.schedule(self.now + self.calcTravelTime(edge), EVENT_TOGO, car)
+
+    """
+    Method to simulate togo event of car from one road segment to another road
+    segment
+    car    - car id
+    return - None
+    """
+    def togo(self, car):
+        cars = self.cars
+        edge = cars.edge[car]
+
+        # If car has reached an exit point, take car out of simulation
+        exitIndex = self.exitOfEdge[edge]
+        if exitIndex >= 0:
+            self.exitCounts[exitIndex] += 1
+            cars.exitTime[car] = self.now
+            if self.carRecords is not None:
+                self.carRecords.record(car, cars.lot[car],
+                                       cars.departureTime[car], self.now,
+                                       exitIndex, cars.hops[car])
+            self.departs(edge)
+            return
 
-    for downstreamNode in listOfPossibleDownstreamNodes:
-        if downstreamNode[0] == toNode:
-            currentCapacityToToNode = downstreamNode[1]
-            break
-    calcTime = currentCapacityToToNode * CAR_SIZE_FT / AVERAGE_CAR_SPEED_FTS
-    #print ("current capacity:",currentCapacityToToNode)
-    return calcTime
+        # Determine how the possible moves should be determined
+        values = []  # list of possible next edges
+        if self.steerOptions is not None and car in self.livelock.steered:
+            values = self.provideListOfPossibleMovesSteered(edge)
+        elif self.runMethod == "police":    # Police option
+            values = self.provideListOfPossibleMovesPolice(edge)
+        elif self.runMethod == "noWest":  # No west move option
+            values = self.provideListOfPossibleMovesNoLeft(edge)
+        elif self.runMethod == "random":  # Totally random option
+            values = self.provideListOfPossibleMovesRedLight(edge)
+
+        # Make car wait on the segments it could enter, if no choices
+        if len(values) == 0 and self.waitMode == 'wakeup' and \
+                self.waitForCapacity(car):
+            self.departs(edge)
+        # Make car wait, if no choices available
+        elif len(values) == 0:
+            self.departs(edge)
+            self.schedule(self.now + MEAN_WAITING_TIME, EVENT_ARRIVES, car)
+            if self.livelock is not None:
+                self.livelock.retryStarted(car)
+        # Choices are available, lets move
+        else:
+            if self.routeKey is None:
+                random_bound = len(values) - 1
+                nextEdge = values[self.routeRandom.randint(0,random_bound)]
+            else:
+                nextEdge = values[perCarRouteDraw(self.routeKey, car,
+                                                  cars.hops[car]) % len(values)]
+
+            # Check for leaving parking lot; don't increase capacity if so.  A
+            # path starts at the road node the lot feeds, so its first road
+            # segment is part of the path
+            if not self.isLotEdge[edge]:
+                self.departs(edge)
+            elif self.trajectories is not None:
+                self.trajectories.record(car, self.network.edgeTo[edge])
+            cars.edge[car] = nextEdge
+            cars.hops[car] += 1
+            if self.trajectories is not None:
+                self.trajectories.record(car, self.network.edgeTo[nextEdge])
+            if self.livelock is not None:
+                self.livelock.moved(car, nextEdge, cars.hops[car])
+
+            self.schedule(self.now, EVENT_ARRIVES, car)
+
+    """
+    Method to simulate depart event from a road segment
+    edge   - edge id of the road segment the car leaves
+    return - None
+    """
+    def departs(self, edge):
+        self.changeAvailableCapacity(edge, False)
+        if self.waitLists:
+            self.wakeWaitingCars(edge)
+
+    """
+    Method to give the segments a car at the end of a road segment is allowed
+    to enter under the current scenario, whether or not they have room.
+    edge   - edge id the car is at the end of
+    return - list of edge ids
+    """
+    def blockingEdges(self, edge):
+        return self.options[edge]
+
+    """
+    Method to put a blocked car on the wait list of every segment it could
+    enter.  Like a polling car, it gives up its slot while it waits and arrives
+    on its segment again when woken, but it is woken the moment one of those
+    segments frees a slot instead of every MEAN_WAITING_TIME seconds.
+    car    - car id
+    return - False if the car has nowhere it could ever go, so it has to
+             fall back to polling; True otherwise
+    """
+    def waitForCapacity(self, car):
+        edges = self.blockingEdges(self.cars.edge[car])
+        if len(edges) == 0:
+            return False
+        self.lastWaitToken += 1
+        token = self.lastWaitToken
+        self.waitTokens[car] = token
+        for edge in edges:
+            if edge not in self.waitLists:
+                self.waitLists[edge] = deque()
+            self.waitLists[edge].append((token, car))
+        return True
+
+    """
+    Method to wake cars waiting on a segment that just freed a slot.  One car
+    is woken per free slot; each woken car arrives again on its segment right
+    now and is dropped from the wait lists of its other segments.
+    edge   - edge id of the segment that freed a slot
+    return - None
+    """
+    def wakeWaitingCars(self, edge):
+        waiting = self.waitLists.get(edge)
+        freeSlots = self.currentCapacity[edge]
+        while waiting and freeSlots > 0:
+            token, car = waiting.popleft()
+            if self.waitTokens.get(car) != token:
+                continue # already woken through another segment
+            del self.waitTokens[car]
+            self.schedule(self.now, EVENT_ARRIVES, car)
+            freeSlots -= 1
+        if not waiting:
+            self.waitLists.pop(edge, None)
+
+    """
+    Method to start simulation.  Simulation will end once all events are done.
+    A trigger counter is in place in case user wants to run the totally random
+    simulation which theortically may never end unless the trigger counter is
+    used.  A run restored from a checkpoint (see simCheckpoint) carries on
+    from the event it was saved at.
+    return - SimulationResults of the run
+    """
+    def run(self):
+        if self.profiler is not None:
+            self.profiler.start()
+        if not self.started:
+            self.globalQueue()
+            self.started = True
+        events = self.globalTimeList
+        handlers = self.eventHandlers
+        count = self.eventCount
+        nextCheckpoint = count + self.checkpointEvery if self.checkpointFile \
+            else -1
+        # Stagnation checks are due at the end of every window; never when
+        # the run is not watched
+        watch = self.livelock
+        nextCheck = watch.nextCheck if watch is not None else math.inf
+        stopReason = 'drained'
+
+        while events:
+            (eventTime, sequence, kind, car) = events.pop()
+            if len(events) == 0:
+                self.endSimulation = eventTime
+            self.now = eventTime
+            handlers[kind](car)
+            count += 1
+            self.capacityMetrics.record(eventTime, self.availableCapacitySys)
+            if watch is not None:
+                watch.observe(self.availableCapacitySys - watch.retryingCars)
+            if count > self.numSimulations:
+                self.endSimulation = eventTime
+                stopReason = 'eventCap'
+                break
+            if eventTime >= nextCheck:
+                if watch.check(eventTime, sum(self.exitCounts),
+                               self.availableCapacitySys -
+                               watch.retryingCars):
+                    self.endSimulation = eventTime
+                    stopReason = 'stagnation'
+                    break
+                nextCheck = watch.nextCheck
+            if count == nextCheckpoint:
+                self.eventCount = count
+                saveCheckpoint(self, self.checkpointFile)
+                nextCheckpoint += self.checkpointEvery
+
+        self.eventCount = count
+        if self.trajectories is not None:
+            self.trajectories.finish()
+        self.capacityMetrics.finish()
+        if self.carRecords is not None:
+            self.carRecords.finish(self.cars)
+        profile = None
+        if self.profiler is not None:
+            self.profiler.stop()
+            profile = self.profiler.report()
+        livelock = watch.report(stopReason) if watch is not None else None
+        exitCount = dict(zip(self.exitList, self.exitCounts))
+        return SimulationResults(count - 1,
+                                 self.endSimulation - BEGIN_SIMULATION,
+                                 exitCount, self.capacityMetrics,
+                                 self.trajectories,
+                                 len(events) + self.carsInLots,
+                                 len(self.waitTokens), self.cars, profile,
+                                 livelock)
+
+    """
+    Method to check current capacity in the road capacity buffer; symbolizes
+    current capacity on all roads.  This is a full rescan, so the simulation
+    loop samples the running availableCapacitySys total instead; kept for setup
+    and checking.
+    return - total available capacity
+    """
+    def calcAvailableCapSys(self):
+        return sum(self.currentCapacity)
 
 
 """
-Method to simulate arrival of car into road segment
-car_tuple - (#timestamp, fromNode, toNode, parkinglot((50,87),car #))
-return    - None
+Method to give a compact summary of a run that can be stored as JSON.
+results         - SimulationResults of a run
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that was full
+numSimulations  - event cap of the run
+return          - dictionary summary of the run
 """
-def arrives (car_tuple):
-    changeAvailableCapacity(car_tuple[1], car_tuple[2], True)
-    t_done = car_tuple[0] + calcTravelTime(car_tuple[1],car_tuple[2])#MEAN_TRAVEL_TIME
-    car_tuple = (t_done, car_tuple[1], car_tuple[2], car_tuple[3])
-    schedule (car_tuple, togo)
+def resultsSummary(results, runMethod, parkingCapacity, numSimulations):
+    cars = results.cars.asNumpy()
+    exited = ~np.isnan(cars['exitTime'])
+    evacuationTimes = cars['exitTime'][exited] - cars['departureTime'][exited]
+    return {'runMethod': runMethod,
+            'parkingCapacity': parkingCapacity,
+            'numSimulations': numSimulations,
+            'eventCount': results.eventCount,
+            'simulationTime': float(results.simulationTime),
+            'cars': results.cars.numCars,
+            'carsExited': results.carsExited(),
+            'exitCount': dict(('%d,%d' % exitPoint, count)
+                              for exitPoint, count in results.exitCount.items()),
+            'meanEvacuationTime': float(evacuationTimes.mean())
+                                  if len(evacuationTimes) else None,
+            'meanHops': float(cars['hops'][exited].mean())
+                        if exited.any() else None,
+            'startingRoadCapacity': results.capacityMetrics.first,
+            'finalRoadCapacity': results.capacityMetrics.last,
+            'remainingEvents': results.remainingEvents,
+            'waitingCars': results.waitingCars,
+            'livelock': results.livelock}
 
 """
-Method to simulate togo event of car from one road segment to another road
-segment
-car_tuple - (#timestamp, fromNode, toNode, parkinglot((50,87),car #))
-return    - None
+Method to start a figure.  A figure drawn to a file is built on the Agg canvas
+without pyplot, so it renders on headless machines and never opens a window.
+matplotlib is imported here rather than at the top of the module, so runs that
+do not plot never pay for loading it.
+fileName - image file the figure will be saved to; None to show it
+return   - (figure, axes)
 """
-def togo (car_tuple):
-    global exit_count
-    values = []  # list of possible moves
-
-    # If car has reached an exit point, take car out of simulation
-    if car_tuple[2] in exit_list:
-        exit_count[car_tuple[2]] += 1
-        departs(car_tuple[1],car_tuple[2])
+def newFigure(fileName=None):
+    if fileName:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = Figure()
+        FigureCanvasAgg(figure)
     else:
-        # Determine how the possible moves should be determined
-        if RUN_METHOD == "police":    # Police option
-            values = provideListOfPossibleMovesPolice(car_tuple[1], car_tuple[2])
-        elif RUN_METHOD == "noWest":  # No west move option
-            values = provideListOfPossibleMovesNoLeft(car_tuple[1], car_tuple[2])
-        elif RUN_METHOD == "random":  # Totally random option
-            values = provideListOfPossibleMovesRedLight(car_tuple[1], car_tuple[2])
-
-        # Make car wait, if no choices available
-        if len(values) == 0:
-            t_done = car_tuple[0] + MEAN_WAITING_TIME
-            car_tuple = (t_done, car_tuple[1], car_tuple[2], car_tuple[3])
-            departs(car_tuple[1],car_tuple[2])
-            schedule(car_tuple, arrives)
-        # Choices are available, lets move
-        else:
-            random_bound = len(values) - 1
-            index = randint(0,random_bound)
-
-            # Check for leaving parking lot; don't increase capacity if so
-            if car_tuple[1] not in parkingLots:
-                #print ("parkinglot ",parkingLots)
-                #print (car_tuple[1])
-                departs(car_tuple[1], car_tuple[2])
-            car_tuple = (car_tuple[0], car_tuple[2], values[index][0], car_tuple[3])
-            paths[car_tuple[3]].append(car_tuple[2])
-
-            schedule(car_tuple, arrives)
+        import matplotlib.pyplot as plt
+        figure = plt.figure()
+    return figure, figure.add_subplot(1, 1, 1)
 
 """
-Method to simulate depart event from a road segment
-fromNode - Where car is coming from
-toNode   - Where car is going to; basically symbolizes road segment
+Method to finish a figure: save it to its file, or show it.
+figure   - figure from newFigure
+fileName - image file to save to; None to show the figure
 return   - None
 """
-def departs (fromNode, toNode):
-    #print("FROM AND TO NODES IN DEPARTS:", fromNode, "===>", toNode)
-    #global currentRoadCapacities
-
-    changeAvailableCapacity(fromNode, toNode, False)
-
+def showFigure(figure, fileName=None):
+    if fileName:
+        figure.savefig(fileName, dpi=PLOT_DPI)
+    else:
+        import matplotlib.pyplot as plt
+        plt.show()
 
 """
-Method to calculate the capacity for a road between two nodes based on two
-end points and number of lanes of road between those two nodes.
-firstNode  - firstNode to pull from
-secondNode - secondNode to pull from
-numLanes   - number of lanes between firstNode and secondNode
-Return - return capacity of road between the firstNode and secondNode
+Method to plot the remaining road capacity over simulation time.
+results  - SimulationResults of a run
+fileName - image file to save the plot to; None to show it
+return   - None
 """
-def calculateRoadCapacity(firstNode, secondNode, numLanes):
-    # Use Euclid distance
-    distance = ((firstNode[0] - secondNode[0])**2 +
-                (firstNode[1] - secondNode[1])**2)**(0.5)
-    numCarsCapacity = (distance * numLanes) // CAR_SIZE
-
-    return int(numCarsCapacity)
-
-
+def plotCapacity(results, fileName=None):
+    figure, axes = newFigure(fileName)
+    times, lowest, highest, average = results.capacityMetrics.series()
+    axes.fill_between(times, lowest, highest, step='post', alpha=0.3)
+    axes.step(times, average, where='post')
+    axes.set_xlabel('Simulation Time (seconds)')
+    axes.set_ylabel('Remaining Capacity in Road Network')
+    figure.suptitle('Random Condition with 100% Capacity in Parking Lots')
+    showFigure(figure, fileName)
 
 """
-Method to start simulation.  Simulation will end once all events are done.
-A trigger counter is in place in case user wants to run the totally random
-simulation which theortically may never end unless the trigger counter is used.
-events - global list of events to work through
+Method to count the recorded cars that drove each road segment, from the
+stored paths in one pass.  A path starts at the road node its parking lot
+feeds, so every road segment a car entered is counted, and only the segment
+out of the parking lot is not; with every car recorded the counts add up to
+the cars' hops.
+network      - compiled RoadNetwork the run used
+trajectories - TrajectoryRecorder of the run
+return       - array of cars per edge id; scaled up by the sampling rate when
+               only every n-th car was recorded
 """
-def simulate (events):
-    global END_SIMULATION
-    # print ("\nFuture event list:\n%s" % str (events))
-    # print ("\nt=0: %s" % str (s))
-    count = 0
-
-    while events:
-        (car_tuple,event) = heappop (events)
-        if len(events) == 0:
-            END_SIMULATION = car_tuple[0]
-        event(car_tuple)
-        count += 1
-        capacityTracker.append(calcAvailableCapSys())
-        if count > NUM_SIMULATIONS:
-            END_SIMULATION = car_tuple[0]
-            break
-        #print ("t=%d: event '%s' => '%s'" % (t, e.__name__, str (s)))
-
-    print("Simulations:",count-1)
-    print("Simulation Time:",END_SIMULATION-BEGIN_SIMULATION)
-    print ("Exit car counts:", exit_count)
-
+def edgeUsage(network, trajectories):
+    cars, fromIds, toIds = trajectories.segments()
+    numNodes = network.numNodes()
+    # Edge id of every (from node, to node) pair through its sorted key
+    edgeKeys = np.asarray(network.edgeFrom, dtype=np.int64) * numNodes + \
+        np.asarray(network.edgeTo, dtype=np.int64)
+    order = np.argsort(edgeKeys)
+    moveKeys = fromIds.astype(np.int64) * numNodes + toIds
+    edges = order[np.searchsorted(edgeKeys[order], moveKeys)]
+    return np.bincount(edges, minlength=network.numEdges()) * \
+        trajectories.sampleEvery
 
 """
-Method to check current capacity in master queue dictionary; symbolizes current
-capacity on all roads.
-return - None
+Method to plot the paths of the recorded cars.  All paths go into a single
+LineCollection (one polyline per car), so there is one artist however many
+cars there are; each car keeps one colour of the default colour cycle.
+network  - compiled RoadNetwork the run used
+results  - SimulationResults of a run with recorded trajectories
+fileName - image file to save the plot to; None to show it
+return   - None
 """
-def calcAvailableCapSys():
-    count = 0
+def plotPaths(network, results, fileName=None):
+    from matplotlib import rcParams
+    from matplotlib.collections import LineCollection
+    figure, axes = newFigure(fileName)
+    nodeArray = np.array(network.nodes)
+    cars, paths = results.trajectories.paths()
+    colours = np.array(rcParams['axes.prop_cycle'].by_key()['color'])
+    axes.add_collection(LineCollection(
+        [nodeArray[path] for path in paths],
+        colors=colours[np.arange(len(paths)) % len(colours)]))
+    axes.autoscale()
+    axes.set_xlabel('X')
+    axes.set_ylabel('Y')
+    title = 'Path of Cars in Random Condition with 0.5% Capacity in One ' \
+        'Parking Lot'
+    if results.trajectories.sampleEvery > 1:
+        title += ' (every %dth car)' % results.trajectories.sampleEvery
+    figure.suptitle(title)
+    axes.invert_yaxis()
+    showFigure(figure, fileName)
 
-    for key in currentRoadCapacities:
-        for queue in currentRoadCapacities[key]:
-            count += queue[1]
-
-    return count
+"""
+Method to plot how many cars drove each road segment as a heat map: one line
+per segment coloured by its count, instead of one line per car.  Unused
+segments are drawn in light grey; busier segments are drawn on top.
+network  - compiled RoadNetwork the run used
+results  - SimulationResults of a run with recorded trajectories
+fileName - image file to save the plot to; None to show it
+return   - None
+"""
+def plotEdgeUsage(network, results, fileName=None):
+    from matplotlib.collections import LineCollection
+    figure, axes = newFigure(fileName)
+    nodeArray = np.array(network.nodes)
+    usage = edgeUsage(network, results.trajectories)
+    order = np.argsort(usage, kind='stable')
+    lines = np.stack((nodeArray[np.asarray(network.edgeFrom)[order]],
+                      nodeArray[np.asarray(network.edgeTo)[order]]), axis=1)
+    used = usage[order] > 0
+    axes.add_collection(LineCollection(lines[~used], colors='lightgrey',
+                                       linewidths=0.5))
+    heat = LineCollection(lines[used], cmap='inferno_r', linewidths=2)
+    heat.set_array(usage[order][used])
+    axes.add_collection(heat)
+    figure.colorbar(heat, ax=axes, label='Cars per Road Segment')
+    axes.autoscale()
+    axes.set_xlabel('X')
+    axes.set_ylabel('Y')
+    figure.suptitle('Road Segment Usage')
+    axes.invert_yaxis()
+    showFigure(figure, fileName)
 
 
 def main():
     args = sys.argv
-    global parkingLots
-    global currentRoadCapacities
-    global RUN_METHOD
-    global PARKING_CAPACITY
-    global NUM_SIMULATIONS
     acceptableFileFormat = ['csv']
     acceptableScenarios  = ['police', 'noWest', 'random']
     acceptableCapacities = [0.005,1.0]
-    acceptablePlotting   = ['capacity','path','both']
+    acceptablePlotting   = ['capacity','path','both','heatmap','none']
 
-    if len(args) != 6:
+    if len(args) < 6 or len(args) > 9:
         print ("Incorrect number of arguments - Format-> python evalSim.py "
                "world2.csv [police, noWest, random] [0.01-1.00] [capacity,path,"
-               "or both] [# of simulations]")
+               "both,heatmap, or none] [# of simulations] [results prefix (optional)] "
+               "[profile (optional)] [checkpoint (optional)]")
         exit(0)
 
     mapFile = args[1]
-    RUN_METHOD = args[2] # 1(Police), 2(No West), 3(Random, Redlight)
-    PARKING_CAPACITY = float(args[3])
+    runMethod = args[2] # 1(Police), 2(No West), 3(Random, Redlight)
+    parkingCapacity = float(args[3])
     plottingMethod = args[4]
-    NUM_SIMULATIONS = int(args[5])
+    numSimulations = int(args[5])
+    # The optional arguments may come in any order: the flags are picked out
+    # by name and the one argument left, if any, is the results prefix
+    flags = [arg for arg in args[6:] if arg in ('profile', 'checkpoint')]
+    prefixes = [arg for arg in args[6:] if arg not in flags]
+    profile = 'profile' in flags
+    resultsPrefix = prefixes[0] if prefixes else None
+    checkpointFile = (resultsPrefix or 'evacSim') + '-checkpoint.bin' \
+        if 'checkpoint' in flags else None
 
     # Check acceptable file format
     if mapFile[-3:] not in acceptableFileFormat:
         print("Not acceptable file format...needs to be '.csv'")
         exit(0)
     # Check acceptable scenario option
-    if RUN_METHOD not in acceptableScenarios:
+    if runMethod not in acceptableScenarios:
         print("Not acceptable run method...needs to be 'police', 'noWest', or "
               "'random'.")
         exit(0)
     # Check acceptable range of parking capacity
-    if PARKING_CAPACITY < acceptableCapacities[0] or PARKING_CAPACITY > \
+    if parkingCapacity < acceptableCapacities[0] or parkingCapacity > \
         acceptableCapacities[1]:
         print("Parking capacity has to be between 0.005 and 1.00, inclusive.")
         exit(0)
     # Check acceptable plotting method
     if plottingMethod not in acceptablePlotting:
-        print("Not acceptable print method...needs to be 'capacity', 'path', or"
-              "'both'")
+        print("Not acceptable print method...needs to be 'capacity', 'path', "
+              "'both', 'heatmap', or 'none'")
         exit(0)
     # Check for simulation counts
-    if NUM_SIMULATIONS < 1:
+    if numSimulations < 1:
         print("Number of simulations has to be greater than 0")
         exit(0)
+    # Check the optional arguments
+    if len(prefixes) > 1:
+        print("Only one results prefix can be given, got: " +
+              ", ".join(prefixes))
+        exit(0)
+    if profile and checkpointFile:
+        print("A profiled run can not be checkpointed...use either 'profile' "
+              "or 'checkpoint'.")
+        exit(0)
 
 
-    # Create intersections and parking lots dictionary
-    intersections, parkingLots = readFileAndSetUp(mapFile)
-    # Create current road capacities dictionary
-    currentRoadCapacities = createQueuingCapacityDict(intersections)
-
-    #print("travelTime:",calcTravelTime((347,114),(348,30)))
-
-    # Temp for testing only one parking lot
-    # newParkingLots = {}
-    # newParkingLots[(50,87)] = parkingLots[(50,87)]
-    # print (newParkingLots)
-    # globalQueue(newParkingLots)
-
-    # Create global event queue to run simulation with
-    globalQueue(parkingLots)
-    #print (len(globalTimeList))
-    #print("GLOBAL QUEUE:", sorted(globalTimeList))
-
-    # Run Simulation
-    simulate (globalTimeList)
-
-
-    print("Starting Road Capacity:",capacityTracker[0])
-    print("Final Road Capacity at Simulation Stop Time:",capacityTracker[-1])
-    print ("Current cars in global event queue",len(globalTimeList))
-    print ("AFTER COMPLETION globaltimelist",globalTimeList)
-    #print("(539,212)",currentRoadCapacities[(539,212)])
-    #print("(562,32)",currentRoadCapacities[(562,32)])
-
-    # For plotting
+    # Create intersections and parking lots and compile the road network
+    network = loadRoadNetwork(mapFile)
+
+    # Run Simulation; paths are only recorded when they will be plotted
+    pathSampleEvery = PATH_SAMPLE_EVERY if plottingMethod in ("path", "both",
+                                                              "heatmap") \
+        else 0
+    carRecordFile = resultsPrefix + '-cars.csv' if resultsPrefix else None
+    simulation = Simulation(network, runMethod, parkingCapacity, numSimulations,
+                            pathSampleEvery=pathSampleEvery,
+                            carRecordFile=carRecordFile, profile=profile,
+                            checkpointFile=checkpointFile)
+    results = simulation.run()
+
+    print("Simulations:",results.eventCount)
+    print("Simulation Time:",results.simulationTime)
+    print ("Exit car counts:", results.exitCount)
+    print("Starting Road Capacity:",results.capacityMetrics.first)
+    print("Final Road Capacity at Simulation Stop Time:",
+          results.capacityMetrics.last)
+    print ("Current cars in global event queue",results.remainingEvents)
+    if resultsPrefix:
+        with open(resultsPrefix + '-summary.json', 'w') as summaryFile:
+            json.dump(resultsSummary(results, runMethod, parkingCapacity,
+                                     numSimulations), summaryFile, indent=2)
+        print("Per car records:", carRecordFile)
+        print("Summary:", resultsPrefix + '-summary.json')
+    if profile:
+        print("Phase,seconds,share of run")
+        for phase, timing in sorted(results.profile['phases'].items(),
+                                    key=lambda item: -item[1]['seconds']):
+            print("%s,%.3f,%.1f%%" % (phase, timing['seconds'],
+                                      100 * timing['share']))
+        if resultsPrefix:
+            with open(resultsPrefix + '-profile.json', 'w') as profileFile:
+                json.dump(results.profile, profileFile, indent=2)
+            print("Profile:", resultsPrefix + '-profile.json')
+
+    # For plotting; 'none' never loads matplotlib.  With a results prefix the
+    # plots are saved as images instead of shown, for headless batch runs
+    plotFile = lambda plot: resultsPrefix + '-' + plot + '.png' \
+        if resultsPrefix else None
     if plottingMethod == "capacity" or plottingMethod == "both":
-        # Plot road capacities
-        plt.plot(capacityTracker)
-        plt.xlabel('Number of Simulations')
-        plt.ylabel('Remaining Capacity in Road Network')
-        plt.suptitle('Random Condition with 100% Capacity in Parking Lots')
-        #plt.savefig('Random-100-Capacity')
-        plt.show()
+        plotCapacity(results, plotFile('capacity'))
     if plottingMethod == "path" or plottingMethod == "both":
-        # Plot paths of cars
-        for key in paths:
-            dataArray = np.array(paths[key])
-            transposed = dataArray.T
-            x,y = transposed
-            plt.plot(x,y)
-        plt.xlabel('X')
-        plt.ylabel('Y')
-        plt.suptitle('Path of Cars in Random Condition with 0.5% Capacity '
-                     'in One Parking Lot')
-        plt.gca().invert_yaxis()
-        #plt.savefig('Random-005-Path')
-        plt.show()
+        plotPaths(network, results, plotFile('paths'))
+    if plottingMethod == "heatmap":
+        plotEdgeUsage(network, results, plotFile('heatmap'))
+    if resultsPrefix and plottingMethod != "none":
+        print("Plots:", resultsPrefix + '-*.png')
 
 
-    #print("EXIT CT", exit_count)
 if __name__=='__main__':
 	main()
 
@@ -0,0 +1,135 @@
+from heapq import heappush, heappop, heapify
+
+CALENDAR_BUCKET_SECONDS = 0.25 # simulated seconds covered by one calendar bucket
+
+
+"""
+Event list kept as one binary heap, the simulator's original event list.
+Entries are event tuples starting with their time, (time, sequence #, kind,
+car id), and come out in tuple order.
+"""
+class HeapEventList(object):
+    def __init__(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    """
+    Method to add many entries at once, cheaper than pushing them one by one.
+    entries - list of event tuples
+    return  - None
+    """
+    def extend(self, entries):
+        self.heap.extend(entries)
+        heapify(self.heap)
+
+    """
+    Method to add an entry.
+    entry  - event tuple
+    return - None
+    """
+    def push(self, entry):
+        heappush(self.heap, entry)
+
+    """
+    Method to remove and give the earliest entry.
+    return - event tuple
+    """
+    def pop(self):
+        return heappop(self.heap)
+
+    """
+    Method to list the pending entries, in no particular order.
+    return - list of event tuples
+    """
+    def items(self):
+        return list(self.heap)
+
+
+"""
+Calendar (bucket) event list.  Time is cut into buckets of bucketSeconds;
+entries for future buckets are only appended to their bucket's list, and a
+bucket is heap ordered once, when it becomes the current one.  Events in this
+simulator are spread over a narrow window (a travel time or MEAN_WAITING_TIME
+ahead of the clock), so the current bucket stays small and most pushes are a
+plain append.  Entries come out in exactly the same order as from
+HeapEventList, since bucket order follows time and ties inside a bucket are
+broken the same way.
+bucketSeconds - simulated seconds per bucket
+"""
+class CalendarEventList(object):
+    def __init__(self, bucketSeconds=CALENDAR_BUCKET_SECONDS):
+        self.bucketSeconds = float(bucketSeconds)
+        self.current = [] # heap of the bucket being served
+        self.currentIndex = None
+        self.buckets = {} # bucket index -> unsorted list of entries
+        self.bucketOrder = [] # heap of the indices in buckets
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    """
+    Method to add many entries at once.
+    entries - list of event tuples
+    return  - None
+    """
+    def extend(self, entries):
+        for entry in entries:
+            self.push(entry)
+
+    """
+    Method to add an entry.
+    entry  - event tuple
+    return - None
+    """
+    def push(self, entry):
+        index = int(entry[0] // self.bucketSeconds)
+        self.count += 1
+        if self.currentIndex is not None and index <= self.currentIndex:
+            heappush(self.current, entry)
+            return
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            self.buckets[index] = [entry]
+            heappush(self.bucketOrder, index)
+        else:
+            bucket.append(entry)
+
+    """
+    Method to remove and give the earliest entry.
+    return - event tuple
+    """
+    def pop(self):
+        if not self.current:
+            self.currentIndex = heappop(self.bucketOrder)
+            self.current = self.buckets.pop(self.currentIndex)
+            heapify(self.current)
+        self.count -= 1
+        return heappop(self.current)
+
+    """
+    Method to list the pending entries, in no particular order.
+    return - list of event tuples
+    """
+    def items(self):
+        entries = list(self.current)
+        for bucket in self.buckets.values():
+            entries.extend(bucket)
+        return entries
+
+
+"""
+Method to create an event list by name.
+kind          - 'heap' or 'calendar'
+bucketSeconds - bucket width of a calendar event list
+return        - empty event list
+"""
+def createEventList(kind, bucketSeconds=CALENDAR_BUCKET_SECONDS):
+    if kind == 'heap':
+        return HeapEventList()
+    if kind == 'calendar':
+        return CalendarEventList(bucketSeconds)
+    raise ValueError("Unknown event list '%s'; use 'heap' or 'calendar'"
+                     % kind)
@@ -0,0 +1,174 @@
+import numpy as np
+from array import array
+
+LIVELOCK_POLICIES = ['report', 'terminate', 'steer']
+STAGNATION_SECONDS = 600.0 # simulated seconds without exits or capacity change
+LIVELOCK_TOP_CARS = 20 # stuck cars listed in a report
+
+
+"""
+Online livelock detection for one Simulation run.
+Loops: every car keeps one checkpoint segment, renewed whenever its number of
+moves reaches a power of two (Brent's cycle detection), and a car that moves
+onto its checkpoint segment again has gone round a loop without getting
+anywhere.  This costs two array slots per car and finds any loop within about
+twice its length.
+Stagnation: the event loop passes the free capacity of the whole network
+after every event, and the monitor keeps its minimum and maximum and the
+number of exited cars over windows of windowSeconds of simulated time.  A
+window with no exits and a minimum equal to its maximum saw the capacity not
+change at all, and the network is stagnant from the start of the first of a
+row of such windows.  A blocked car in poll mode gives up its slot until it
+retries, so cars out on a retry are counted as still on their segment;
+otherwise blocked cars polling forever would look like traffic.
+Policies:
+'report'    - count loops and stagnation and report the cars still on the
+              roads when the run stops (stuck cars), looping or not
+'terminate' - also end the run as soon as the network stagnates
+'steer'     - also route every car caught in a loop along the network distance
+              ranking (the police next hops by driving distance) for the rest
+              of its trip, which always leads towards an exit
+simulation    - Simulation being watched
+policy        - 'report', 'terminate' or 'steer'
+windowSeconds - simulated seconds of the stagnation window
+"""
+class LivelockMonitor(object):
+    def __init__(self, simulation, policy, windowSeconds=STAGNATION_SECONDS):
+        if policy not in LIVELOCK_POLICIES:
+            raise ValueError("livelock policy has to be 'report', 'terminate' "
+                             "or 'steer'")
+        self.simulation = simulation
+        self.policy = policy
+        self.windowSeconds = windowSeconds
+        self.checkpointEdge = None
+        self.loopCount = None
+        self.loops = 0
+        self.steered = set()
+        self.nextCheck = windowSeconds
+        # Window being watched: start time, exits at its start and the
+        # smallest and largest free capacity in it
+        self.windowStart = 0.0
+        self.windowExits = 0
+        self.windowMin = None
+        self.windowMax = None
+        self.stagnantSince = None
+        self.retrying = None # 1 for a car waiting to retry in poll mode
+        self.retryingCars = 0
+
+    """
+    Method to size the per car arrays once the cars are known.
+    numCars  - number of cars in the run
+    capacity - free capacity of the whole network at the start
+    return   - None
+    """
+    def start(self, numCars, capacity):
+        self.checkpointEdge = array('l', [-1]) * numCars
+        self.loopCount = array('l', [0]) * numCars
+        self.retrying = array('b', [0]) * numCars
+        self.windowMin = self.windowMax = capacity
+
+    """
+    Method to note a blocked car giving up its slot until it retries (poll
+    mode).
+    car    - car id
+    return - None
+    """
+    def retryStarted(self, car):
+        self.retrying[car] = 1
+        self.retryingCars += 1
+
+    """
+    Method to note a car arriving on its segment, which ends a retry wait.
+    car    - car id
+    return - None
+    """
+    def arrived(self, car):
+        if self.retrying[car]:
+            self.retrying[car] = 0
+            self.retryingCars -= 1
+
+    """
+    Method to note the free capacity of the whole network after an event.
+    capacity - free capacity of the whole network, not counting the slots of
+               cars waiting to retry
+    return   - None
+    """
+    def observe(self, capacity):
+        if capacity < self.windowMin:
+            self.windowMin = capacity
+        elif capacity > self.windowMax:
+            self.windowMax = capacity
+
+    """
+    Method to note a car's move and check it for a loop.
+    car      - car id
+    nextEdge - edge id the car moves onto
+    hops     - number of moves the car has made, this one included
+    return   - None
+    """
+    def moved(self, car, nextEdge, hops):
+        if nextEdge == self.checkpointEdge[car]:
+            self.loops += 1
+            self.loopCount[car] += 1
+            if self.policy == 'steer':
+                self.steered.add(car)
+        if hops & (hops - 1) == 0:
+            self.checkpointEdge[car] = nextEdge
+
+    """
+    Method to check the window that just ended for stagnation and start the
+    next one.
+    now      - current simulation time
+    exits    - number of cars that have exited
+    capacity - free capacity of the whole network, not counting the slots of
+               cars waiting to retry
+    return   - True if the run should stop
+    """
+    def check(self, now, exits, capacity):
+        stagnant = exits == self.windowExits and \
+            self.windowMin == self.windowMax
+        if stagnant and self.stagnantSince is None:
+            self.stagnantSince = self.windowStart
+        elif not stagnant:
+            self.stagnantSince = None
+        self.windowStart = now
+        self.windowExits = exits
+        self.windowMin = self.windowMax = capacity
+        while self.nextCheck <= now:
+            self.nextCheck += self.windowSeconds
+        return stagnant and self.policy == 'terminate'
+
+    """
+    Method to give the livelock report of the run.
+    Stuck cars are the cars still on the roads when the run stops, blocked,
+    waiting or looping; cars that never left their lot are counted apart.
+    stopReason - why the run ended: 'drained', 'eventCap' or 'stagnation'
+    return     - dictionary report, ready to be saved as JSON
+    """
+    def report(self, stopReason):
+        simulation = self.simulation
+        cars = simulation.cars
+        network = simulation.network
+        arrays = cars.asNumpy()
+        loopCount = np.frombuffer(self.loopCount, dtype='l')
+        # Cars still on the roads: not exited and no longer on a lot segment
+        onLot = np.asarray(simulation.isLotEdge, dtype=bool)[arrays['edge']]
+        notExited = np.isnan(arrays['exitTime'])
+        stuck = np.nonzero(notExited & ~onLot)[0]
+        # Looping cars first, most loops first
+        stuck = stuck[np.argsort(-loopCount[stuck], kind='stable')].tolist()
+        return {'policy': self.policy,
+                'stopReason': stopReason,
+                'loopsDetected': self.loops,
+                'loopingCars': int((loopCount > 0).sum()),
+                'steeredCars': len(self.steered),
+                'stuckCars': len(stuck),
+                'stuckLoopingCars': int((loopCount[stuck] > 0).sum()),
+                'carsInLots': int((notExited & onLot).sum()),
+                'stagnantSince': self.stagnantSince,
+                'topStuckCars': [
+                    {'car': car,
+                     'loops': self.loopCount[car],
+                     'hops': cars.hops[car],
+                     'at': list(network.nodes[network.edgeTo[cars.edge[car]]])}
+                    for car in stuck[:LIVELOCK_TOP_CARS]]}
@@ -0,0 +1,336 @@
+import sys
+import time
+import numpy as np
+from scipy.stats import ttest_ind
+from evacSim import (loadRoadNetwork, Simulation, SCALE, X_MEAN_PARKING,
+                     MEAN_WAITING_TIME, AVERAGE_CAR_SPEED_FTS, POLICE_ROUTING,
+                     networkExits)
+
+LOCKSTEP_TIME_STEP = 0.25 # seconds per lockstep tick; 1 second ticks skew noWest exits at full lots
+LOCKSTEP_MAX_TIME = 20000.0 # seconds before a batch is cut off
+LOCKSTEP_MAX_ROUNDS = 50 # move rounds per tick, bounds zero travel time loops
+NOT_ON_ROAD = -1 # car edge value once the car has exited
+COMPARE_ALPHA = 0.01 # Welch t-test level the clearance times have to pass
+COMPARE_SHARE_TOLERANCE = 0.02 # largest difference of an exit's share of cars
+
+"""
+Method to pad a list of edge id lists into a rectangular table, so a whole batch
+of cars can look up its options with one fancy index.
+rows   - list of lists of edge ids, one per edge id
+return - int array of shape [edges, max options], padded with -1
+"""
+def padEdgeTable(rows):
+    width = max([len(row) for row in rows] + [1])
+    table = np.full((len(rows), width), -1, dtype=np.int64)
+    for edge, row in enumerate(rows):
+        table[edge, :len(row)] = row
+    return table
+
+
+"""
+Results of a lockstep batch; every array has one entry (or row) per
+replication.
+clearanceTime - time of the last exit, or the cut off time if cars remain
+exitCounts    - cars per exit, shape [replications, exits], in exitList order
+carsExited    - cars that left the network
+meanExitTime  - mean exit time over the cars that left
+carsRemaining - cars still on the network or in a lot at the end
+steps         - number of lockstep ticks the batch took
+"""
+class LockstepResults(object):
+    def __init__(self, clearanceTime, exitCounts, carsExited, meanExitTime,
+                 carsRemaining, steps):
+        self.clearanceTime = clearanceTime
+        self.exitCounts = exitCounts
+        self.carsExited = carsExited
+        self.meanExitTime = meanExitTime
+        self.carsRemaining = carsRemaining
+        self.steps = steps
+
+
+"""
+Time stepped engine that advances many replications of one scenario together
+as NumPy arrays.  Capacities are indexed [replication, edge] and car state
+[replication, car]; every tick all cars whose travel (or wait) is over try to
+move at once, with random departure times and route choices drawn in batches.
+The road model is the event engine's: same capacities, same capacity based
+travel time, same police ranking and noWest rule, and a blocked car gives up
+its slot for MEAN_WAITING_TIME and then arrives on its segment again, as in
+the event engine's poll mode.  Cars that want the same segment in the same tick are
+let in in order of when they became ready, up to the free capacity.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+exitList        - list of (x,y) exit locations; None for the network's own
+                  exits (see networkExits)
+timeStep        - seconds per tick
+policeRouting   - 'straight' or 'network' ranking for the police scenario
+"""
+class LockstepEngine(object):
+    def __init__(self, network, runMethod, parkingCapacity, exitList=None,
+                 timeStep=LOCKSTEP_TIME_STEP, policeRouting=POLICE_ROUTING):
+        self.network = network
+        self.runMethod = runMethod
+        self.timeStep = timeStep
+        self.exitList = list(networkExits(network) if exitList is None
+                             else exitList)
+        self.carSizeFt = network.carSize / SCALE
+        numEdges = network.numEdges()
+        edgeTo = np.array(network.edgeTo, dtype=np.int64)
+        self.maxCapacity = np.array(network.maxCapacity, dtype=np.int64)
+
+        # Exit index of each edge's downstream node, -1 if not an exit
+        exitOfNode = np.full(network.numNodes(), -1, dtype=np.int64)
+        for index, exitPoint in enumerate(self.exitList):
+            if exitPoint in network.nodeIds:
+                exitOfNode[network.nodeIds[exitPoint]] = index
+        self.exitOfEdge = exitOfNode[edgeTo]
+
+        # Options of a car at the end of each edge under the scenario
+        options = network.scenarioOptions(runMethod, self.exitList,
+                                          policeRouting)
+        self.options = padEdgeTable(options)
+
+        # Every car starts on its lot's edge; lot edges never hold capacity
+        self.isParkingEdge = np.zeros(numEdges, dtype=bool)
+        carEdges = []
+        for lot in network.parkingLots:
+            lotEdge = network.edgeStart[network.nodeIds[lot]]
+            self.isParkingEdge[lotEdge] = True
+            carEdges.extend([lotEdge] * int(network.parkingLots[lot] *
+                                            parkingCapacity))
+        self.carLotEdge = np.array(carEdges, dtype=np.int64)
+
+    """
+    Method to pick the next edge for a batch of cars.
+    edges     - current edge of each car
+    capacity  - flat [replication * edge] free capacity
+    offsets   - replication * number of edges for each car
+    rng       - numpy Generator for route choices
+    return    - chosen edge per car, -1 where every option is full
+    """
+    def chooseNextEdges(self, edges, capacity, offsets, rng):
+        candidates = self.options[edges]
+        valid = candidates >= 0
+        free = valid & (capacity[offsets[:, None] +
+                                 np.where(valid, candidates, 0)] > 0)
+        if self.runMethod == 'police':
+            # First ranked option with room
+            score = free.astype(np.float64)
+        else:
+            # Uniform choice among options with room
+            score = np.where(free, rng.random(free.shape) + 1.0, 0.0)
+        pick = np.argmax(score, axis=1)
+        chosen = candidates[np.arange(len(edges)), pick]
+        return np.where(free.any(axis=1), chosen, -1)
+
+    """
+    Method to run a batch of replications in lockstep.
+    replications - number of replications to advance together
+    seed         - seed for the batch's random number generator
+    maxTime      - simulated seconds before the batch is cut off
+    return       - LockstepResults of the batch
+    """
+    def run(self, replications, seed=None, maxTime=LOCKSTEP_MAX_TIME):
+        rng = np.random.default_rng(seed)
+        numEdges = len(self.maxCapacity)
+        numCars = len(self.carLotEdge)
+        numExits = len(self.exitList)
+        travelPerSlot = self.carSizeFt / AVERAGE_CAR_SPEED_FTS
+
+        capacity = np.tile(self.maxCapacity, replications)
+        carEdge = np.tile(self.carLotEdge, replications)
+        readyTime = rng.exponential(X_MEAN_PARKING, replications * numCars)
+        exitTime = np.full(replications * numCars, np.nan)
+        carOffset = np.repeat(np.arange(replications) * numEdges, numCars)
+        carReplication = np.repeat(np.arange(replications), numCars)
+        exitCounts = np.zeros((replications, numExits), dtype=np.int64)
+
+        # Blocked cars give up their slot while they wait, as in the event
+        # engine's poll mode, and arrive on their segment again afterwards
+        waiting = np.zeros(replications * numCars, dtype=bool)
+
+        now = 0.0
+        steps = 0
+        onRoad = carEdge != NOT_ON_ROAD
+        while onRoad.any() and now < maxTime:
+            now += self.timeStep
+            steps += 1
+            # Cars back from waiting take their slot again, in ready order, and
+            # cross the segment in the travel time of the room left behind them
+            back = np.nonzero(waiting & (readyTime <= now))[0]
+            if len(back):
+                slot = carOffset[back] + carEdge[back]
+                order = np.lexsort((readyTime[back], slot))
+                back = back[order]
+                slot = slot[order]
+                position = np.arange(len(slot))
+                rank = position - np.maximum.accumulate(
+                    np.where(np.r_[True, slot[1:] != slot[:-1]], position, 0))
+                roomAfter = capacity[slot] - rank - 1
+                np.subtract.at(capacity, slot, 1)
+                readyTime[back] = readyTime[back] + roomAfter * travelPerSlot
+                waiting[back] = False
+            movers = np.nonzero(onRoad & ~waiting & (readyTime <= now))[0]
+            # Slots freed by cars moving on are usable in the same tick, so
+            # keep moving cars until a round lets nobody through
+            for moveRound in range(LOCKSTEP_MAX_ROUNDS):
+                if len(movers) == 0:
+                    break
+                edges = carEdge[movers]
+
+                # Cars at the end of an exit segment leave the network
+                exitIndex = self.exitOfEdge[edges]
+                leaving = exitIndex >= 0
+                if leaving.any():
+                    leavers = movers[leaving]
+                    np.add.at(capacity, carOffset[leavers] + carEdge[leavers],
+                              1)
+                    np.add.at(exitCounts, (carReplication[leavers],
+                                           exitIndex[leaving]), 1)
+                    exitTime[leavers] = now
+                    carEdge[leavers] = NOT_ON_ROAD
+                    movers = movers[~leaving]
+                    edges = edges[~leaving]
+
+                # Choose as if the movers' own slots were already free, since
+                # in the event engine the first of them would leave first
+                leavingSoon = np.bincount(
+                    (carOffset[movers] + edges)[~self.isParkingEdge[edges]],
+                    minlength=len(capacity))
+                wanted = self.chooseNextEdges(edges, capacity + leavingSoon,
+                                              carOffset[movers], rng)
+                stuck = movers[wanted < 0]
+                movers = movers[wanted >= 0]
+                wanted = wanted[wanted >= 0]
+
+                # Let cars into each segment in ready order, up to its room
+                slot = carOffset[movers] + wanted
+                order = np.lexsort((readyTime[movers], slot))
+                movers = movers[order]
+                slot = slot[order]
+                wanted = wanted[order]
+                position = np.arange(len(slot))
+                groupStart = np.r_[True, slot[1:] != slot[:-1]]
+                rank = position - np.maximum.accumulate(
+                    np.where(groupStart, position, 0))
+                roomBefore = capacity[slot]
+                admitted = rank < roomBefore
+                stuck = np.concatenate((stuck, movers[~admitted]))
+                if not admitted.any():
+                    movers = stuck
+                    break
+
+                movers = movers[admitted]
+                slot = slot[admitted]
+                oldEdges = carEdge[movers]
+                releasing = ~self.isParkingEdge[oldEdges]
+                np.add.at(capacity, carOffset[movers[releasing]] +
+                          oldEdges[releasing], 1)
+                np.subtract.at(capacity, slot, 1)
+                # Travel time from the room left right after this car got in
+                roomAfter = roomBefore[admitted] - rank[admitted] - 1
+                readyTime[movers] = now + roomAfter * travelPerSlot
+                carEdge[movers] = wanted[admitted]
+                # Cars on a full segment cross it at once and go again
+                movers = np.concatenate((stuck,
+                                         movers[readyTime[movers] <= now]))
+            # Whoever still could not move gives up its slot and retries after
+            # the waiting time
+            np.add.at(capacity, carOffset[movers] + carEdge[movers], 1)
+            waiting[movers] = True
+            readyTime[movers] = now + MEAN_WAITING_TIME
+            onRoad = carEdge != NOT_ON_ROAD
+
+        exitTimes = exitTime.reshape(replications, numCars)
+        exited = ~np.isnan(exitTimes)
+        carsExited = exited.sum(axis=1)
+        clearanceTime = np.where(exited.all(axis=1),
+                                 np.nanmax(np.where(exited, exitTimes, 0.0),
+                                           axis=1), now)
+        meanExitTime = np.where(carsExited > 0,
+                                np.nansum(exitTimes, axis=1) /
+                                np.maximum(carsExited, 1), np.nan)
+        return LockstepResults(clearanceTime, exitCounts, carsExited,
+                               meanExitTime, numCars - carsExited, steps)
+
+
+"""
+Method to compare the lockstep engine with the event engine on the same
+scenario: clearance time and exits per exit, and replications per second.
+The engines agree when a Welch t-test can not tell their clearance times apart
+at COMPARE_ALPHA and every exit's share of the cars differs by at most
+COMPARE_SHARE_TOLERANCE.  The event engine records no paths, like the lockstep
+engine.
+network         - compiled RoadNetwork
+runMethod       - 'police', 'noWest' or 'random'
+parkingCapacity - fraction of every parking lot that is full
+replications    - number of replications for each engine
+numSimulations  - event cap for the event engine
+seed            - seed for both engines
+return          - dictionary of both engines' statistics, the agreement check
+                  and throughput
+"""
+def compareEngines(network, runMethod, parkingCapacity, replications,
+                   numSimulations=10000000, seed=0):
+    start = time.time()
+    engine = LockstepEngine(network, runMethod, parkingCapacity)
+    lockstep = engine.run(replications, seed)
+    lockstepWall = time.time() - start
+
+    start = time.time()
+    eventTimes = []
+    eventExits = []
+    for replication in range(replications):
+        results = Simulation(network, runMethod, parkingCapacity,
+                             numSimulations, seed=seed + replication,
+                             pathSampleEvery=0).run()
+        eventTimes.append(results.simulationTime)
+        eventExits.append([results.exitCount[exitPoint]
+                           for exitPoint in engine.exitList])
+    eventWall = time.time() - start
+
+    lockstepShares = lockstep.exitCounts.sum(axis=0) / \
+        max(lockstep.exitCounts.sum(), 1)
+    eventShares = np.sum(eventExits, axis=0) / max(np.sum(eventExits), 1)
+    shareDifference = float(np.abs(lockstepShares - eventShares).max())
+    # Identical constant samples have no t statistic; they agree
+    pValue = float(ttest_ind(lockstep.clearanceTime, eventTimes,
+                             equal_var=False).pvalue)
+    if np.isnan(pValue):
+        pValue = 1.0 if np.mean(eventTimes) == \
+            lockstep.clearanceTime.mean() else 0.0
+
+    return {'lockstepClearanceTime': (float(lockstep.clearanceTime.mean()),
+                                      float(lockstep.clearanceTime.std())),
+            'eventClearanceTime': (float(np.mean(eventTimes)),
+                                   float(np.std(eventTimes))),
+            'lockstepExitCounts': lockstep.exitCounts.mean(axis=0).tolist(),
+            'eventExitCounts': np.mean(eventExits, axis=0).tolist(),
+            'lockstepExitShares': lockstepShares.tolist(),
+            'eventExitShares': eventShares.tolist(),
+            'clearanceTimePValue': pValue,
+            'exitShareDifference': shareDifference,
+            'agree': bool(pValue >= COMPARE_ALPHA and
+                          shareDifference <= COMPARE_SHARE_TOLERANCE),
+            'lockstepReplicationsPerSecond': replications / lockstepWall,
+            'eventReplicationsPerSecond': replications / eventWall}
+
+
+def main():
+    args = sys.argv
+    if len(args) != 5:
+        print("Incorrect number of arguments - Format-> python "
+              "lockstepEngine.py world2.csv [police, noWest, random] "
+              "[0.005-1.00] [# of replications]")
+        exit(0)
+
+    network = loadRoadNetwork(args[1])
+    comparison = compareEngines(network, args[2], float(args[3]),
+                                int(args[4]))
+    for key in sorted(comparison):
+        print(key + ":", comparison[key])
+
+
+if __name__ == '__main__':
+    main()
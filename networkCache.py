@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from roadNetwork import RoadNetwork, readFileAndSetUp, readWorldExits
+
+NETWORK_CACHE_VERSION = 2 # bump when the compiled layout changes
+# Arrays of a compiled network, one .npy file each
+NETWORK_ARRAYS = ['nodes', 'edgeStart', 'edgeFrom', 'edgeTo', 'edgeLanes',
+                  'edgeLength', 'maxCapacity', 'lotNodes', 'lotCapacity']
+
+"""
+Method to hash a file's contents, so compiled or cached results are tied to
+one version of a world file.
+fileName - name of file to hash
+return   - hex digest
+"""
+def fileHash(fileName):
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as worldFile:
+        for block in iter(lambda: worldFile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+"""
+Method to give the directory a world file is compiled into, keyed by the
+file's contents and the car size.
+fileName  - world file
+carSizeFt - length of one car in feet
+cacheDir  - directory holding compiled networks
+return    - path of the compiled network directory
+"""
+def compiledNetworkPath(fileName, carSizeFt, cacheDir):
+    stem = os.path.splitext(os.path.basename(fileName))[0]
+    return os.path.join(cacheDir, '%s-%s-%gft-v%d' % (
+        stem, fileHash(fileName)[:16], carSizeFt, NETWORK_CACHE_VERSION))
+
+"""
+Method to write a road network as one .npy file per array plus a small JSON
+header.  Everything is written into a temporary directory that is renamed
+into place, so readers never see a half written network and two processes
+compiling the same file do not clash.
+network - RoadNetwork to write
+path    - compiled network directory to create
+header  - dictionary of extra facts to store (source file, car size, ...);
+          the car size and exits are always stored
+return  - None
+"""
+def saveCompiledNetwork(network, path, header):
+    parent = os.path.dirname(path) or '.'
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    arrays = {'nodes': np.array(network.nodes, dtype=np.int64).reshape(-1, 2),
+              'edgeStart': np.array(network.edgeStart, dtype=np.int64),
+              'edgeFrom': np.array(network.edgeFrom, dtype=np.int64),
+              'edgeTo': np.array(network.edgeTo, dtype=np.int64),
+              'edgeLanes': np.array(network.edgeLanes, dtype=np.int64),
+              'edgeLength': np.array(network.edgeLength, dtype=np.float64),
+              'maxCapacity': np.array(network.maxCapacity, dtype=np.int64),
+              'lotNodes': np.array([network.nodeIds[lot] for lot in
+                                    network.parkingLots], dtype=np.int64),
+              'lotCapacity': np.array(list(network.parkingLots.values()),
+                                      dtype=np.int64)}
+    working = tempfile.mkdtemp(dir=parent)
+    for name in NETWORK_ARRAYS:
+        np.save(os.path.join(working, name + '.npy'), arrays[name])
+    header = dict(header, carSize=network.carSize, exits=network.exits,
+                  version=NETWORK_CACHE_VERSION)
+    with open(os.path.join(working, 'network.json'), 'w') as headerFile:
+        json.dump(header, headerFile)
+    try:
+        os.rename(working, path)
+    except OSError:
+        # Someone else compiled it first; theirs is just as good
+        shutil.rmtree(working)
+
+"""
+Method to load a compiled road network.  The arrays are memory mapped, so
+they are shared with every other process that maps the same files instead of
+being copied; only the coordinate lookups are rebuilt.
+path   - compiled network directory
+return - RoadNetwork
+"""
+def loadCompiledNetwork(path):
+    with open(os.path.join(path, 'network.json'), 'r') as headerFile:
+        header = json.load(headerFile)
+    arrays = dict((name, np.load(os.path.join(path, name + '.npy'),
+                                 mmap_mode='r'))
+                  for name in NETWORK_ARRAYS)
+
+    network = RoadNetwork({}, {}, header['carSize'],
+                          [tuple(exitPoint) for exitPoint in header['exits']])
+    network.nodes = [tuple(node) for node in arrays['nodes'].tolist()]
+    network.nodeIds = dict((node, nodeId)
+                           for nodeId, node in enumerate(network.nodes))
+    for name in ['edgeStart', 'edgeFrom', 'edgeTo', 'edgeLanes', 'edgeLength',
+                 'maxCapacity']:
+        setattr(network, name, arrays[name])
+    network.edgeIndex = dict(
+        ((network.nodes[fromId], network.nodes[toId]), edge)
+        for edge, (fromId, toId) in enumerate(zip(
+            arrays['edgeFrom'].tolist(), arrays['edgeTo'].tolist())))
+    network.parkingLots = dict(
+        (network.nodes[lotId], capacity) for lotId, capacity in
+        zip(arrays['lotNodes'].tolist(), arrays['lotCapacity'].tolist()))
+    network.compiledPath = path
+    return network
+
+"""
+Method to give the compiled road network of a world file, compiling it first
+if this file and car size have not been compiled yet.
+fileName  - world file
+carSizeFt - length of one car in feet
+carSize   - length of one car in graph units
+cacheDir  - directory holding compiled networks
+return    - RoadNetwork
+"""
+def cachedRoadNetwork(fileName, carSizeFt, carSize, cacheDir):
+    path = compiledNetworkPath(fileName, carSizeFt, cacheDir)
+    if not os.path.isdir(path):
+        intersections, parkingLots = readFileAndSetUp(fileName)
+        network = RoadNetwork(intersections, parkingLots, carSize,
+                              readWorldExits(fileName))
+        saveCompiledNetwork(network, path, {'worldFile': fileName,
+                                            'carSizeFt': carSizeFt})
+    return loadCompiledNetwork(path)
@@ -0,0 +1,210 @@
+import sys
+import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from evacSim import loadRoadNetwork, NUM_SIMULATIONS
+from batchRunner import (replicationSeeds, initWorker, runReplication,
+                         summarizeReplications, workerNetworkHandle)
+from networkCache import fileHash
+
+# README experiment plan: 10% to 100% full lots, small to big cars, all
+# three scenarios
+SWEEP_SCENARIOS = ['police', 'noWest', 'random']
+SWEEP_PARKING_CAPACITIES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+SWEEP_CAR_SIZES_FT = [7, 15, 20] # motorcycles/small cars, baseline, SUVs
+SWEEP_REPLICATIONS = 10
+SWEEP_CACHE_DIR = 'sweepCache'
+
+"""
+Method to build the full grid of parameter points for a sweep.
+runMethods       - list of scenarios
+parkingCapacities - list of parking lot fill fractions
+carSizesFt       - list of car lengths in feet
+numSimulations   - maximum number of events per replication
+replications     - number of replications per point
+baseSeed         - seed the replication seeds of every point are derived from
+return           - list of parameter point dictionaries
+"""
+def sweepGrid(runMethods=SWEEP_SCENARIOS,
+              parkingCapacities=SWEEP_PARKING_CAPACITIES,
+              carSizesFt=SWEEP_CAR_SIZES_FT, numSimulations=NUM_SIMULATIONS,
+              replications=SWEEP_REPLICATIONS, baseSeed=0):
+    points = []
+    for carSizeFt, runMethod, parkingCapacity in itertools.product(
+            carSizesFt, runMethods, parkingCapacities):
+        points.append({'runMethod': runMethod,
+                       'parkingCapacity': parkingCapacity,
+                       'carSizeFt': carSizeFt,
+                       'numSimulations': numSimulations,
+                       'replications': replications,
+                       'baseSeed': baseSeed})
+    return points
+
+"""
+Method to give a parameter point with every number as a float, so points that
+only differ in how a number was written (15 from SWEEP_CAR_SIZES_FT, 15.0 from
+the command line) share one cache key.
+value  - parameter point dictionary, or one value of it
+return - normalized copy
+"""
+def normalizePoint(value):
+    if isinstance(value, dict):
+        return dict((name, normalizePoint(item))
+                    for name, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [normalizePoint(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+"""
+Method to give the cache key of one parameter point.
+point     - parameter point dictionary
+worldHash - hash of the world file the point runs on
+return    - hex digest naming the point's cache file
+"""
+def pointKey(point, worldHash):
+    keyText = json.dumps({'world': worldHash, 'point': normalizePoint(point)},
+                         sort_keys=True)
+    return hashlib.sha256(keyText.encode('utf-8')).hexdigest()
+
+"""
+Method to turn (x,y) exit keys into "x,y" strings so results can be stored as
+JSON.
+exitCount - dictionary keyed by (x,y) exit location
+return    - dictionary keyed by "x,y"
+"""
+def exitKeysToText(exitCount):
+    return dict(('%d,%d' % exitPoint, count)
+                for exitPoint, count in exitCount.items())
+
+"""
+Method to load the cached result of a point, if it has already been computed.
+cacheDir - directory of cached results
+key      - cache key of the point
+return   - cached result dictionary or None
+"""
+def loadCachedPoint(cacheDir, key):
+    cacheFile = os.path.join(cacheDir, key + '.json')
+    if not os.path.exists(cacheFile):
+        return None
+    with open(cacheFile, 'r') as resultFile:
+        return json.load(resultFile)
+
+"""
+Method to store the result of a finished point.  The file is written under a
+temporary name and renamed into place, so a crash never leaves a half written
+result that a resumed sweep would trust.
+cacheDir - directory of cached results
+key      - cache key of the point
+result   - result dictionary to store
+return   - None
+"""
+def storeCachedPoint(cacheDir, key, result):
+    cacheFile = os.path.join(cacheDir, key + '.json')
+    with open(cacheFile + '.tmp', 'w') as resultFile:
+        json.dump(result, resultFile)
+    os.replace(cacheFile + '.tmp', cacheFile)
+
+"""
+Method to run a parameter sweep.  Points already in the cache are skipped, so
+re-running a sweep (or resuming one after a crash) only computes new points.
+Pending points are grouped by car size: the world file is compiled once per
+car size and all replications of that group share one process pool.
+mapFile  - world file to sweep over
+points   - list of parameter point dictionaries (see sweepGrid); a point
+           may carry an 'options' dictionary of extra Simulation arguments
+cacheDir - directory of cached results
+workers  - number of worker processes; None for one per core
+return   - list of result dictionaries in the order of points
+"""
+def runSweep(mapFile, points, cacheDir=SWEEP_CACHE_DIR, workers=None):
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    worldHash = fileHash(mapFile)
+    keys = [pointKey(point, worldHash) for point in points]
+    results = [loadCachedPoint(cacheDir, key) for key in keys]
+
+    pendingBySize = {}
+    for index, point in enumerate(points):
+        if results[index] is None:
+            pendingBySize.setdefault(point['carSizeFt'], []).append(index)
+
+    for carSizeFt in pendingBySize:
+        network = loadRoadNetwork(mapFile, carSizeFt)
+        jobs = []
+        jobPoints = []
+        for index in pendingBySize[carSizeFt]:
+            point = points[index]
+            for seed in replicationSeeds(point['baseSeed'],
+                                         point['replications']):
+                jobs.append((point['runMethod'], point['parkingCapacity'],
+                             point['numSimulations'], seed,
+                             point.get('options', {})))
+                jobPoints.append(index)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                 initargs=(workerNetworkHandle(network),)) \
+                as executor:
+            summaries = {}
+            for index, summary in zip(jobPoints,
+                                      executor.map(runReplication, jobs)):
+                summaries.setdefault(index, []).append(summary)
+                # Store a point as soon as its last replication is back
+                if len(summaries[index]) == points[index]['replications']:
+                    finished = summaries.pop(index)
+                    statistics = summarizeReplications(finished)
+                    statistics['meanExitCount'] = exitKeysToText(
+                        statistics['meanExitCount'])
+                    for summary in finished:
+                        summary['exitCount'] = exitKeysToText(
+                            summary['exitCount'])
+                    results[index] = {'point': points[index],
+                                      'statistics': statistics,
+                                      'replications': finished}
+                    storeCachedPoint(cacheDir, keys[index], results[index])
+
+    return results
+
+
+def main():
+    args = sys.argv
+    if len(args) < 2 or len(args) > 9:
+        print("Incorrect number of arguments - Format-> python "
+              "parameterSweep.py world2.csv [scenarios e.g. police,noWest] "
+              "[parking capacities e.g. 0.1,0.5,1.0] [car sizes ft e.g. 7,15] "
+              "[# of simulations] [# of replications] [cache dir] "
+              "[# of workers]")
+        exit(0)
+
+    mapFile = args[1]
+    runMethods = args[2].split(',') if len(args) > 2 else SWEEP_SCENARIOS
+    parkingCapacities = [float(value) for value in args[3].split(',')] \
+        if len(args) > 3 else SWEEP_PARKING_CAPACITIES
+    carSizesFt = [float(value) for value in args[4].split(',')] \
+        if len(args) > 4 else SWEEP_CAR_SIZES_FT
+    numSimulations = int(args[5]) if len(args) > 5 else NUM_SIMULATIONS
+    replications = int(args[6]) if len(args) > 6 else SWEEP_REPLICATIONS
+    cacheDir = args[7] if len(args) > 7 else SWEEP_CACHE_DIR
+    workers = int(args[8]) if len(args) > 8 else None
+
+    points = sweepGrid(runMethods, parkingCapacities, carSizesFt,
+                       numSimulations, replications)
+    results = runSweep(mapFile, points, cacheDir, workers)
+
+    print("scenario,parkingCapacity,carSizeFt,meanSimulationTime,ci95,"
+          "meanCarsExited")
+    for result in results:
+        point = result['point']
+        statistics = result['statistics']
+        print("%s,%g,%g,%g,%g,%g" % (
+            point['runMethod'], point['parkingCapacity'], point['carSizeFt'],
+            statistics['simulationTime']['mean'],
+            statistics['simulationTime']['ci95'],
+            statistics['carsExited']['mean']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import sys
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import t as studentT
+from evacSim import loadRoadNetwork, NUM_SIMULATIONS
+from batchRunner import (replicationSeeds, initWorker, runReplication,
+                         workerNetworkHandle)
+
+CONTROL_METRICS = {'clearanceTime': 'simulationTime',
+                   'evacuationTime': 'meanEvacuationTime'}
+CONTROL_PRECISION = 0.02 # confidence half width as a share of the mean
+CONTROL_CONFIDENCE = 0.95
+CONTROL_MIN_REPLICATIONS = 5 # never stop on fewer replications
+CONTROL_MAX_REPLICATIONS = 200 # stop here even if not precise enough
+# Common random numbers also need route choices drawn per car
+CONTROL_OPTIONS = {'routeDraws': 'perCar'}
+
+
+"""
+Method to give the mean and confidence interval half width of a sample
+(Student t interval).
+values     - list of replication values
+confidence - confidence level of the interval
+return     - (mean, half width); half width is infinity below two values
+"""
+def confidenceInterval(values, confidence=CONTROL_CONFIDENCE):
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return float(values.mean()) if len(values) else float('nan'), \
+            float('inf')
+    halfWidth = studentT.ppf(0.5 + confidence / 2, len(values) - 1) * \
+        values.std(ddof=1) / np.sqrt(len(values))
+    return float(values.mean()), float(halfWidth)
+
+"""
+Method to give the replication seeds of every scenario.  With common random
+numbers every scenario runs replication i on the same seed, so lot departures
+(and, with per car route draws, route choices) are shared and only the
+scenario differs; otherwise every scenario gets its own independent seeds.
+runMethods          - list of scenarios
+count               - replications per scenario
+baseSeed            - seed everything is derived from
+commonRandomNumbers - share seeds between scenarios
+return              - list of seed lists, in runMethods order
+"""
+def scenarioSeeds(runMethods, count, baseSeed, commonRandomNumbers):
+    if commonRandomNumbers:
+        return [replicationSeeds(baseSeed, count)] * len(runMethods)
+    children = np.random.SeedSequence(baseSeed).spawn(len(runMethods))
+    return [replicationSeeds(int(child.generate_state(1)[0]), count)
+            for child in children]
+
+"""
+Method to check whether the replications so far are precise enough.  Every
+scenario's mean needs a confidence half width of at most precision times the
+mean; with more than one scenario, so does the mean difference of every other
+scenario to the first one, paired replication by replication (relative to the
+larger of the two means).
+values     - list of value lists, one per scenario, in replication order
+precision  - largest half width as a share of the mean
+confidence - confidence level of the intervals
+return     - (precise, dictionary of the intervals)
+"""
+def checkPrecision(values, precision, confidence):
+    intervals = {'scenarios': [], 'differences': []}
+    precise = True
+    for scenarioValues in values:
+        mean, halfWidth = confidenceInterval(scenarioValues, confidence)
+        intervals['scenarios'].append((mean, halfWidth))
+        precise = precise and halfWidth <= precision * abs(mean)
+    baseMean = intervals['scenarios'][0][0]
+    for index in range(1, len(values)):
+        mean, halfWidth = confidenceInterval(
+            np.subtract(values[index], values[0]), confidence)
+        intervals['differences'].append((mean, halfWidth))
+        scale = max(abs(baseMean), abs(intervals['scenarios'][index][0]))
+        precise = precise and halfWidth <= precision * scale
+    return precise, intervals
+
+"""
+Method to run replications of one or more scenarios until the confidence
+intervals are tight enough (see checkPrecision), instead of a fixed number of
+replications.  Replications are run in rounds, one per worker and scenario,
+and the intervals checked after every round.  With common random numbers the
+scenarios are compared on the same random numbers, which takes out most of
+the noise in their differences, so comparisons settle in fewer replications.
+network             - compiled RoadNetwork
+runMethods          - list of scenarios, e.g. ['police', 'noWest']
+parkingCapacity     - fraction of every parking lot that is full
+numSimulations      - maximum number of events per replication
+metric              - 'clearanceTime' or 'evacuationTime' (mean time from
+                      leaving the lot to exiting, per car)
+precision           - largest half width as a share of the mean
+confidence          - confidence level of the intervals
+minReplications     - replications before the first check
+maxReplications     - replications after which to stop regardless; at least 1
+baseSeed            - seed the replication seeds are derived from
+commonRandomNumbers - share seeds between scenarios
+workers             - number of worker processes; None for one per core
+options             - dictionary of Simulation keyword arguments; defaults to
+                      CONTROL_OPTIONS
+return              - dictionary with the intervals, whether they converged,
+                      the number of replications per scenario and every
+                      replication summary
+"""
+def runUntilPrecise(network, runMethods, parkingCapacity,
+                    numSimulations=NUM_SIMULATIONS, metric='clearanceTime',
+                    precision=CONTROL_PRECISION, confidence=CONTROL_CONFIDENCE,
+                    minReplications=CONTROL_MIN_REPLICATIONS,
+                    maxReplications=CONTROL_MAX_REPLICATIONS, baseSeed=0,
+                    commonRandomNumbers=True, workers=None, options=None):
+    if maxReplications < 1:
+        raise ValueError("maxReplications has to be at least 1")
+    measure = CONTROL_METRICS[metric]
+    options = CONTROL_OPTIONS if options is None else options
+    seeds = scenarioSeeds(runMethods, maxReplications, baseSeed,
+                          commonRandomNumbers)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    summaries = [[] for runMethod in runMethods]
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=initWorker,
+            initargs=(workerNetworkHandle(network),))
+    else:
+        initWorker(network)
+
+    try:
+        done = 0
+        precise = False
+        while done < maxReplications:
+            roundSize = max(minReplications - done, workers)
+            roundSize = min(roundSize, maxReplications - done)
+            jobs = [(runMethod, parkingCapacity, numSimulations,
+                     seeds[index][replication], options)
+                    for index, runMethod in enumerate(runMethods)
+                    for replication in range(done, done + roundSize)]
+            finished = executor.map(runReplication, jobs) if executor else \
+                map(runReplication, jobs)
+            for number, summary in enumerate(finished):
+                summaries[number // roundSize].append(summary)
+            done += roundSize
+            values = [[summary[measure] for summary in scenarioSummaries]
+                      for scenarioSummaries in summaries]
+            precise, intervals = checkPrecision(values, precision, confidence)
+            if precise:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {'metric': metric,
+            'precision': precision,
+            'confidence': confidence,
+            'commonRandomNumbers': commonRandomNumbers,
+            'converged': precise,
+            'replications': done,
+            'scenarios': dict(
+                (runMethod, {'mean': mean, 'halfWidth': halfWidth})
+                for runMethod, (mean, halfWidth) in
+                zip(runMethods, intervals['scenarios'])),
+            'differences': dict(
+                ('%s-%s' % (runMethod, runMethods[0]),
+                 {'mean': mean, 'halfWidth': halfWidth})
+                for runMethod, (mean, halfWidth) in
+                zip(runMethods[1:], intervals['differences'])),
+            'summaries': dict(zip(runMethods, summaries))}
+
+
+def main():
+    args = sys.argv
+    if len(args) < 4 or len(args) > 9:
+        print("Incorrect number of arguments - Format-> python "
+              "replicationControl.py world2.csv [scenarios, e.g. police,noWest] "
+              "[0.005-1.00] [# of simulations (optional)] [clearanceTime or "
+              "evacuationTime (optional)] [precision (optional)] "
+              "[# of workers (optional)] [independent (optional)]")
+        exit(0)
+
+    runMethods = args[2].split(',')
+    numSimulations = int(args[4]) if len(args) > 4 else NUM_SIMULATIONS
+    metric = args[5] if len(args) > 5 else 'clearanceTime'
+    precision = float(args[6]) if len(args) > 6 else CONTROL_PRECISION
+    workers = int(args[7]) if len(args) > 7 else None
+    commonRandomNumbers = not (len(args) > 8 and args[8] == 'independent')
+
+    network = loadRoadNetwork(args[1])
+    report = runUntilPrecise(network, runMethods, float(args[3]),
+                             numSimulations, metric, precision,
+                             workers=workers,
+                             commonRandomNumbers=commonRandomNumbers)
+    print("Replications per scenario:", report['replications'],
+          "(converged)" if report['converged'] else "(not converged)")
+    for name, interval in list(report['scenarios'].items()) + \
+            list(report['differences'].items()):
+        print("%s %s: %g +/- %g" % (name, metric, interval['mean'],
+                                    interval['halfWidth']))
+
+
+if __name__ == '__main__':
+    main()
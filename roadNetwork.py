@@ -0,0 +1,325 @@
+import math
+from array import array
+from heapq import heappush, heappop
+
+
+"""
+Method to read from the world file and create a basic graph dictionary to pull
+from for creating intersection and parking lot nodes.  There are no one lane
+roads in this model except from exiting a parking lot.
+fileName - name of file to read from
+Return - return intersection dictionary of nodes and incoming queues to node
+with capacities for each queue (number of lanes) and
+parking lots dictionary of nodes with capacties of each.
+Intersection Format -  (89, 81): [((86, 129),1), ((50, 87),2)]
+Parking Lot Format  -  (86, 149): 1200
+"""
+def readFileAndSetUp(fileName):
+    worldFile = open(fileName,'r')
+    worldFile.readline() # Throw Away top line
+
+    intersections_graph = {}
+    parking_nodes = {}
+
+    for line in worldFile:
+        array = line.split(',')
+        typeNode = array[0]
+        nodeFrom = (int(array[1]),int(array[2]))
+        nodeTo = (int(array[3]),int(array[4]))
+        capacity = int(array[5])
+
+        # Street Nodes; lets process these
+        if typeNode == 'Street':
+            # Add queue for NodeTo to NodeFrom
+            if nodeFrom not in intersections_graph:
+                intersections_graph[nodeFrom] = []
+                intersections_graph[nodeFrom].append((nodeTo,capacity))
+            else:
+                intersections_graph[nodeFrom].append((nodeTo,capacity))
+            # Add queue for NodeFrom to NodeTo
+            if nodeTo not in intersections_graph:
+                intersections_graph[nodeTo] = []
+                intersections_graph[nodeTo].append((nodeFrom,capacity))
+            else:
+                intersections_graph[nodeTo].append((nodeFrom,capacity))
+
+
+        # Parking Nodes; lets process these; never allowing a queue to enter
+        # parking lot; use one as a capacity holder for roads coming from
+        # parking lot
+        elif typeNode == 'Parking':
+            if nodeFrom not in intersections_graph:
+                intersections_graph[nodeFrom] = []
+                intersections_graph[nodeFrom].append((nodeTo,1))
+            # Shouldn't ever happen, since there is only one parking lot per
+            # coordinate, but let's check anyways
+            else:
+                intersections_graph[nodeFrom].append((nodeTo, 1))
+
+            parking_nodes[nodeFrom] = (capacity) #, nodeTo)
+
+    worldFile.close()
+
+    return intersections_graph, parking_nodes
+
+
+"""
+Method to read the exits listed in a world file.  An exit is an 'Exit' row whose
+first point is the exit intersection; readFileAndSetUp skips these rows.
+fileName - name of file to read from
+Return - list of (x,y) exits in file order; empty if the file lists none
+"""
+def readWorldExits(fileName):
+    exits = []
+    with open(fileName, 'r') as worldFile:
+        worldFile.readline() # Throw Away top line
+        for line in worldFile:
+            array = line.split(',')
+            if array[0] == 'Exit':
+                exits.append((int(array[1]), int(array[2])))
+    return exits
+
+
+"""
+Method to calculate the capacity for a road between two nodes based on two
+end points and number of lanes of road between those two nodes.
+firstNode  - firstNode to pull from
+secondNode - secondNode to pull from
+numLanes   - number of lanes between firstNode and secondNode
+carSize    - length of one car in graph units
+Return - return capacity of road between the firstNode and secondNode
+"""
+def calculateRoadCapacity(firstNode, secondNode, numLanes, carSize):
+    # Use Euclid distance
+    distance = ((firstNode[0] - secondNode[0])**2 +
+                (firstNode[1] - secondNode[1])**2)**(0.5)
+    numCarsCapacity = (distance * numLanes) // carSize
+
+    return int(numCarsCapacity)
+
+
+"""
+Spatial index over exit locations for nearest exit queries, a KD-tree
+(scipy.spatial.cKDTree), so a query costs about log(# of exits) rather than a
+comparison with every exit.
+exitList - list of (x,y) exit locations
+"""
+class ExitIndex(object):
+    def __init__(self, exitList):
+        from scipy.spatial import cKDTree
+        self.exitList = list(exitList)
+        self.tree = cKDTree(self.exitList)
+
+    """
+    Method to find the nearest exit of many points at once.
+    points - list or array of (x,y) points
+    return - (array of straight line distances, array of exitList indices)
+    """
+    def nearest(self, points):
+        return self.tree.query(points)
+
+
+"""
+Compiled, read-only version of the world graph.  Every intersection and parking
+lot gets an integer node id and every downstream road segment an integer edge
+id.  The edges leaving a node are stored contiguously (CSR layout), so the
+segments downstream of node n are edge ids edgeStart[n] to edgeStart[n+1]-1.
+Maximum capacities live in a flat array indexed by edge id and edgeIndex maps a
+(fromNode, toNode) coordinate pair straight to its edge id.  A simulation keeps
+its own current capacity buffer (see newCapacityBuffer) so a network can be
+shared by any number of runs.
+intersections - intersection dictionary from readFileAndSetUp
+parkingLots   - parking lot dictionary from readFileAndSetUp
+carSize       - length of one car in graph units
+exits         - list of (x,y) exits of the world file (see readWorldExits)
+"""
+class RoadNetwork(object):
+    def __init__(self, intersections, parkingLots, carSize, exits=()):
+        self.carSize = carSize
+        self.exits = list(exits)
+        self.parkingLots = dict(parkingLots)
+        self.nodes = []        # node id -> (x,y)
+        self.nodeIds = {}      # (x,y) -> node id
+        self.edgeStart = array('l')
+        self.edgeFrom = array('l')
+        self.edgeTo = array('l')
+        self.edgeLanes = array('l')
+        self.edgeLength = array('d') # graph units
+        self.maxCapacity = array('l')
+        self.edgeIndex = {}    # ((x,y),(x,y)) -> edge id
+        self._policeRoutes = {} # (exits, routing) -> routing table
+        self._exitDistances = {} # exits -> straight distance per node id
+        self.compiledPath = None # set when loaded from a compiled network
+
+        # Number every node first so downstream ids are known up front
+        for intersectionNode in intersections:
+            self._addNode(intersectionNode)
+            for downstreamNode, numLanes in intersections[intersectionNode]:
+                self._addNode(downstreamNode)
+
+        for nodeId in range(len(self.nodes)):
+            intersectionNode = self.nodes[nodeId]
+            self.edgeStart.append(len(self.edgeTo))
+            for downstreamNode, numLanes in intersections.get(intersectionNode,
+                                                              []):
+                # The world file lists a couple of streets twice; a segment is
+                # one queue no matter how many rows describe it
+                if (intersectionNode, downstreamNode) in self.edgeIndex:
+                    continue
+                self.edgeIndex[(intersectionNode, downstreamNode)] = \
+                    len(self.edgeTo)
+                self.edgeFrom.append(nodeId)
+                self.edgeTo.append(self.nodeIds[downstreamNode])
+                self.edgeLanes.append(numLanes)
+                self.edgeLength.append(math.hypot(
+                    intersectionNode[0] - downstreamNode[0],
+                    intersectionNode[1] - downstreamNode[1]))
+                self.maxCapacity.append(calculateRoadCapacity(
+                    intersectionNode, downstreamNode, numLanes, carSize))
+        self.edgeStart.append(len(self.edgeTo))
+
+    def _addNode(self, node):
+        if node not in self.nodeIds:
+            self.nodeIds[node] = len(self.nodes)
+            self.nodes.append(node)
+
+    """
+    Method to give the range of edge ids for the road segments downstream of a
+    node.
+    node   - (x,y) of the intersection or parking lot
+    return - range of edge ids
+    """
+    def downstreamEdges(self, node):
+        nodeId = self.nodeIds[node]
+        return range(self.edgeStart[nodeId], self.edgeStart[nodeId + 1])
+
+    """
+    Method to create a fresh current capacity buffer with every road empty.
+    return - array of available capacity indexed by edge id
+    """
+    def newCapacityBuffer(self):
+        return array('l', self.maxCapacity)
+
+    def numNodes(self):
+        return len(self.nodes)
+
+    def numEdges(self):
+        return len(self.edgeTo)
+
+    """
+    Method to give the straight line distance from every node to its nearest
+    exit, looked up once per exit list through an ExitIndex and then reused.
+    exitList - list of (x,y) exit locations
+    return   - list of distances indexed by node id
+    """
+    def exitDistances(self, exitList):
+        key = tuple(exitList)
+        if key not in self._exitDistances:
+            distances = ExitIndex(exitList).nearest(self.nodes)[0]
+            self._exitDistances[key] = distances.tolist()
+        return self._exitDistances[key]
+
+    """
+    Method to find the shortest driving distance from every node to its
+    nearest exit along the street graph (multi-source Dijkstra run backwards
+    from the exits over segment lengths).
+    exitList - list of (x,y) exit locations
+    return   - list of distances indexed by node id; infinity if no exit
+    """
+    def distanceToExits(self, exitList):
+        incoming = [[] for node in self.nodes]
+        for edge in range(len(self.edgeTo)):
+            incoming[self.edgeTo[edge]].append(self.edgeFrom[edge])
+
+        distances = [float('infinity')] * len(self.nodes)
+        frontier = []
+        for exitPoint in exitList:
+            if exitPoint in self.nodeIds:
+                distances[self.nodeIds[exitPoint]] = 0.0
+                heappush(frontier, (0.0, self.nodeIds[exitPoint]))
+        while frontier:
+            distance, nodeId = heappop(frontier)
+            if distance > distances[nodeId]:
+                continue
+            for upstreamId in incoming[nodeId]:
+                upstream = self.nodes[upstreamId]
+                node = self.nodes[nodeId]
+                newDistance = distance + math.hypot(upstream[0] - node[0],
+                                                    upstream[1] - node[1])
+                if newDistance < distances[upstreamId]:
+                    distances[upstreamId] = newDistance
+                    heappush(frontier, (newDistance, upstreamId))
+
+        return distances
+
+    """
+    Method to precompute the police next hop table.  For every road segment the
+    segments a car may turn onto (never straight back where it came from) are
+    ranked by how close they get the car to an exit, so at run time the police
+    only have to pick the first ranked segment that still has room.
+    exitList - list of (x,y) exit locations
+    routing  - 'straight' ranks by straight line distance from the next node to
+               the nearest exit; 'network' ranks by driving distance to the
+               nearest exit through the next node
+    return   - list indexed by edge id of tuples of ranked downstream edge ids;
+               tables are built once per exit list and routing and then reused
+    """
+    def policeRoutingTable(self, exitList, routing='straight'):
+        key = (tuple(exitList), routing)
+        if key not in self._policeRoutes:
+            self._policeRoutes[key] = self._buildPoliceRoutingTable(exitList,
+                                                                    routing)
+        return self._policeRoutes[key]
+
+    def _buildPoliceRoutingTable(self, exitList, routing):
+        if routing == 'straight':
+            nodeScore = self.exitDistances(exitList)
+        elif routing == 'network':
+            nodeScore = self.distanceToExits(exitList)
+        else:
+            raise ValueError("routing has to be 'straight' or 'network'")
+
+        routes = []
+        for edge in range(len(self.edgeTo)):
+            fromId = self.edgeFrom[edge]
+            toId = self.edgeTo[edge]
+            candidates = [nextEdge for nextEdge in
+                          range(self.edgeStart[toId], self.edgeStart[toId + 1])
+                          if self.edgeTo[nextEdge] != fromId]
+            if routing == 'straight':
+                score = lambda nextEdge: nodeScore[self.edgeTo[nextEdge]]
+            else:
+                toNode = self.nodes[toId]
+                score = lambda nextEdge: nodeScore[self.edgeTo[nextEdge]] + \
+                    math.hypot(self.nodes[self.edgeTo[nextEdge]][0] - toNode[0],
+                               self.nodes[self.edgeTo[nextEdge]][1] - toNode[1])
+            # Stable sort keeps world file order between equally good options
+            candidates.sort(key=score)
+            routes.append(tuple(candidates))
+
+        return routes
+
+    """
+    Method to list, for every road segment, the segments a car at its end may
+    turn onto under a scenario (police: ranked next hops; noWest: no westward
+    moves outside a small factor; random: any downstream segment).
+    runMethod     - 'police', 'noWest' or 'random'
+    exitList      - list of (x,y) exit locations
+    policeRouting - 'straight' or 'network' ranking for the police scenario
+    return        - list indexed by edge id of lists of edge ids
+    """
+    def scenarioOptions(self, runMethod, exitList, policeRouting='straight'):
+        if runMethod == 'police':
+            return [list(route) for route in
+                    self.policeRoutingTable(exitList, policeRouting)]
+        options = []
+        for edge in range(len(self.edgeTo)):
+            toId = self.edgeTo[edge]
+            downstream = range(self.edgeStart[toId], self.edgeStart[toId + 1])
+            if runMethod == 'noWest':
+                westLimit = self.nodes[toId][0] - 20
+                downstream = [nextEdge for nextEdge in downstream
+                              if self.nodes[self.edgeTo[nextEdge]][0] >=
+                              westLimit]
+            options.append(list(downstream))
+        return options
@@ -0,0 +1,242 @@
+import io
+import os
+import sys
+import zlib
+import pickle
+import random
+import hashlib
+import tempfile
+import numpy as np
+
+CHECKPOINT_EVERY = 1000000 # events between checkpoints of a run
+CHECKPOINT_MAGIC = b'EVACCKPT'
+CHECKPOINT_VERSION = 1 # bump when the saved state changes
+CHECKPOINT_LEVEL = 6 # zlib compression level
+# Simulation attributes rebuilt on restore instead of saved: the per edge
+# tables (see Simulation.buildEdgeTables) and the bound event handlers
+CHECKPOINT_DERIVED = ['options', 'steerOptions', 'exitOfEdge', 'isLotEdge',
+                      'eventHandlers']
+
+
+"""
+Method to fingerprint a road network, so a checkpoint is never restored onto a
+different network.
+network - RoadNetwork
+return  - hex digest
+"""
+def networkFingerprint(network):
+    digest = hashlib.sha256()
+    for name in ['edgeStart', 'edgeTo', 'maxCapacity']:
+        digest.update(np.asarray(getattr(network, name),
+                                 dtype=np.int64).tobytes())
+    digest.update(repr(sorted(network.parkingLots.items())).encode())
+    return digest.hexdigest()
+
+"""
+Method to give the name of a branch's copy of an output file: the branch name
+goes in front of the extension, e.g. run1-cars.csv -> run1-cars-closed.csv.
+fileName - output file of the run being forked
+branch   - branch name
+return   - file name of the branch
+"""
+def branchFileName(fileName, branch):
+    stem, extension = os.path.splitext(fileName)
+    return '%s-%s%s' % (stem, branch, extension)
+
+
+"""
+Pickler of a Simulation's state.  The simulation itself and its road network
+are saved as references (the network is read-only and shared, and is passed
+back in on restore), and an open output file is saved as its name and the
+position written up to, after flushing it.
+"""
+class CheckpointPickler(pickle.Pickler):
+    def __init__(self, outFile, simulation):
+        pickle.Pickler.__init__(self, outFile, pickle.HIGHEST_PROTOCOL)
+        self.simulation = simulation
+
+    def persistent_id(self, obj):
+        if obj is self.simulation:
+            return ('simulation',)
+        if obj is self.simulation.network:
+            return ('network',)
+        if isinstance(obj, io.IOBase):
+            obj.flush()
+            carRecords = self.simulation.carRecords
+            csvFile = carRecords is not None and obj is carRecords.outFile
+            return ('file', obj.name, obj.tell(), csvFile)
+        return None
+
+
+"""
+Unpickler of a Simulation's state, the counterpart of CheckpointPickler.
+Output files are opened again, cut back to the position the checkpoint was
+taken at (dropping whatever the run wrote after it) and appended to from
+there.  An output file can be renamed on the way: the renamed file starts as
+a copy of the original up to that position, so a forked branch gets its own
+files holding the history before the fork.
+inFile     - open checkpoint payload
+simulation - Simulation object being restored into
+network    - RoadNetwork of the run
+rename     - function of an output file name giving the name to continue it
+             under
+"""
+class CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, inFile, simulation, network, rename):
+        pickle.Unpickler.__init__(self, inFile)
+        self.simulation = simulation
+        self.network = network
+        self.rename = rename
+
+    def persistent_load(self, pid):
+        if pid[0] == 'simulation':
+            return self.simulation
+        if pid[0] == 'network':
+            return self.network
+        fileName, position, csvFile = pid[1:]
+        newName = self.rename(fileName)
+        if newName != fileName:
+            with open(fileName, 'rb') as source, open(newName, 'wb') as copy:
+                copy.write(source.read(position))
+        outFile = open(newName, 'r+', newline='' if csvFile else None)
+        outFile.truncate(position)
+        outFile.seek(position)
+        return outFile
+
+    # A run started as "python evacSim.py" saves evacSim's classes (CarState)
+    # under __main__
+    def find_class(self, module, name):
+        if module == '__main__':
+            module = 'evacSim'
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+"""
+Method to save the whole state of a run between two events: event list, road
+capacities, car state, exit counts, random number generator states, lot
+queues, wait lists, recorders and livelock monitor.  The state is pickled,
+zlib compressed and written to a temporary file that is renamed into place,
+so a crash while saving leaves the previous checkpoint intact.
+simulation - Simulation to save, between events
+fileName   - checkpoint file to write
+return     - None
+"""
+def saveCheckpoint(simulation, fileName):
+    if simulation.profiler is not None:
+        raise ValueError("a profiled run can not be checkpointed")
+    state = dict((name, value) for name, value in simulation.__dict__.items()
+                 if name not in CHECKPOINT_DERIVED)
+    payload = io.BytesIO()
+    CheckpointPickler(payload, simulation).dump(state)
+    header = ('%d %s\n' % (CHECKPOINT_VERSION,
+                           networkFingerprint(simulation.network))).encode()
+    directory = os.path.dirname(os.path.abspath(fileName))
+    handle, working = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as checkpointFile:
+        checkpointFile.write(CHECKPOINT_MAGIC + header)
+        checkpointFile.write(zlib.compress(payload.getvalue(),
+                                           CHECKPOINT_LEVEL))
+    os.replace(working, fileName)
+
+"""
+Method to restore a run from a checkpoint.  Calling run() on the result
+carries on from the checkpoint and gives exactly the results (and output
+files) the original run would have.
+fileName - checkpoint file to read
+network  - RoadNetwork the run was on
+rename   - function giving the name to continue an output file under (see
+           CheckpointUnpickler); None keeps the names
+return   - Simulation, ready to run
+"""
+def restoreCheckpoint(fileName, network, rename=None):
+    from evacSim import Simulation
+    with open(fileName, 'rb') as checkpointFile:
+        if checkpointFile.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError("%s is not a checkpoint file" % fileName)
+        version, fingerprint = checkpointFile.readline().decode().split()
+        if int(version) != CHECKPOINT_VERSION:
+            raise ValueError("%s is a version %s checkpoint; this version "
+                             "reads version %d" % (fileName, version,
+                                                   CHECKPOINT_VERSION))
+        if fingerprint != networkFingerprint(network):
+            raise ValueError("%s was saved on a different road network"
+                             % fileName)
+        payload = zlib.decompress(checkpointFile.read())
+
+    simulation = Simulation.__new__(Simulation)
+    state = CheckpointUnpickler(io.BytesIO(payload), simulation, network,
+                                rename or (lambda name: name)).load()
+    simulation.__dict__.update(state)
+    simulation.eventHandlers = (simulation.togo, simulation.arrives,
+                                simulation.leavesLot)
+    simulation.buildEdgeTables()
+    return simulation
+
+"""
+Method to fork a what-if branch off a checkpoint: the run is restored as it
+was at the checkpoint and then changed, so branches share the history up to
+the fork and never replay it.  The branch writes its own output files and
+checkpoints (see branchFileName).
+fileName       - checkpoint file to fork from
+network        - RoadNetwork the run was on
+branch         - branch name, used in the branch's file names
+runMethod      - scenario from the fork on; None keeps the run's
+policeRouting  - police ranking from the fork on; None keeps the run's
+routeSeed      - reseed the route choice stream; None carries on with the
+                 run's stream
+numSimulations - new event cap; None keeps the run's
+return         - Simulation, ready to run
+"""
+def forkCheckpoint(fileName, network, branch, runMethod=None,
+                   policeRouting=None, routeSeed=None, numSimulations=None):
+    simulation = restoreCheckpoint(
+        fileName, network, lambda name: branchFileName(name, branch))
+    if simulation.checkpointFile:
+        simulation.checkpointFile = branchFileName(simulation.checkpointFile,
+                                                   branch)
+    if runMethod is not None:
+        simulation.runMethod = runMethod
+    if policeRouting is not None:
+        simulation.policeRouting = policeRouting
+    if routeSeed is not None:
+        simulation.routeRandom = random.Random(routeSeed)
+        if simulation.routeKey is not None:
+            simulation.routeKey = simulation.routeRandom.getrandbits(64)
+    if numSimulations is not None:
+        simulation.numSimulations = numSimulations
+    simulation.buildEdgeTables()
+    return simulation
+
+
+def main():
+    args = sys.argv
+    if len(args) < 3 or len(args) > 6:
+        print("Incorrect number of arguments - Format-> python "
+              "simCheckpoint.py world2.csv [checkpoint file] [branch name "
+              "(optional)] [police, noWest, random (optional)] "
+              "[route seed (optional)]")
+        exit(0)
+
+    from evacSim import loadRoadNetwork
+    network = loadRoadNetwork(args[1])
+    if len(args) > 3:
+        simulation = forkCheckpoint(
+            args[2], network, args[3],
+            runMethod=args[4] if len(args) > 4 else None,
+            routeSeed=int(args[5]) if len(args) > 5 else None)
+        print("Forked branch", args[3], "at event", simulation.eventCount)
+    else:
+        simulation = restoreCheckpoint(args[2], network)
+        print("Resumed at event", simulation.eventCount)
+    results = simulation.run()
+
+    print("Simulations:", results.eventCount)
+    print("Simulation Time:", results.simulationTime)
+    print("Exit car counts:", results.exitCount)
+    print("Final Road Capacity at Simulation Stop Time:",
+          results.capacityMetrics.last)
+    print("Current cars in global event queue", results.remainingEvents)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import json
+import time
+from collections import Counter
+
+PROFILE_SAMPLE_EVERY = 1000 # events between event list size samples
+PROFILE_TOP_SEGMENTS = 20 # blocking segments listed in a report
+# Simulation methods timed as a phase: phase -> method names
+PROFILE_PHASES = {'setup': ['globalQueue'],
+                  'togo': ['togo'],
+                  'arrives': ['arrives'],
+                  'leavesLot': ['leavesLot'],
+                  'lotRelease': ['releaseNextCar'],
+                  'moveSelection': ['provideListOfPossibleMovesPolice',
+                                    'provideListOfPossibleMovesNoLeft',
+                                    'provideListOfPossibleMovesRedLight',
+                                    'provideListOfPossibleMovesSteered'],
+                  'capacity': ['changeAvailableCapacity', 'departs'],
+                  'travelTime': ['calcTravelTime'],
+                  'schedule': ['schedule'],
+                  'waiting': ['waitForCapacity', 'wakeWaitingCars']}
+
+
+"""
+Opt-in instrumentation of one Simulation run.  Attaching a profiler replaces
+the simulation's hot methods, on that one object only, with wrappers that
+count calls and time them; a Simulation without a profiler runs the original
+methods untouched, so instrumentation costs nothing when it is off.
+Phase times are self times: the time spent inside a nested phase (a togo
+calling moveSelection, say) counts for the nested phase only, so the phases
+and 'loop' (the event loop's own bookkeeping plus the profiler's counting) add
+up to the run's wall time.  The wrappers slow a run down about five times, so
+a profiled run tells where time goes relative to the rest, not how fast an
+unprofiled run is.
+It also counts events by kind, the outcome of every togo (moved, exited or
+blocked), samples the event list size and counts the segments cars were
+blocked by.
+simulation  - Simulation to instrument, before its run
+sampleEvery - events between event list size samples
+"""
+class SimulationProfiler(object):
+    def __init__(self, simulation, sampleEvery=PROFILE_SAMPLE_EVERY):
+        self.simulation = simulation
+        self.sampleEvery = sampleEvery
+        self.clock = time.perf_counter
+        self.seconds = Counter() # phase -> self time
+        self.calls = Counter() # phase -> calls
+        self.nested = [] # time spent in nested phases, per open phase
+        self.eventKinds = Counter()
+        self.outcomes = Counter()
+        self.blockedAt = Counter() # edge id -> blocked togo events at its end
+        self.blockedBy = Counter() # edge id -> blocked togo events it was full
+        self.sizeSamples = [] # (event #, simulation time, event list size)
+        self.maxEventListSize = 0
+        self.popped = 0
+        self.startTime = None
+        self.wallTime = None
+
+        for phase in PROFILE_PHASES:
+            for name in PROFILE_PHASES[phase]:
+                self.wrap(simulation, name, phase)
+        simulation.togo = self.togoOutcome(simulation.togo)
+        self.kindNames = [handler.__name__ for handler in
+                          simulation.eventHandlers]
+        simulation.eventHandlers = tuple(getattr(simulation, name)
+                                         for name in self.kindNames)
+        events = simulation.globalTimeList
+        for name in ['push', 'extend']:
+            self.wrap(events, name, 'eventList')
+        events.pop = self.countPop(self.timed('eventList', events.pop))
+        self.wrap(simulation.capacityMetrics, 'record', 'metrics')
+        if simulation.carRecords is not None:
+            self.wrap(simulation.carRecords, 'record', 'carRecords')
+        setup = simulation.globalQueue
+        def globalQueue():
+            setup()
+            # The path recorder only exists once the cars are set up
+            if simulation.trajectories is not None:
+                self.wrap(simulation.trajectories, 'record', 'trajectories')
+        simulation.globalQueue = globalQueue
+
+    """
+    Method to replace an object's method with a timed wrapper.
+    target - object owning the method
+    name   - method name
+    phase  - phase the method's time counts for
+    return - None
+    """
+    def wrap(self, target, name, phase):
+        setattr(target, name, self.timed(phase, getattr(target, name)))
+
+    """
+    Method to wrap a function so its calls and self time count for a phase.
+    phase    - phase name
+    function - function to wrap
+    return   - wrapped function
+    """
+    def timed(self, phase, function):
+        clock = self.clock
+        nested = self.nested
+        seconds = self.seconds
+        calls = self.calls
+        def wrapper(*args):
+            start = clock()
+            nested.append(0.0)
+            try:
+                return function(*args)
+            finally:
+                elapsed = clock() - start
+                seconds[phase] += elapsed - nested.pop()
+                calls[phase] += 1
+                if nested:
+                    nested[-1] += elapsed
+        return wrapper
+
+    """
+    Method to wrap the event list's pop so it counts events by kind and
+    samples the event list size.
+    pop    - event list pop function
+    return - wrapped function
+    """
+    def countPop(self, pop):
+        events = self.simulation.globalTimeList
+        def wrapper():
+            entry = pop()
+            self.eventKinds[entry[2]] += 1
+            self.popped += 1
+            size = len(events) + 1
+            if size > self.maxEventListSize:
+                self.maxEventListSize = size
+            if (self.popped - 1) % self.sampleEvery == 0:
+                self.sizeSamples.append((self.popped, entry[0], size))
+            return entry
+        return wrapper
+
+    """
+    Method to wrap togo so the outcome of every togo is counted.  A car that
+    is not at an exit and is still on the same segment afterwards was blocked;
+    the segments it was allowed to enter were all full.
+    togo   - togo function
+    return - wrapped function
+    """
+    def togoOutcome(self, togo):
+        simulation = self.simulation
+        def wrapper(car):
+            edge = simulation.cars.edge[car]
+            togo(car)
+            if simulation.exitOfEdge[edge] >= 0:
+                self.outcomes['exited'] += 1
+            elif simulation.cars.edge[car] != edge:
+                self.outcomes['moved'] += 1
+            else:
+                self.outcomes['blocked'] += 1
+                self.blockedAt[edge] += 1
+                for nextEdge in simulation.blockingEdges(edge):
+                    self.blockedBy[nextEdge] += 1
+        return wrapper
+
+    """
+    Method to mark the start of the run.
+    return - None
+    """
+    def start(self):
+        self.startTime = self.clock()
+
+    """
+    Method to mark the end of the run.
+    return - None
+    """
+    def stop(self):
+        self.wallTime = self.clock() - self.startTime
+
+    """
+    Method to list the segments with the highest counts.
+    counts - Counter of edge id -> count
+    return - list of dictionaries, highest count first
+    """
+    def topSegments(self, counts):
+        network = self.simulation.network
+        rows = []
+        for edge, count in counts.most_common(PROFILE_TOP_SEGMENTS):
+            rows.append({'edge': edge,
+                         'from': list(network.nodes[network.edgeFrom[edge]]),
+                         'to': list(network.nodes[network.edgeTo[edge]]),
+                         'count': count,
+                         'maxCapacity': int(network.maxCapacity[edge])})
+        return rows
+
+    """
+    Method to give the profile of the run.
+    return - dictionary report, ready to be saved as JSON
+    """
+    def report(self):
+        phases = dict((phase, {'calls': self.calls[phase],
+                               'seconds': self.seconds[phase]})
+                      for phase in sorted(self.seconds))
+        phases['loop'] = {'calls': 1, 'seconds': self.wallTime -
+                          sum(self.seconds.values())}
+        for phase in phases:
+            phases[phase]['share'] = phases[phase]['seconds'] / self.wallTime \
+                if self.wallTime else 0.0
+        events = dict((self.kindNames[kind], self.eventKinds[kind])
+                      for kind in range(len(self.kindNames)))
+        return {'wallTime': self.wallTime,
+                'events': dict(events, total=self.popped),
+                'togoOutcomes': {'moved': self.outcomes['moved'],
+                                 'exited': self.outcomes['exited'],
+                                 'blocked': self.outcomes['blocked']},
+                'waitMode': self.simulation.waitMode,
+                'phases': phases,
+                'eventList': {'maxSize': self.maxEventListSize,
+                              'sampleEvery': self.sampleEvery,
+                              'samples': [list(sample) for sample in
+                                          self.sizeSamples]},
+                'blockingSegments': self.topSegments(self.blockedBy),
+                'blockedAtSegments': self.topSegments(self.blockedAt)}
+
+    """
+    Method to save the profile of the run as JSON.
+    fileName - file to write
+    return   - None
+    """
+    def save(self, fileName):
+        with open(fileName, 'w') as reportFile:
+            json.dump(self.report(), reportFile, indent=2)
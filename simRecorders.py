@@ -0,0 +1,512 @@
+import csv
+import numpy as np
+from array import array
+
+TRAJECTORY_BLOCK_MOVES = 16 # node slots a car takes from the pool at a time
+TRAJECTORY_CHUNK_BLOCKS = 4096 # blocks added to the pool at a time
+CAPACITY_BUCKET_SECONDS = 1.0 # simulated seconds per capacity sample
+CAPACITY_MAX_BUCKETS = 4096 # capacity samples held in memory; must be even
+CAR_RECORD_CHUNK_ROWS = 10000 # per-car records buffered before a write
+CAR_RECORD_COLUMNS = ['car', 'lotX', 'lotY', 'departureTime', 'exitTime',
+                      'exitX', 'exitY', 'hops']
+
+
+"""
+Method to give the smallest unsigned integer type that can hold ids up to a
+count.
+count  - number of distinct ids
+return - numpy dtype
+"""
+def smallestIdType(count):
+    if count < (1 << 8):
+        return np.uint8
+    if count < (1 << 16):
+        return np.uint16
+    return np.uint32
+
+
+"""
+Compact per-car trajectory store.  Only node ids are kept, in one flat pool of
+fixed size blocks of blockMoves slots: every recorded car owns a block from the
+start (car c's first block is block c / sampleEvery) and takes a new block from
+the end of the pool whenever its current one is full, linked from the one
+before.  Growing the pool adds a chunk of blocks and never copies what is
+already recorded, and no car id is stored per move.  finish() then packs the
+blocks into CSR form, so the nodes car c visited are
+nodes[offsets[c]:offsets[c+1]], and frees them.  Only every sampleEvery-th car
+is recorded.
+numNodes    - number of nodes in the road network
+numCars     - number of cars in the simulation
+sampleEvery - record car ids divisible by this; 1 records every car
+blockMoves  - node slots per block
+chunkBlocks - blocks per pool chunk
+"""
+class TrajectoryRecorder(object):
+    def __init__(self, numNodes, numCars, sampleEvery=1,
+                 blockMoves=TRAJECTORY_BLOCK_MOVES,
+                 chunkBlocks=TRAJECTORY_CHUNK_BLOCKS):
+        self.numCars = numCars
+        self.sampleEvery = sampleEvery
+        self.blockMoves = blockMoves
+        self.chunkBlocks = chunkBlocks
+        self.nodeType = smallestIdType(numNodes)
+        self.moveCount = 0
+        self.offsets = None
+        self.nodes = None
+        self.startPool()
+
+    """
+    Method to start an empty block pool holding the first block of every
+    recorded car.
+    return - None
+    """
+    def startPool(self):
+        numRecorded = len(self.recordedCars())
+        self.nodeChunks = []
+        self.nextChunks = [] # block id following each block, -1 for none
+        self.blockCount = 0
+        while self.blockCount < numRecorded:
+            self.addChunk()
+        self.blockCount = numRecorded
+        self.lastBlock = array('i', range(numRecorded))
+        self.pending = array('i', [0]) * numRecorded # moves not yet packed
+
+    """
+    Method to add one chunk of blocks to the pool.
+    return - None
+    """
+    def addChunk(self):
+        self.nodeChunks.append(
+            array(np.dtype(self.nodeType).char,
+                  [0]) * (self.chunkBlocks * self.blockMoves))
+        self.nextChunks.append(array('i', [-1]) * self.chunkBlocks)
+        self.blockCount += self.chunkBlocks
+
+    """
+    Method to record that a car moved onto a new road segment.
+    carId  - integer id of the car
+    nodeId - node id the car is now heading to
+    return - None
+    """
+    def record(self, carId, nodeId):
+        if carId % self.sampleEvery:
+            return
+        if self.pending is None:
+            self.startPool()
+        index = carId // self.sampleEvery
+        count = self.pending[index]
+        block = self.lastBlock[index]
+        slot = count % self.blockMoves
+        if count and slot == 0:
+            # Current block full: link a new one from the end of the pool
+            newBlock = self.blockCount
+            if newBlock == len(self.nextChunks) * self.chunkBlocks:
+                self.addChunk()
+                self.blockCount = newBlock
+            self.blockCount += 1
+            self.nextChunks[block // self.chunkBlocks][
+                block % self.chunkBlocks] = newBlock
+            self.lastBlock[index] = block = newBlock
+        self.nodeChunks[block // self.chunkBlocks][
+            (block % self.chunkBlocks) * self.blockMoves + slot] = nodeId
+        self.pending[index] = count + 1
+        self.moveCount += 1
+
+    """
+    Method to pack the recorded moves into CSR form and free the block pool.
+    Safe to call more than once; moves recorded after the first call are
+    packed in as well.
+    return - None
+    """
+    def finish(self):
+        if self.pending is None:
+            return
+        blockMoves = self.blockMoves
+        chunkBlocks = self.chunkBlocks
+        chunks = [np.frombuffer(chunk, dtype=self.nodeType)
+                  for chunk in self.nodeChunks]
+        pieces = []
+        counts = np.zeros(self.numCars, dtype=np.int64)
+        for index, carId in enumerate(self.recordedCars()):
+            if self.offsets is not None:
+                pieces.append(self.nodes[self.offsets[carId]:
+                                         self.offsets[carId + 1]])
+            count = self.pending[index]
+            block = index
+            while count > 0:
+                start = (block % chunkBlocks) * blockMoves
+                pieces.append(chunks[block // chunkBlocks][
+                    start:start + min(count, blockMoves)])
+                count -= blockMoves
+                block = self.nextChunks[block // chunkBlocks][
+                    block % chunkBlocks]
+            counts[carId] = self.pending[index]
+        if self.offsets is not None:
+            counts += np.diff(self.offsets)
+        self.nodes = np.concatenate(pieces) if pieces else \
+            np.empty(0, dtype=self.nodeType)
+        self.offsets = np.zeros(self.numCars + 1,
+                                dtype=smallestIdType(len(self.nodes) + 1))
+        self.offsets[1:] = np.cumsum(counts)
+        self.nodeChunks = self.nextChunks = []
+        self.lastBlock = self.pending = None
+
+    """
+    Method to give the node ids one car visited, in order.
+    carId  - integer id of the car
+    return - array of node ids
+    """
+    def carPath(self, carId):
+        if self.pending is not None:
+            self.finish()
+        return self.nodes[self.offsets[carId]:self.offsets[carId + 1]]
+
+    """
+    Method to give the paths of all recorded cars that made at least one move
+    between two nodes, split from the packed arrays in one call.
+    return - (array of car ids, list of node id arrays in the same order)
+    """
+    def paths(self):
+        if self.pending is not None:
+            self.finish()
+        paths = np.split(self.nodes, self.offsets[1:-1].astype(np.int64))
+        cars = np.nonzero(np.diff(self.offsets) > 1)[0]
+        return cars, [paths[car] for car in cars.tolist()]
+
+    """
+    Method to give every recorded move between two consecutive nodes of a
+    path, for all recorded cars at once (the CSR arrays are already in car
+    order, so this is one pass with no per car loop).
+    return - (car ids, from node ids, to node ids) arrays, one entry per move
+    """
+    def segments(self):
+        if self.pending is not None:
+            self.finish()
+        cars = np.repeat(np.arange(self.numCars),
+                         np.diff(self.offsets).astype(np.int64))
+        sameCar = cars[1:] == cars[:-1]
+        return cars[1:][sameCar], self.nodes[:-1][sameCar], \
+            self.nodes[1:][sameCar]
+
+    """
+    Method to list the cars whose trajectories are recorded.
+    return - range of car ids
+    """
+    def recordedCars(self):
+        return range(0, self.numCars, self.sampleEvery)
+
+    """
+    Method to give the memory held by the recorder's buffers.
+    return - number of bytes
+    """
+    def nbytes(self):
+        total = sum(chunk.itemsize * len(chunk)
+                    for chunk in self.nodeChunks + self.nextChunks)
+        if self.pending is not None:
+            total += self.lastBlock.itemsize * len(self.lastBlock) + \
+                self.pending.itemsize * len(self.pending)
+        if self.offsets is not None:
+            total += self.nodes.nbytes + self.offsets.nbytes
+        return total
+
+
+
+"""
+Bounded time series of the free road capacity.  Samples are bucketed by
+simulation time, not by event, and every bucket keeps the minimum, maximum and
+mean of the values recorded in it (a bucket without events holds the value
+left by the one before).  The buckets live in one fixed size NumPy buffer:
+when the run outgrows it the buckets are either streamed to a CSV file and the
+buffer reused, or adjacent buckets are merged and the bucket width doubled.
+Either way memory stays flat however long the run is.
+bucketSeconds - simulated seconds per bucket
+maxBuckets    - buckets held in memory; must be even
+streamFile    - name of a CSV file (time,min,max,mean) to stream buckets to,
+                or None to keep them in memory
+"""
+class CapacityMetrics(object):
+    # Buffer columns
+    MIN, MAX, SUM, COUNT, LAST = range(5)
+
+    def __init__(self, bucketSeconds=CAPACITY_BUCKET_SECONDS,
+                 maxBuckets=CAPACITY_MAX_BUCKETS, streamFile=None):
+        self.bucketSeconds = float(bucketSeconds)
+        self.maxBuckets = maxBuckets
+        self.streamFile = streamFile
+        self.stream = None
+        if streamFile:
+            self.stream = open(streamFile, 'w')
+            self.stream.write("time,min,max,mean\n")
+        self.rows = self.emptyRows()
+        self.windowStart = None # bucket index of the first buffer row
+        self.carry = None # value held going into the first buffer row
+        self.first = None
+        self.last = None
+        # Bucket being filled, kept in plain Python numbers for speed
+        self.openIndex = None
+        self.openEnd = float('-inf')
+        self.openMin = float('inf')
+        self.openMax = float('-inf')
+        self.openSum = 0
+        self.openCount = 0
+
+    """
+    Method to give a buffer of empty buckets.
+    return - float array of shape [maxBuckets, 5]
+    """
+    def emptyRows(self):
+        rows = np.zeros((self.maxBuckets, 5))
+        rows[:, self.MIN] = np.inf
+        rows[:, self.MAX] = -np.inf
+        return rows
+
+    """
+    Method to record the free capacity after an event.
+    time   - simulation time of the event
+    value  - free road capacity after the event
+    return - None
+    """
+    def record(self, time, value):
+        if time >= self.openEnd:
+            self.openBucket(time)
+            if self.first is None:
+                self.first = value
+        if value < self.openMin:
+            self.openMin = value
+        if value > self.openMax:
+            self.openMax = value
+        self.openSum += value
+        self.openCount += 1
+        self.last = value
+
+    """
+    Method to store the bucket being filled and open the one holding a time.
+    time   - simulation time the new bucket has to hold
+    return - None
+    """
+    def openBucket(self, time):
+        self.storeOpenBucket()
+        if self.windowStart is None:
+            self.windowStart = int(time // self.bucketSeconds)
+        while int(time // self.bucketSeconds) - self.windowStart >= \
+                self.maxBuckets:
+            if self.stream:
+                self.flush(self.maxBuckets)
+            else:
+                self.coarsen()
+        self.openIndex = int(time // self.bucketSeconds)
+        self.openEnd = (self.openIndex + 1) * self.bucketSeconds
+
+    """
+    Method to move the bucket being filled into the buffer.
+    return - None
+    """
+    def storeOpenBucket(self):
+        if not self.openCount:
+            return
+        row = self.rows[self.openIndex - self.windowStart]
+        row[self.MIN] = min(row[self.MIN], self.openMin)
+        row[self.MAX] = max(row[self.MAX], self.openMax)
+        row[self.SUM] += self.openSum
+        row[self.COUNT] += self.openCount
+        row[self.LAST] = self.last
+        self.openMin = float('inf')
+        self.openMax = float('-inf')
+        self.openSum = 0
+        self.openCount = 0
+
+    """
+    Method to merge adjacent buckets in pairs, doubling the bucket width and
+    freeing the second half of the buffer.  The bucket being filled is already
+    stored, so it is merged as well.
+    return - None
+    """
+    def coarsen(self):
+        # Pad so every pair lines up with one bucket of the new width
+        rows = self.rows
+        if self.windowStart % 2:
+            rows = np.concatenate((self.emptyRows()[:1], rows))
+            self.windowStart -= 1
+        if len(rows) % 2:
+            rows = np.concatenate((rows, self.emptyRows()[:1]))
+        pairs = rows.reshape(len(rows) // 2, 2, 5)
+        first, second = pairs[:, 0], pairs[:, 1]
+        merged = self.emptyRows()
+        half = merged[:len(pairs)]
+        half[:, self.MIN] = np.minimum(first[:, self.MIN], second[:, self.MIN])
+        half[:, self.MAX] = np.maximum(first[:, self.MAX], second[:, self.MAX])
+        half[:, self.SUM] = first[:, self.SUM] + second[:, self.SUM]
+        half[:, self.COUNT] = first[:, self.COUNT] + second[:, self.COUNT]
+        half[:, self.LAST] = np.where(second[:, self.COUNT] > 0,
+                                      second[:, self.LAST], first[:, self.LAST])
+        self.rows = merged
+        self.bucketSeconds *= 2
+        self.windowStart //= 2
+
+    """
+    Method to turn the first buffer rows into (time, min, max, mean) samples,
+    filling buckets without events with the value held before them.
+    count  - number of rows
+    return - float array of shape [count, 4]
+    """
+    def samples(self, count):
+        rows = self.rows[:count]
+        filled = rows[:, self.COUNT] > 0
+        source = np.maximum.accumulate(np.where(filled, np.arange(count), -1))
+        held = np.where(source >= 0, rows[np.maximum(source, 0), self.LAST],
+                        np.nan if self.carry is None else self.carry)
+        result = np.empty((count, 4))
+        result[:, 0] = (self.windowStart + np.arange(count)) * \
+            self.bucketSeconds
+        result[:, 1] = np.where(filled, rows[:, self.MIN], held)
+        result[:, 2] = np.where(filled, rows[:, self.MAX], held)
+        result[:, 3] = np.where(filled, rows[:, self.SUM] /
+                                np.maximum(rows[:, self.COUNT], 1), held)
+        return result
+
+    """
+    Method to write the first buffer rows to the stream file and drop them.
+    count  - number of rows to write
+    return - None
+    """
+    def flush(self, count):
+        result = self.samples(count)
+        np.savetxt(self.stream, result, fmt='%.6g', delimiter=',')
+        if count:
+            self.carry = result[-1, 1] if self.rows[count - 1, self.COUNT] \
+                == 0 else self.rows[count - 1, self.LAST]
+        self.rows = np.concatenate((self.rows[count:],
+                                    self.emptyRows()[:count]))
+        self.windowStart += count
+
+    """
+    Method to store the last bucket once the run is over; a stream file is
+    written out and closed.
+    return - None
+    """
+    def finish(self):
+        self.storeOpenBucket()
+        if self.stream:
+            self.flush(self.usedBuckets())
+            self.stream.close()
+            self.stream = None
+
+    """
+    Method to give the number of buffer rows in use.
+    return - number of rows
+    """
+    def usedBuckets(self):
+        if self.openIndex is None:
+            return 0
+        return self.openIndex - self.windowStart + 1
+
+    """
+    Method to give the recorded series; streamed series are read back from
+    their file.
+    return - tuple of arrays (bucket start time, min, max, mean)
+    """
+    def series(self):
+        if self.streamFile:
+            if self.stream:
+                self.finish()
+            result = np.loadtxt(self.streamFile, delimiter=',', skiprows=1,
+                                ndmin=2)
+        else:
+            self.storeOpenBucket()
+            result = self.samples(self.usedBuckets())
+        return result[:, 0], result[:, 1], result[:, 2], result[:, 3]
+
+    """
+    Method to give the memory held by the bucket buffer.
+    return - number of bytes
+    """
+    def nbytes(self):
+        return self.rows.nbytes
+
+    # A forked branch reopens the stream under its own name, and the series
+    # is read back from that file
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.stream:
+            self.streamFile = self.stream.name
+
+
+"""
+Streaming per-car results file.  A car's record (lot, departure time, exit
+time, exit used and number of road segments entered) is written as soon as the
+car leaves the network, buffered in chunks of chunkRows rows, so the file can
+hold millions of cars without the records ever being held in memory together.
+Cars still on the network when the run stops are written by finish() with
+empty exit columns.
+fileName  - CSV file to write
+lots      - list of (x,y) parking lots, indexed by lot id
+exitList  - list of (x,y) exit locations, indexed by exit index
+chunkRows - records buffered before they are written
+"""
+class CarRecordWriter(object):
+    def __init__(self, fileName, lots, exitList,
+                 chunkRows=CAR_RECORD_CHUNK_ROWS):
+        self.fileName = fileName
+        self.lots = list(lots)
+        self.exitList = list(exitList)
+        self.chunkRows = chunkRows
+        self.rows = []
+        self.recordCount = 0
+        self.outFile = open(fileName, 'w', newline='')
+        self.writer = csv.writer(self.outFile)
+        self.writer.writerow(CAR_RECORD_COLUMNS)
+
+    # A csv writer can not be pickled; it is made again around the file
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['writer']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # A forked branch reopens the file under its own name
+        self.fileName = self.outFile.name
+        self.writer = csv.writer(self.outFile)
+
+    """
+    Method to record a car that left the network.
+    car           - car id
+    lotId         - lot id of the car, index into lots
+    departureTime - time the car left its lot
+    exitTime      - time the car left the network
+    exitIndex     - exit the car used, index into exitList
+    hops          - road segments the car entered
+    return        - None
+    """
+    def record(self, car, lotId, departureTime, exitTime, exitIndex, hops):
+        lot = self.lots[lotId]
+        exitPoint = self.exitList[exitIndex]
+        self.rows.append((car, lot[0], lot[1], departureTime, exitTime,
+                          exitPoint[0], exitPoint[1], hops))
+        if len(self.rows) >= self.chunkRows:
+            self.flush()
+
+    """
+    Method to write the buffered records.
+    return - None
+    """
+    def flush(self):
+        self.writer.writerows(self.rows)
+        self.recordCount += len(self.rows)
+        self.rows = []
+
+    """
+    Method to write the cars that never left the network and close the file.
+    cars   - CarState of the run
+    return - None
+    """
+    def finish(self, cars):
+        arrays = cars.asNumpy()
+        for car in np.nonzero(np.isnan(arrays['exitTime']))[0].tolist():
+            lot = self.lots[cars.lot[car]]
+            self.rows.append((car, lot[0], lot[1], cars.departureTime[car],
+                              '', '', '', cars.hops[car]))
+            if len(self.rows) >= self.chunkRows:
+                self.flush()
+        self.flush()
+        self.outFile.close()
@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+WORLD_FILE = os.path.join(REPO_DIR, 'world2.csv')
+
+
+@pytest.fixture(scope='session')
+def network():
+    from evacSim import loadRoadNetwork
+    # Parse the world file directly, so tests never write a network cache
+    return loadRoadNetwork(WORLD_FILE, cacheDir=None)
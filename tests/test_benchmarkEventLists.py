@@ -0,0 +1,6 @@
+from benchmarkEventLists import benchmarkEventLists
+
+
+def test_every_set_up_times_the_same_events(network):
+    rows = benchmarkEventLists(network, 'noWest', 0.1, 1000000, repeats=2)
+    assert len(set(events for name, events, seconds, rate in rows)) == 1
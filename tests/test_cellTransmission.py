@@ -0,0 +1,29 @@
+import numpy as np
+from evacSim import Simulation
+from cellTransmission import CellTransmissionModel, FLOW_CLEARED
+
+# The flow model's police clearance time has to be within 10% of the mean of
+# the event engine's
+CLEARANCE_TOLERANCE = 0.1
+EVENT_REPLICATIONS = 5
+
+
+def test_police_clearance_matches_event_engine(network):
+    for parkingCapacity in [0.25, 0.5, 1.0]:
+        eventTimes = [Simulation(network, 'police', parkingCapacity,
+                                 100000000, seed=seed,
+                                 pathSampleEvery=0).run().simulationTime
+                      for seed in range(EVENT_REPLICATIONS)]
+        flow = CellTransmissionModel(network, 'police', parkingCapacity).run()
+        assert flow.vehiclesRemaining < FLOW_CLEARED
+        assert abs(flow.clearanceTime - np.mean(eventTimes)) <= \
+            CLEARANCE_TOLERANCE * np.mean(eventTimes)
+
+
+def test_run_without_steps_leaves_everyone_in_the_lots(network):
+    model = CellTransmissionModel(network, 'police', 0.5)
+    results = model.run(maxTime=0.0)
+    assert results.steps == 0
+    assert results.clearanceTime == 0.0
+    assert results.vehiclesRemaining == model.lotVehicles.sum()
+    assert results.exitCounts.sum() == 0
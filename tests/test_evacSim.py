@@ -0,0 +1,40 @@
+from evacSim import Simulation, edgeUsage
+
+
+def test_edge_usage_counts_every_road_hop(network):
+    for runMethod in ['police', 'noWest', 'random']:
+        results = Simulation(network, runMethod, 0.1, 100000, seed=4,
+                             pathSampleEvery=1).run()
+        usage = edgeUsage(network, results.trajectories)
+        hops = results.cars.asNumpy()['hops']
+        assert usage.sum() == hops.sum()
+        # The first segment of a trip, right after the lot, is counted too
+        lotEdges = set(network.edgeStart[network.nodeIds[lot]]
+                       for lot in network.parkingLots)
+        firstRoads = set()
+        for car in range(results.cars.numCars):
+            if hops[car]:
+                firstRoads.add(network.edgeIndex[tuple(
+                    network.nodes[node] for node in
+                    results.trajectories.carPath(car)[:2])])
+        assert all(usage[edge] > 0 for edge in firstRoads)
+        assert not any(usage[edge] for edge in lotEdges)
+
+
+def test_running_capacity_total_matches_full_scan(network):
+    for runMethod in ['police', 'noWest', 'random']:
+        for waitMode in ['poll', 'wakeup']:
+            simulation = Simulation(network, runMethod, 0.25, seed=5,
+                                    waitMode=waitMode)
+            simulation.globalQueue()
+            assert simulation.availableCapacitySys == \
+                simulation.calcAvailableCapSys()
+            events = simulation.globalTimeList
+            count = 0
+            while events and count < 20000:
+                eventTime, sequence, kind, car = events.pop()
+                simulation.now = eventTime
+                simulation.eventHandlers[kind](car)
+                count += 1
+                assert simulation.availableCapacitySys == \
+                    simulation.calcAvailableCapSys()
@@ -0,0 +1,26 @@
+from evacSim import Simulation, loadRoadNetwork
+from conftest import WORLD_FILE
+
+
+def test_terminate_reports_blocked_cars_as_stuck():
+    # 180 ft cars leave a few segments with no room at all, so the police
+    # scenario blocks for good
+    network = loadRoadNetwork(WORLD_FILE, carSizeFt=180, cacheDir=None)
+    results = Simulation(network, 'police', 0.25, 5000000, seed=1,
+                         livelockPolicy='terminate', pathSampleEvery=0).run()
+    report = results.livelock
+    assert report['stopReason'] == 'stagnation'
+    assert report['stuckCars'] > 0
+    assert report['stuckCars'] + report['carsInLots'] + \
+        results.carsExited() == results.cars.numCars
+    assert results.simulationTime <= 3 * 600.0 + 1
+
+
+def test_watching_does_not_change_results(network):
+    for runMethod in ['police', 'random']:
+        plain = Simulation(network, runMethod, 0.1, 200000, seed=2).run()
+        watched = Simulation(network, runMethod, 0.1, 200000, seed=2,
+                             livelockPolicy='report').run()
+        assert plain.eventCount == watched.eventCount
+        assert plain.exitCount == watched.exitCount
+        assert watched.livelock['stopReason'] in ('drained', 'eventCap')
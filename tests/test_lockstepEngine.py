@@ -0,0 +1,7 @@
+from lockstepEngine import compareEngines
+
+
+def test_engines_agree_at_full_lots(network):
+    for runMethod in ['police', 'noWest']:
+        comparison = compareEngines(network, runMethod, 1.0, 5)
+        assert comparison['agree'], comparison
@@ -0,0 +1,33 @@
+import sys
+import parameterSweep
+from conftest import WORLD_FILE
+from evacSim import NUM_SIMULATIONS
+from networkCache import fileHash
+from parameterSweep import (sweepGrid, pointKey, storeCachedPoint,
+                            SWEEP_SCENARIOS, SWEEP_PARKING_CAPACITIES,
+                            SWEEP_CAR_SIZES_FT, SWEEP_REPLICATIONS)
+
+
+def test_command_line_grid_hits_default_sweep_cache(tmp_path, monkeypatch,
+                                                     capsys):
+    worldHash = fileHash(WORLD_FILE)
+    for point in sweepGrid():
+        storeCachedPoint(str(tmp_path), pointKey(point, worldHash),
+                         {'point': point,
+                          'statistics': {'simulationTime': {'mean': 1.0,
+                                                            'ci95': 0.0},
+                                         'carsExited': {'mean': 1.0}},
+                          'replications': []})
+
+    # A cache miss would compile the world file and run the point
+    def missed(*args):
+        raise AssertionError("cache miss for car size %r" % (args[1],))
+    monkeypatch.setattr(parameterSweep, 'loadRoadNetwork', missed)
+    monkeypatch.setattr(sys, 'argv', [
+        'parameterSweep.py', WORLD_FILE, ','.join(SWEEP_SCENARIOS),
+        ','.join(str(value) for value in SWEEP_PARKING_CAPACITIES),
+        ','.join(str(value) for value in SWEEP_CAR_SIZES_FT),
+        str(NUM_SIMULATIONS), str(SWEEP_REPLICATIONS), str(tmp_path)])
+    parameterSweep.main()
+    rows = capsys.readouterr().out.splitlines()[1:]
+    assert len(rows) == len(sweepGrid())
@@ -0,0 +1,9 @@
+import pytest
+from replicationControl import runUntilPrecise
+
+
+def test_needs_at_least_one_replication(network):
+    for maxReplications in [0, -1]:
+        with pytest.raises(ValueError):
+            runUntilPrecise(network, ['police'], 0.1,
+                            maxReplications=maxReplications, workers=1)
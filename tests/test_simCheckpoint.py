@@ -0,0 +1,61 @@
+import os
+import filecmp
+import numpy as np
+from evacSim import Simulation
+from simCheckpoint import restoreCheckpoint, forkCheckpoint, branchFileName
+
+
+def runWithFiles(network, directory, name, **options):
+    return Simulation(network, 'noWest', 0.25, 400000, seed=7,
+                      carRecordFile=os.path.join(directory, name + '-cars.csv'),
+                      capacityFile=os.path.join(directory, name + '-cap.csv'),
+                      **options)
+
+
+def test_resumed_run_matches_uninterrupted_run(network, tmp_path):
+    directory = str(tmp_path)
+    whole = runWithFiles(network, directory, 'whole').run()
+    checkpointFile = os.path.join(directory, 'run.ckpt')
+    runWithFiles(network, directory, 'run', checkpointFile=checkpointFile,
+                 checkpointEvery=20000).run()
+    simulation = restoreCheckpoint(checkpointFile, network)
+    assert 0 < simulation.eventCount < whole.eventCount
+    resumed = simulation.run()
+
+    assert resumed.eventCount == whole.eventCount
+    assert resumed.simulationTime == whole.simulationTime
+    assert resumed.exitCount == whole.exitCount
+    wholeCars = whole.cars.asNumpy()
+    resumedCars = resumed.cars.asNumpy()
+    for column in wholeCars:
+        assert np.array_equal(wholeCars[column], resumedCars[column],
+                              equal_nan=True)
+    for wholeSeries, resumedSeries in zip(whole.capacityMetrics.series(),
+                                          resumed.capacityMetrics.series()):
+        assert np.array_equal(wholeSeries, resumedSeries)
+    for suffix in ['-cars.csv', '-cap.csv']:
+        assert filecmp.cmp(os.path.join(directory, 'whole' + suffix),
+                           os.path.join(directory, 'run' + suffix),
+                           shallow=False)
+
+
+def test_fork_reads_its_own_capacity_series(network, tmp_path):
+    directory = str(tmp_path)
+    checkpointFile = os.path.join(directory, 'run.ckpt')
+    parent = runWithFiles(network, directory, 'run',
+                          checkpointFile=checkpointFile,
+                          checkpointEvery=20000).run()
+    fork = forkCheckpoint(checkpointFile, network, 'police',
+                          runMethod='police')
+    branch = fork.run()
+
+    capacityFile = branchFileName(os.path.join(directory, 'run-cap.csv'),
+                                  'police')
+    assert fork.capacityMetrics.streamFile == capacityFile
+    assert fork.carRecords.fileName == branchFileName(
+        os.path.join(directory, 'run-cars.csv'), 'police')
+    times = branch.capacityMetrics.series()[0]
+    with open(capacityFile) as capacityRows:
+        assert len(times) == len(capacityRows.readlines()) - 1
+    assert times[-1] <= branch.simulationTime
+    assert len(times) != len(parent.capacityMetrics.series()[0])
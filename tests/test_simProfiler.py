@@ -0,0 +1,11 @@
+from evacSim import Simulation
+
+
+def test_every_move_selection_is_timed(network):
+    # Every togo that does not exit picks its moves once, steered or not
+    results = Simulation(network, 'random', 0.1, 200000, seed=1,
+                         livelockPolicy='steer', profile=True).run()
+    outcomes = results.profile['togoOutcomes']
+    assert results.livelock['steeredCars'] > 0
+    assert results.profile['phases']['moveSelection']['calls'] == \
+        outcomes['moved'] + outcomes['blocked']
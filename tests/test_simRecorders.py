@@ -0,0 +1,29 @@
+import random
+import numpy as np
+from simRecorders import TrajectoryRecorder
+
+
+def test_trajectory_recorder_keeps_every_cars_path():
+    draws = random.Random(3)
+    for numCars, numNodes, sampleEvery in [(500, 80, 1), (500, 70000, 3)]:
+        recorder = TrajectoryRecorder(numNodes, numCars, sampleEvery,
+                                      blockMoves=4, chunkBlocks=16)
+        expected = dict((car, []) for car in recorder.recordedCars())
+        # Moves recorded after finish() are packed in on the next call
+        for batch in range(2):
+            for move in range(20000):
+                car = draws.randrange(numCars)
+                node = draws.randrange(numNodes)
+                recorder.record(car, node)
+                if car in expected:
+                    expected[car].append(node)
+            recorder.finish()
+            for car in range(numCars):
+                assert recorder.carPath(car).tolist() == expected.get(car, [])
+            cars, fromIds, toIds = recorder.segments()
+            assert len(cars) == sum(max(len(path) - 1, 0)
+                                    for path in expected.values())
+        assert recorder.moveCount == sum(len(path)
+                                         for path in expected.values())
+        if numNodes < 256:
+            assert recorder.nodes.dtype == np.uint8
@@ -0,0 +1,11 @@
+import numpy as np
+from worldGenerator import placeExits, WORLD_LAYOUTS
+
+
+def test_boundary_exits_come_in_the_number_asked_for():
+    rng = np.random.default_rng(0)
+    for layout in sorted(WORLD_LAYOUTS):
+        nodes, streets = WORLD_LAYOUTS[layout](400, rng)
+        for numExits in [1, 8, 200, len(nodes)]:
+            exits = placeExits(nodes, numExits, 'boundary', rng)
+            assert len(np.unique(exits)) == numExits
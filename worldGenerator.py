@@ -0,0 +1,281 @@
+import sys
+import math
+import numpy as np
+
+WORLD_SPACING = 50 # graph units between neighbouring intersections
+WORLD_LANE_MIX = {1: 0.3, 2: 0.6, 3: 0.1} # lanes -> share of streets
+WORLD_LOT_DENSITY = 0.2 # share of intersections with a parking lot
+WORLD_LOT_CAPACITY = (50, 500) # smallest and largest parking lot
+WORLD_LOT_OFFSET = 7 # graph units between a lot and its intersection
+WORLD_EXITS = 4
+WORLD_HEADER = "Type,X1,Y1,X2,Y2,Capacity,Comment"
+
+
+"""
+A generated road network, kept as arrays until it is written out.
+nodes       - int array [intersections, 2] of (x,y)
+streets     - int array [streets, 2] of intersection index pairs; every street
+              is two way, like a Street row of the world file
+lanes       - int array of lanes per street
+lots        - int array [lots, 2] of parking lot (x,y)
+lotAccess   - int array of the intersection index each lot drives onto
+lotCapacity - int array of cars per lot
+exits       - list of (x,y) exit intersections
+"""
+class SyntheticWorld(object):
+    def __init__(self, nodes, streets, lanes, lots, lotAccess, lotCapacity,
+                 exits):
+        self.nodes = nodes
+        self.streets = streets
+        self.lanes = lanes
+        self.lots = lots
+        self.lotAccess = lotAccess
+        self.lotCapacity = lotCapacity
+        self.exits = exits
+
+
+"""
+Method to lay out a square grid of intersections.
+numNodes - rough number of intersections
+rng      - numpy Generator
+return   - (nodes, streets)
+"""
+def gridLayout(numNodes, rng):
+    side = max(2, int(round(math.sqrt(numNodes))))
+    rows, cols = np.divmod(np.arange(side * side), side)
+    nodes = np.stack((cols, rows), axis=1) * WORLD_SPACING
+    index = np.arange(side * side).reshape(side, side)
+    across = np.stack((index[:, :-1].ravel(), index[:, 1:].ravel()), axis=1)
+    down = np.stack((index[:-1, :].ravel(), index[1:, :].ravel()), axis=1)
+    return nodes, np.concatenate((across, down))
+
+"""
+Method to lay out a radial city: ring roads around a centre, ring k holding 6k
+intersections so every ring road is about WORLD_SPACING long, and a radial
+road from every intersection to the nearest one on the next ring out.
+numNodes - rough number of intersections
+rng      - numpy Generator
+return   - (nodes, streets)
+"""
+def radialLayout(numNodes, rng):
+    # 1 + 3R(R + 1) intersections within R rings
+    rings = max(1, int(round(math.sqrt(numNodes / 3.0))))
+    perRing = 6 * np.arange(1, rings + 1)
+    ringStart = 1 + np.r_[0, np.cumsum(perRing)[:-1]]
+    ring = np.repeat(np.arange(rings), perRing)
+    position = np.arange(perRing.sum()) - ringStart[ring] + 1
+    angle = position * 2 * math.pi / perRing[ring]
+    radius = (ring + 1) * WORLD_SPACING
+    # Keep coordinates integral like the world file
+    points = np.stack((radius * np.cos(angle), radius * np.sin(angle)), axis=1)
+    nodes = np.concatenate(([[0, 0]], np.round(points))).astype(np.int64)
+    index = np.arange(1, len(nodes))
+    after = np.where(position == perRing[ring] - 1, ringStart[ring], index + 1)
+    ringRoads = np.stack((index, after), axis=1)
+    inner = ring < rings - 1
+    outward = ringStart[np.minimum(ring + 1, rings - 1)] + np.round(
+        position * perRing[np.minimum(ring + 1, rings - 1)] /
+        perRing[ring]).astype(np.int64)
+    radialRoads = np.stack((index[inner], outward[inner]), axis=1)
+    centreRoads = np.stack((np.zeros(6, dtype=np.int64), 1 + np.arange(6)),
+                           axis=1)
+    return nodes, np.concatenate((centreRoads, ringRoads, radialRoads))
+
+"""
+Method to lay out a random planar street network: random intersections joined
+by the edges of their Delaunay triangulation, which never cross and always
+connect every intersection.
+numNodes - number of intersections
+rng      - numpy Generator
+return   - (nodes, streets)
+"""
+def randomLayout(numNodes, rng):
+    from scipy.spatial import Delaunay
+    side = WORLD_SPACING * math.sqrt(numNodes)
+    points = np.round(rng.random((numNodes, 2)) * side).astype(np.int64)
+    # Drop points that round onto the same coordinates
+    key = points[:, 0] * (int(side) + 1) + points[:, 1]
+    nodes = points[np.sort(np.unique(key, return_index=True)[1])]
+    triangles = Delaunay(nodes).simplices
+    pairs = np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]],
+                            triangles[:, [2, 0]]))
+    # Streets shared by two triangles once
+    pairs = np.sort(pairs, axis=1)
+    key = np.unique(pairs[:, 0] * len(nodes) + pairs[:, 1])
+    return nodes, np.stack(np.divmod(key, len(nodes)), axis=1)
+
+WORLD_LAYOUTS = {'grid': gridLayout, 'radial': radialLayout,
+                 'random': randomLayout}
+
+"""
+Method to pick exit intersections.  'boundary' takes the outline of the map
+(the furthest intersection from the centre in each of many thin slices of
+angle) and from it the intersection nearest each of numExits evenly spaced
+directions, so exits are spread around the edge; 'random' takes any
+intersections.
+nodes         - int array of (x,y) intersections
+numExits      - number of exits
+exitPlacement - 'boundary' or 'random'
+rng           - numpy Generator
+return        - array of exit intersection indices
+"""
+def placeExits(nodes, numExits, exitPlacement, rng):
+    if exitPlacement == 'random':
+        return rng.choice(len(nodes), size=numExits, replace=False)
+    if exitPlacement != 'boundary':
+        raise ValueError("exitPlacement has to be 'boundary' or 'random'")
+    offset = nodes - nodes.mean(axis=0)
+    angle = np.arctan2(offset[:, 1], offset[:, 0])
+    distance = np.hypot(offset[:, 0], offset[:, 1])
+    slices = 64 * numExits
+    sliceIndex = ((angle + math.pi) / (2 * math.pi) * slices).astype(np.int64)
+    # Furthest node of every slice: sort by slice, then by distance
+    order = np.lexsort((-distance, sliceIndex))
+    outline = order[np.r_[True, sliceIndex[order][1:] !=
+                          sliceIndex[order][:-1]]]
+    wanted = (np.arange(numExits) + 0.5) * 2 * math.pi / numExits - math.pi
+    gap = np.abs(np.angle(np.exp(1j * (angle[outline][None, :] -
+                                      wanted[:, None]))))
+    exits = outline[gap.argmin(axis=1)]
+    # Two directions can share their nearest outline intersection; the later
+    # one takes its next nearest free one, and once the outline is used up
+    # the furthest free intersections from the centre
+    taken = np.zeros(len(nodes), dtype=bool)
+    spare = np.argsort(-distance, kind='stable')
+    for direction in range(numExits):
+        if taken[exits[direction]]:
+            free = outline[np.argsort(gap[direction], kind='stable')]
+            free = free[~taken[free]]
+            if len(free) == 0:
+                free = spare[~taken[spare]]
+            exits[direction] = free[0]
+        taken[exits[direction]] = True
+    return np.sort(exits)
+
+"""
+Method to generate a synthetic world.
+layout        - 'grid', 'radial' or 'random'
+numNodes      - rough number of intersections (exact for 'random', before
+                dropping duplicate points)
+numExits      - number of exits
+lotDensity    - share of intersections that get a parking lot
+laneMix       - dictionary of lanes to share of streets
+lotCapacity   - (smallest, largest) cars per parking lot
+exitPlacement - 'boundary' or 'random'
+seed          - seed of the layout and every random choice
+return        - SyntheticWorld
+"""
+def generateWorld(layout, numNodes, numExits=WORLD_EXITS,
+                  lotDensity=WORLD_LOT_DENSITY, laneMix=WORLD_LANE_MIX,
+                  lotCapacity=WORLD_LOT_CAPACITY, exitPlacement='boundary',
+                  seed=None):
+    if layout not in WORLD_LAYOUTS:
+        raise ValueError("layout has to be 'grid', 'radial' or 'random'")
+    rng = np.random.default_rng(seed)
+    nodes, streets = WORLD_LAYOUTS[layout](numNodes, rng)
+
+    laneChoices = sorted(laneMix)
+    shares = np.array([laneMix[lanes] for lanes in laneChoices], dtype=float)
+    lanes = rng.choice(laneChoices, size=len(streets), p=shares / shares.sum())
+
+    exitIndex = placeExits(nodes, min(numExits, len(nodes)), exitPlacement,
+                           rng)
+    isExit = np.zeros(len(nodes), dtype=bool)
+    isExit[exitIndex] = True
+    candidates = np.nonzero(~isExit)[0]
+    numLots = min(len(candidates), max(1, int(round(lotDensity * len(nodes)))))
+    lotAccess = np.sort(rng.choice(candidates, size=numLots, replace=False))
+    # A lot sits just off its intersection; step further out on a clash
+    taken = set(map(tuple, nodes.tolist()))
+    lots = []
+    for access in lotAccess.tolist():
+        x, y = nodes[access].tolist()
+        step = WORLD_LOT_OFFSET
+        while (x + step, y + step) in taken:
+            step += 1
+        taken.add((x + step, y + step))
+        lots.append((x + step, y + step))
+    capacities = rng.integers(lotCapacity[0], lotCapacity[1] + 1, size=numLots)
+
+    exits = [tuple(nodes[index].tolist()) for index in np.sort(exitIndex)]
+    return SyntheticWorld(nodes, streets, lanes,
+                          np.array(lots, dtype=np.int64).reshape(-1, 2),
+                          lotAccess, capacities, exits)
+
+"""
+Method to write a synthetic world in the world file format.  Streets and
+parking lots are Street and Parking rows as in world2.csv; every exit is an
+Exit row whose two points are the exit intersection.
+fileName - world file to write
+world    - SyntheticWorld
+return   - None
+"""
+def writeWorldFile(fileName, world):
+    nodes = world.nodes
+    with open(fileName, 'w') as worldFile:
+        worldFile.write(WORLD_HEADER + "\n")
+        ends = np.concatenate((nodes[world.streets[:, 0]],
+                               nodes[world.streets[:, 1]]), axis=1)
+        for (x1, y1, x2, y2), lanes in zip(ends.tolist(), world.lanes.tolist()):
+            worldFile.write("Street,%d,%d,%d,%d,%d,\n" % (x1, y1, x2, y2,
+                                                          lanes))
+        access = nodes[world.lotAccess]
+        for (x1, y1), (x2, y2), capacity in zip(world.lots.tolist(),
+                                                access.tolist(),
+                                                world.lotCapacity.tolist()):
+            worldFile.write("Parking,%d,%d,%d,%d,%d,\n" % (x1, y1, x2, y2,
+                                                           capacity))
+        for number, (x, y) in enumerate(world.exits):
+            worldFile.write("Exit,%d,%d,%d,%d,0,Exit %d\n" % (x, y, x, y,
+                                                              number + 1))
+
+"""
+Method to turn a synthetic world into the intersection and parking lot
+dictionaries of readFileAndSetUp, without going through a file.  Entries come
+in the same order as reading the written world file, so both compile to the
+same network.
+world  - SyntheticWorld
+return - (intersections dictionary, parking lot dictionary)
+"""
+def worldGraph(world):
+    nodes = [tuple(node) for node in world.nodes.tolist()]
+    intersections = {}
+    for (first, second), lanes in zip(world.streets.tolist(),
+                                      world.lanes.tolist()):
+        intersections.setdefault(nodes[first], []).append((nodes[second],
+                                                           lanes))
+        intersections.setdefault(nodes[second], []).append((nodes[first],
+                                                            lanes))
+    parkingLots = {}
+    for lot, access, capacity in zip(world.lots.tolist(),
+                                     world.lotAccess.tolist(),
+                                     world.lotCapacity.tolist()):
+        intersections[tuple(lot)] = [(nodes[access], 1)]
+        parkingLots[tuple(lot)] = capacity
+    return intersections, parkingLots
+
+
+def main():
+    args = sys.argv
+    if len(args) < 4 or len(args) > 7:
+        print("Incorrect number of arguments - Format-> python "
+              "worldGenerator.py [grid, radial, random] [# of intersections] "
+              "[output.csv] [# of exits (optional)] [lot density (optional)] "
+              "[seed (optional)]")
+        exit(0)
+
+    numExits = int(args[4]) if len(args) > 4 else WORLD_EXITS
+    lotDensity = float(args[5]) if len(args) > 5 else WORLD_LOT_DENSITY
+    seed = int(args[6]) if len(args) > 6 else 0
+    world = generateWorld(args[1], int(args[2]), numExits, lotDensity,
+                          seed=seed)
+    writeWorldFile(args[3], world)
+    print("Intersections:", len(world.nodes))
+    print("Streets:", len(world.streets))
+    print("Parking lots:", len(world.lots), "holding",
+          int(world.lotCapacity.sum()), "cars")
+    print("Exits:", world.exits)
+
+
+if __name__ == '__main__':
+    main()